@@ -0,0 +1,116 @@
+"""Per-request cost of the hottest book reads: ORM path vs raw asyncpg.
+
+    DATABASE_URL=postgresql+asyncpg://... PYTHONPATH=src \\
+        python benchmarks/book_reads.py [--requests 2000] [--genre роман]
+
+Runs /books/{book_id} and the catalog list the way app.api_v1.books.services
+did before the raw path (ORM select with load_only, Core select of the
+requested columns) and through app.api_v1.books.raw, each call in its own
+session like a request. Needs PostgreSQL with asyncpg and some books loaded.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import select
+
+from app.api_v1.books import raw
+from app.api_v1.books.crud import (
+    get_book_from_db,
+    get_book_ids_from_db,
+    get_book_rows_from_db,
+)
+from app.api_v1.books.services import book_projection, parse_book_fields
+from app.database.db_helper import engine, new_async_session, uses_asyncpg
+from app.database.models import Book
+from app.schemas.book import BOOK_FIELDS, BookFilterSchema, BookPartialSchema
+from app.utils.serialization import dump_rows
+
+
+async def orm_book(book_id: int, fields: list[str], _) -> BookPartialSchema:
+    async with new_async_session() as session:
+        book = await get_book_from_db(session, book_id, fields)
+        return book_projection(book, fields)
+
+
+async def raw_book(book_id: int, fields: list[str], _) -> BookPartialSchema:
+    async with new_async_session() as session:
+        row = await raw.fetch_book_row(session, book_id, fields)
+        return BookPartialSchema(**dict(zip(fields, row)))
+
+
+async def orm_catalog(_, fields: list[str], filters: BookFilterSchema) -> bytes:
+    async with new_async_session() as session:
+        return dump_rows(fields, await get_book_rows_from_db(session, filters, fields))
+
+
+async def raw_catalog(_, fields: list[str], filters: BookFilterSchema) -> bytes:
+    async with new_async_session() as session:
+        return dump_rows(fields, await raw.fetch_book_rows(session, filters, fields))
+
+
+async def orm_ids(_, __, filters: BookFilterSchema) -> list[int]:
+    async with new_async_session() as session:
+        return await get_book_ids_from_db(session, filters)
+
+
+async def raw_ids(_, __, filters: BookFilterSchema) -> list[int]:
+    async with new_async_session() as session:
+        return await raw.fetch_book_ids(session, filters)
+
+
+async def measure(func, args: tuple, requests: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--book-id", type=int, default=None)
+    parser.add_argument("--genre", default=None, help="catalog filter, ILIKE")
+    parser.add_argument("--fields", default=",".join(BOOK_FIELDS))
+    args = parser.parse_args()
+
+    fields = parse_book_fields(args.fields)
+    filters = BookFilterSchema(genre=args.genre)
+    async with new_async_session() as session:
+        if not uses_asyncpg(session):
+            raise SystemExit("the raw path needs a postgresql+asyncpg DATABASE_URL")
+        book_id = args.book_id or await session.scalar(select(Book.id).limit(1))
+    if book_id is None:
+        raise SystemExit("no books in the database")
+
+    call = (book_id, fields, filters)
+    # прогрев: пул, подготовленные запросы и заодно сверка ответов
+    assert await orm_book(*call) == await raw_book(*call)
+    # без ORDER BY порядок строк не гарантирован, сверяем как множества
+    assert sorted(map(str, json.loads(await orm_catalog(*call)))) == sorted(
+        map(str, json.loads(await raw_catalog(*call)))
+    )
+    assert sorted(await orm_ids(*call)) == sorted(await raw_ids(*call))
+    for name, orm, fast in [
+        ("GET /books/{book_id}", orm_book, raw_book),
+        ("GET /books/?fields=...", orm_catalog, raw_catalog),
+        ("GET /books/ (ids)", orm_ids, raw_ids),
+    ]:
+        orm_time = await measure(orm, call, args.requests, args.repeat)
+        raw_time = await measure(fast, call, args.requests, args.repeat)
+        print(
+            f"{name:24} orm {orm_time / args.requests * 1e6:8.1f} us/req  "
+            f"raw {raw_time / args.requests * 1e6:8.1f} us/req  "
+            f"x{orm_time / raw_time:.2f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""Per-row cost of encoding book lists.
+
+    PYTHONPATH=src python benchmarks/serialization.py [--rows 10000]
+
+Compares the old path (model_validate per ORM row, then FastAPI validating
+the returned list against the return type and encoding it with json.dumps)
+with the fast paths in app.utils.serialization and with joining the
+pre-encoded per-book fragments of app.api_v1.books.fragments.
+"""
+
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from pydantic import TypeAdapter
+
+from app.api_v1.books import fragments
+from app.schemas.book import BOOK_FIELDS, BookGetSchema
+from app.utils.serialization import dump_models, dump_rows
+
+
+def make_rows(count: int) -> list[tuple]:
+    books = [
+        {
+            "id": i,
+            "title": f"Книга {i}",
+            "author": f"Автор {i % 500}",
+            "genre": "Роман",
+            "description": "Лирическая история любви и потерь в Японии 60-х. " * 3,
+            "year": 1900 + i % 120,
+            "price": 100 + i % 900,
+            "times_bought": i % 1000,
+            "times_returned": i % 50,
+            "rating": (i % 50) / 10,
+            "ratings_count": i % 30,
+        }
+        for i in range(count)
+    ]
+    return [tuple(book[field] for field in BOOK_FIELDS) for book in books]
+
+
+def old_path(rows: list[tuple]) -> bytes:
+    # ORM-объекты эмулируем атрибутами, как их видит from_attributes
+    books = [SimpleNamespace(**dict(zip(BOOK_FIELDS, row))) for row in rows]
+    models = [BookGetSchema.model_validate(book) for book in books]
+    # то, что делает FastAPI с возвращённым списком: повторная валидация,
+    # dump в jsonable-структуру и json.dumps в JSONResponse
+    adapter = TypeAdapter(list[BookGetSchema])
+    content = adapter.dump_python(adapter.validate_python(models), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def models_path(rows: list[tuple]) -> bytes:
+    books = [SimpleNamespace(**dict(zip(BOOK_FIELDS, row))) for row in rows]
+    return dump_models(BookGetSchema, books)
+
+
+def rows_path(rows: list[tuple]) -> bytes:
+    return dump_rows(BOOK_FIELDS, rows)
+
+
+def fragments_path(encoded: list[bytes]) -> bytes:
+    return fragments.join(encoded)
+
+
+def measure(func, data: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    encoded = [fragments.encode_row(row) for row in rows]
+    assert json.loads(old_path(rows)) == json.loads(rows_path(rows))
+    assert json.loads(rows_path(rows)) == json.loads(fragments_path(encoded))
+    baseline = None
+    for name, func, data in [
+        ("model_validate + FastAPI encoder", old_path, rows),
+        ("cached TypeAdapter dump_json", models_path, rows),
+        ("orjson from result rows", rows_path, rows),
+        ("join of cached fragments", fragments_path, encoded),
+    ]:
+        elapsed = measure(func, data, args.repeat)
+        baseline = baseline or elapsed
+        print(
+            f"{name:34} {elapsed * 1e3:8.1f} ms  "
+            f"{elapsed / args.rows * 1e6:6.2f} us/row  x{baseline / elapsed:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
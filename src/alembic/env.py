@@ -10,6 +10,7 @@ from alembic import context
 from app.database.base import Base
 from app.database import models
 from app.core import settings
+from app.database.db_helper import engine_options
 
 
 # this is the Alembic Config object, which provides
@@ -72,10 +73,13 @@ async def run_async_migrations() -> None:
 
     """
 
+    # пул миграциям не нужен, но режим PgBouncer и кэш запросов — те же
+    connect_args = engine_options(settings.db_url).get("connect_args", {})
     connectable = async_engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        connect_args=connect_args,
     )
 
     async with connectable.connect() as connection:
@@ -0,0 +1,40 @@
+"""ratings
+
+Revision ID: 3c9a1e5b7d20
+Revises: 7f240f6ff47d
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9a1e5b7d20'
+down_revision: Union[str, None] = '7f240f6ff47d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ratings',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'book_id')
+    )
+    op.create_index(op.f('ix_ratings_book_id'), 'ratings', ['book_id'], unique=False)
+    # существующие книги получают 0 оценок; rating, выставленный админом, остаётся как есть
+    op.add_column('books', sa.Column('ratings_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('books', 'ratings_count')
+    op.drop_index(op.f('ix_ratings_book_id'), table_name='ratings')
+    op.drop_table('ratings')
@@ -0,0 +1,64 @@
+"""missing indexes
+
+Revision ID: 5e2b7c9d4f18
+Revises: 8d4f2b6a9c31
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b7c9d4f18'
+down_revision: Union[str, None] = '8d4f2b6a9c31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    # selectinload(User.user_actions), удаление аккаунта
+    ('ix_user_actions_user_id', 'user_actions', ['user_id']),
+    # покупатели книги и delete_book: PK (user_id, book_id) по book_id не помогает
+    ('ix_user_books_book_id', 'user_books', ['book_id']),
+    # фильтры и фасеты каталога
+    ('ix_books_genre', 'books', ['genre']),
+    ('ix_books_year', 'books', ['year']),
+    ('ix_books_rating', 'books', ['rating']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в таблицу, но не работает внутри транзакции.
+    # Если сборка прервётся, останется невалидный индекс: удалить его
+    # (DROP INDEX CONCURRENTLY) и повторить миграцию.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        # фильтр по жанру — подстрока без учёта регистра (ILIKE), btree тут не помогает
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_genre_trgm ON books "
+            "USING gin (genre gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_genre_trgm")
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
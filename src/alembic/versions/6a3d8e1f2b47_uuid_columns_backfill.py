@@ -0,0 +1,132 @@
+"""uuid columns backfill
+
+Revision ID: 6a3d8e1f2b47
+Revises: 5e2b7c9d4f18
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a3d8e1f2b47'
+down_revision: Union[str, None] = '5e2b7c9d4f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Первая половина перевода идентификаторов на uuid, без долгих блокировок:
+# рядом со строковыми колонками появляются uuid-колонки, триггер заполняет их
+# для новых строк, старые строки заполняются пачками, а уникальные индексы
+# строятся CONCURRENTLY. Приложение всё это время работает со строковыми
+# колонками. Колонки меняются местами в 7b4e9f2a3c58.
+COLUMNS = [
+    ('users', 'user_id'),
+    ('admins', 'admin_id'),
+    ('user_books', 'user_id'),
+    ('user_actions', 'user_id'),
+    ('ratings', 'user_id'),
+]
+# будущие PK и индексы; в 7b4e9f2a3c58 они становятся ограничениями как есть
+INDEXES = [
+    ('users_user_id_uuid_key', 'users', 'user_id_uuid', True),
+    ('admins_admin_id_uuid_key', 'admins', 'admin_id_uuid', True),
+    ('user_books_user_id_uuid_key', 'user_books', 'user_id_uuid, book_id', True),
+    ('ratings_user_id_uuid_key', 'ratings', 'user_id_uuid, book_id', True),
+    ('ix_user_actions_user_id_uuid', 'user_actions', 'user_id_uuid', False),
+]
+# первичные ключи на момент миграции: пачки берутся их диапазонами по индексу
+PRIMARY_KEYS = {
+    'users': 'user_id',
+    'admins': 'admin_id',
+    'user_books': 'user_id, book_id',
+    'user_actions': 'id',
+    'ratings': 'user_id, book_id',
+}
+BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in COLUMNS:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN {column}_uuid uuid")
+        op.execute(
+            f"""
+            CREATE FUNCTION {table}_{column}_uuid_sync() RETURNS trigger AS $$
+            BEGIN
+                NEW.{column}_uuid := NEW.{column}::uuid;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_{column}_uuid_sync "
+            f"BEFORE INSERT OR UPDATE OF {column} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_{column}_uuid_sync()"
+        )
+
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for table, column in COLUMNS:
+            key = PRIMARY_KEYS[table]
+            size = len(key.split(","))
+            after = ", ".join(f":after{i}" for i in range(size))
+            until = ", ".join(f":until{i}" for i in range(size))
+            last = None
+            # каждая пачка — своя короткая транзакция и следующий диапазон ключа:
+            # таблица проходится по индексу один раз, без повторных сканов
+            # в поисках незаполненных строк
+            while True:
+                lower = f"({key}) > ({after})" if last else "TRUE"
+                params = {f"after{i}": value for i, value in enumerate(last or ())}
+                upper = bind.execute(
+                    sa.text(
+                        f"SELECT {key} FROM {table} WHERE {lower} "
+                        f"ORDER BY {key} LIMIT 1 OFFSET :offset"
+                    ),
+                    {**params, "offset": BATCH_SIZE - 1},
+                ).first()
+                condition = lower
+                if upper is not None:
+                    condition += f" AND ({key}) <= ({until})"
+                    params |= {f"until{i}": value for i, value in enumerate(upper)}
+                bind.execute(
+                    sa.text(
+                        f"UPDATE {table} SET {column}_uuid = {column}::uuid "
+                        f"WHERE {condition} AND {column}_uuid IS NULL"
+                    ),
+                    params,
+                )
+                if upper is None:
+                    break
+                last = tuple(upper)
+            # NOT NULL без полного сканирования под эксклюзивной блокировкой:
+            # проверенный CHECK позволяет Postgres пропустить скан при SET NOT NULL.
+            # Добавляется после заполнения: NOT VALID всё равно проверяет
+            # изменяемые строки, и UPDATE незаполненной строки бы упал
+            op.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_uuid_not_null "
+                f"CHECK ({column}_uuid IS NOT NULL) NOT VALID"
+            )
+            op.execute(
+                f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_uuid_not_null"
+            )
+        for name, table, columns, unique in INDEXES:
+            op.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY "
+                f"IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _, _, _ in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    for table, column in COLUMNS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_{column}_uuid_sync ON {table}")
+        op.execute(f"DROP FUNCTION IF EXISTS {table}_{column}_uuid_sync()")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS {column}_uuid")
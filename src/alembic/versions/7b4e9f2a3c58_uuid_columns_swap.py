@@ -0,0 +1,94 @@
+"""uuid columns swap
+
+Revision ID: 7b4e9f2a3c58
+Revises: 6a3d8e1f2b47
+Create Date: 2026-10-19 17:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b4e9f2a3c58'
+down_revision: Union[str, None] = '6a3d8e1f2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Вторая половина: uuid-колонки, заполненные в 6a3d8e1f2b47, занимают место
+# строковых. Таблицы не переписываются, индексы уже построены, поэтому
+# эксклюзивная блокировка держится только на время изменения каталога.
+COLUMNS = [
+    ('users', 'user_id'),
+    ('admins', 'admin_id'),
+    ('user_books', 'user_id'),
+    ('user_actions', 'user_id'),
+    ('ratings', 'user_id'),
+]
+FOREIGN_KEYS = [
+    ('user_books_user_id_fkey', 'user_books', 'ON DELETE CASCADE'),
+    ('user_actions_user_id_fkey', 'user_actions', ''),
+    ('ratings_user_id_fkey', 'ratings', 'ON DELETE CASCADE'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("LOCK TABLE users, admins, user_books, user_actions, ratings")
+    for name, table, _ in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for table, column in COLUMNS:
+        op.execute(f"DROP TRIGGER {table}_{column}_uuid_sync ON {table}")
+        op.execute(f"DROP FUNCTION {table}_{column}_uuid_sync()")
+        # вместе с колонкой уходят старые PK, UNIQUE и ix_user_actions_user_id
+        op.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        op.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_uuid TO {column}")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{column}_uuid_not_null")
+    # отдельный UNIQUE рядом с PK больше не нужен
+    op.execute(
+        "ALTER TABLE users ADD CONSTRAINT users_pkey "
+        "PRIMARY KEY USING INDEX users_user_id_uuid_key"
+    )
+    op.execute(
+        "ALTER TABLE admins ADD CONSTRAINT admins_pkey "
+        "PRIMARY KEY USING INDEX admins_admin_id_uuid_key"
+    )
+    op.execute(
+        "ALTER TABLE user_books ADD CONSTRAINT user_books_pkey "
+        "PRIMARY KEY USING INDEX user_books_user_id_uuid_key"
+    )
+    op.execute(
+        "ALTER TABLE ratings ADD CONSTRAINT ratings_pkey "
+        "PRIMARY KEY USING INDEX ratings_user_id_uuid_key"
+    )
+    op.execute("ALTER INDEX ix_user_actions_user_id_uuid RENAME TO ix_user_actions_user_id")
+    # ключи проверяются после commit, без блокировки записи
+    for name, table, on_delete in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY (user_id) "
+            f"REFERENCES users (user_id) {on_delete} NOT VALID"
+        )
+    with op.get_context().autocommit_block():
+        for name, table, _ in FOREIGN_KEYS:
+            op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # обратно — с переписыванием таблиц: откат не обязан быть онлайн
+    for name, table, _ in FOREIGN_KEYS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for table, column in COLUMNS:
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE varchar USING {column}::text"
+        )
+    op.execute("ALTER TABLE users ADD CONSTRAINT users_user_id_key UNIQUE (user_id)")
+    op.execute("ALTER TABLE admins ADD CONSTRAINT admins_admin_id_key UNIQUE (admin_id)")
+    for name, table, on_delete in FOREIGN_KEYS:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY (user_id) "
+            f"REFERENCES users (user_id) {on_delete}"
+        )
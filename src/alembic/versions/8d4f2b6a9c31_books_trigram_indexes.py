@@ -0,0 +1,41 @@
+"""books trigram indexes
+
+Revision ID: 8d4f2b6a9c31
+Revises: 3c9a1e5b7d20
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4f2b6a9c31'
+down_revision: Union[str, None] = '3c9a1e5b7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY не блокирует запись в books, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        # выражение должно совпадать с trgm_text() в books/crud.py, иначе индекс не используется
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_title_trgm ON books "
+            "USING gin (translate(title, 'Ёё', 'Ее') gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_author_trgm ON books "
+            "USING gin (translate(author, 'Ёё', 'Ее') gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_author_trgm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_books_title_trgm")
@@ -0,0 +1,48 @@
+"""book counter shards
+
+Revision ID: 9c5f0a3b4d69
+Revises: 7b4e9f2a3c58
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c5f0a3b4d69'
+down_revision: Union[str, None] = '7b4e9f2a3c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # PK (book_id, shard) покрывает и выборку шардов книги, и удаление по внешнему ключу
+    op.create_table('book_counter_shards',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.SmallInteger(), nullable=False),
+    sa.Column('times_bought', sa.Integer(), nullable=False),
+    sa.Column('times_returned', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # перенести накопленное, чтобы откат не потерял покупки
+    op.execute(
+        """
+        UPDATE books SET times_bought = books.times_bought + s.bought,
+                         times_returned = books.times_returned + s.returned
+        FROM (
+            SELECT book_id, sum(times_bought) AS bought, sum(times_returned) AS returned
+            FROM book_counter_shards GROUP BY book_id
+        ) s
+        WHERE books.id = s.book_id
+        """
+    )
+    op.drop_table('book_counter_shards')
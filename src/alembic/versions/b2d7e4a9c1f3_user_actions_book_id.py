@@ -0,0 +1,47 @@
+"""user actions book id
+
+Revision ID: b2d7e4a9c1f3
+Revises: 9c5f0a3b4d69
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d7e4a9c1f3'
+down_revision: Union[str, None] = '9c5f0a3b4d69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # книга покупки/возврата для пересборки трендов; старые строки остаются NULL —
+    # тренды смотрят лишь на последние дни, и через окно они перестают быть нужны
+    op.add_column('user_actions', sa.Column('book_id', sa.Integer(), nullable=True))
+    # окно трендов: последние действия по времени
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_actions_timestamp',
+            'user_actions',
+            ['timestamp'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_user_actions_timestamp',
+            table_name='user_actions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('user_actions', 'book_id')
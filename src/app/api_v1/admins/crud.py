@@ -1,6 +1,38 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.database import Admin
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    bindparam,
+    column,
+    delete,
+    exists,
+    insert,
+    select,
+    update,
+    values,
+)
+from app.database import Admin, Book, BookCounterShard, Rating, user_books_table
+from app.database.db_helper import in_ids, is_postgres, uses_asyncpg
+
+
+books_table = Book.__table__
+# ratings_count ведётся только оценками пользователей
+BOOK_IMPORT_COLUMNS = [
+    c.name for c in books_table.c if c.name not in ("id", "ratings_count")
+]
+# поля, которые импорт перезаписывает у уже существующих книг (счётчики не трогаем)
+BOOK_IMPORT_UPDATE_COLUMNS = ["genre", "year", "description", "price"]
+
+BOOK_BULK_CHUNK_SIZE = 1_000
+
+books_import_staging = Table(
+    "books_import_staging",
+    MetaData(),
+    *[Column(name, books_table.c[name].type) for name in BOOK_IMPORT_COLUMNS],
+    prefixes=["TEMPORARY"],
+)
 
 
 async def get_admin_from_db_by_username(
@@ -9,3 +41,127 @@ async def get_admin_from_db_by_username(
 ) -> Admin | None:
     admin = await session.execute(select(Admin).where(Admin.username == username))
     return admin.scalar_one_or_none()
+
+
+async def create_books_import_staging(session: AsyncSession) -> None:
+    connection = await session.connection()
+    await connection.run_sync(books_import_staging.create)
+
+
+async def drop_books_import_staging(session: AsyncSession) -> None:
+    connection = await session.connection()
+    await connection.run_sync(books_import_staging.drop)
+
+
+async def copy_books_to_staging(
+    session: AsyncSession,
+    books: list[dict],
+) -> None:
+    if uses_asyncpg(session):
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            books_import_staging.name,
+            records=[tuple(book[name] for name in BOOK_IMPORT_COLUMNS) for book in books],
+            columns=BOOK_IMPORT_COLUMNS,
+        )
+    else:
+        await session.execute(insert(books_import_staging), books)
+
+
+async def upsert_books_from_staging(session: AsyncSession) -> tuple[int, int]:
+    staging = books_import_staging.c
+    same_book = (books_table.c.title == staging.title) & (
+        books_table.c.author == staging.author
+    )
+    updated = await session.execute(
+        update(books_table)
+        .where(same_book)
+        .values({name: staging[name] for name in BOOK_IMPORT_UPDATE_COLUMNS})
+    )
+    inserted = await session.execute(
+        insert(books_table).from_select(
+            BOOK_IMPORT_COLUMNS,
+            select(*[staging[name] for name in BOOK_IMPORT_COLUMNS]).where(
+                ~exists().where(same_book)
+            ),
+        )
+    )
+    return inserted.rowcount, updated.rowcount
+
+
+async def bulk_update_books(
+    session: AsyncSession,
+    changes: list[dict],
+) -> list[int]:
+    # книги с одинаковым набором изменяемых полей обновляются одним запросом на чанк
+    groups: dict[tuple[str, ...], list[dict]] = {}
+    for change in changes:
+        fields = tuple(sorted(key for key in change if key != "id"))
+        groups.setdefault(fields, []).append(change)
+
+    updated_ids = []
+    for fields, group in groups.items():
+        for start in range(0, len(group), BOOK_BULK_CHUNK_SIZE):
+            chunk = group[start : start + BOOK_BULK_CHUNK_SIZE]
+            ids = [change["id"] for change in chunk]
+            if not fields:
+                result = await session.execute(
+                    select(books_table.c.id).where(in_ids(session, books_table.c.id, ids))
+                )
+            elif is_postgres(session):
+                rows = values(
+                    column("id", Integer),
+                    *[column(field, books_table.c[field].type) for field in fields],
+                    name="changes",
+                ).data([tuple(change[key] for key in ("id", *fields)) for change in chunk])
+                result = await session.execute(
+                    update(books_table)
+                    .where(books_table.c.id == rows.c.id)
+                    .values({field: rows.c[field] for field in fields})
+                    .returning(books_table.c.id)
+                )
+            else:
+                result = await session.execute(
+                    select(books_table.c.id).where(in_ids(session, books_table.c.id, ids))
+                )
+                await session.execute(
+                    update(books_table)
+                    .where(books_table.c.id == bindparam("b_id"))
+                    .values({field: bindparam(f"b_{field}") for field in fields}),
+                    [
+                        {f"b_{key}": value for key, value in change.items()}
+                        for change in chunk
+                    ],
+                )
+            updated_ids += result.scalars().all()
+    return updated_ids
+
+
+async def bulk_delete_books(
+    session: AsyncSession,
+    ids: list[int],
+) -> list[int]:
+    deleted_ids = []
+    for start in range(0, len(ids), BOOK_BULK_CHUNK_SIZE):
+        chunk = ids[start : start + BOOK_BULK_CHUNK_SIZE]
+        await session.execute(
+            delete(user_books_table).where(
+                in_ids(session, user_books_table.c.book_id, chunk)
+            )
+        )
+        await session.execute(
+            delete(Rating).where(in_ids(session, Rating.book_id, chunk))
+        )
+        await session.execute(
+            delete(BookCounterShard).where(
+                in_ids(session, BookCounterShard.book_id, chunk)
+            )
+        )
+        result = await session.execute(
+            delete(books_table)
+            .where(in_ids(session, books_table.c.id, chunk))
+            .returning(books_table.c.id)
+        )
+        deleted_ids += result.scalars().all()
+    return deleted_ids
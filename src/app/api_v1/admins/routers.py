@@ -1,10 +1,16 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends
+from typing import Annotated, Literal
+from fastapi import APIRouter, Depends, File, Query, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api_v1.admins import services
-from app.database import get_session
+from app.database import get_read_session, get_session
 from app.utils.jwt_funcs import get_current_auth_admin
+from app.utils.serialization import (
+    BodyEncodingDep,
+    EncodedResponse,
+    NegotiatedResponse,
+    NegotiatedRoute,
+)
 
 from fastapi_cache.decorator import cache
 
@@ -16,12 +22,21 @@ from app.schemas.admin import (
     AddBookResponseSchema,
     EditBookResponseSchema,
     DeleteBookResponseSchema,
+    BookImportResponseSchema,
+    BookBulkEditSchema,
+    BookBulkDeleteSchema,
+    BulkEditBooksResponseSchema,
+    BulkDeleteBooksResponseSchema,
+    SlowQuerySchema,
+    SQLRouteStatsSchema,
 )
 from app.schemas.book import BookAddSchema, BookSchema, BookEditSchema, BookGetSchema
 
 router = APIRouter(
     prefix="/admin",
     tags=["Admin"],
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse,
 )
 
 
@@ -34,18 +49,20 @@ async def sign_up(
 
 
 @cache(expire=60)
-@router.get("/users")
+@router.get("/users", response_model=list[AdminGetUserSchema])
 async def get_all_users(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
     admin_verifier: AdminSchema = Depends(get_current_auth_admin),
-) -> list[AdminGetUserSchema]:
-    return await services.get_all_users(session, admin_verifier)
+) -> EncodedResponse:
+    body = await services.get_all_users(session, admin_verifier, encoding)
+    return EncodedResponse(body, encoding)
 
 
 @cache(expire=60)
 @router.get("/users/{user_id}")
 async def get_user_by_id(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
     user_id: str,
     admin_verifier: AdminSchema = Depends(get_current_auth_admin),
 ) -> AdminGetUserSchema:
@@ -55,12 +72,27 @@ async def get_user_by_id(
 @cache(expire=60)
 @router.get("/admins")
 async def get_all_admins(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
     admin_verifier: AdminSchema = Depends(get_current_auth_admin),
 ) -> list[AdminGetSchema]:
     return await services.get_all_admins(session, admin_verifier)
 
 
+@router.get("/sql-stats")
+async def get_sql_stats(
+    admin_verifier: AdminSchema = Depends(get_current_auth_admin),
+) -> list[SQLRouteStatsSchema]:
+    return services.get_sql_stats(admin_verifier)
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+    admin_verifier: AdminSchema = Depends(get_current_auth_admin),
+) -> list[SlowQuerySchema]:
+    return services.get_slow_queries(admin_verifier, limit)
+
+
 @router.post("/books", response_model=AddBookResponseSchema)
 async def add_book(
     session: Annotated[AsyncSession, Depends(get_session)],
@@ -70,6 +102,34 @@ async def add_book(
     return await services.add_book(session, data, admin_verifier)
 
 
+@router.post("/books/import", response_model=BookImportResponseSchema)
+async def import_books(
+    session: Annotated[AsyncSession, Depends(get_session)],
+    file: UploadFile = File(),
+    fmt: Literal["csv", "ndjson"] | None = None,
+    admin_verifier: AdminSchema = Depends(get_current_auth_admin),
+) -> BookImportResponseSchema:
+    return await services.import_books(session, file, fmt, admin_verifier)
+
+
+@router.patch("/books/bulk", response_model=BulkEditBooksResponseSchema)
+async def bulk_edit_books(
+    session: Annotated[AsyncSession, Depends(get_session)],
+    data: BookBulkEditSchema,
+    admin_verifier: AdminSchema = Depends(get_current_auth_admin),
+) -> BulkEditBooksResponseSchema:
+    return await services.bulk_edit_books(session, data, admin_verifier)
+
+
+@router.delete("/books/bulk", response_model=BulkDeleteBooksResponseSchema)
+async def bulk_delete_books(
+    session: Annotated[AsyncSession, Depends(get_session)],
+    data: BookBulkDeleteSchema,
+    admin_verifier: AdminSchema = Depends(get_current_auth_admin),
+) -> BulkDeleteBooksResponseSchema:
+    return await services.bulk_delete_books(session, data, admin_verifier)
+
+
 @router.put("/books/{book_id}", response_model=EditBookResponseSchema)
 async def edit_book(
     session: Annotated[AsyncSession, Depends(get_session)],
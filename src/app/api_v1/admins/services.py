@@ -1,12 +1,26 @@
-from fastapi import HTTPException, status
+import asyncio
+import time
+import uuid
+from collections.abc import Iterator
+
+from fastapi import HTTPException, UploadFile, status
 from sqlalchemy import select, delete
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.api_v1.books.crud import get_book_from_db
-from app.database import user_books_table
-from app.database.models import Book, User, Admin
+from app.api_v1.admins import crud
+from app.api_v1.books import (
+    fragments,
+    fuzzy,
+    leaderboard,
+    recommendations,
+    similarity,
+    suggest,
+)
+from app.api_v1.books.crud import discard_book_counter_shards, get_book_from_db
+from app.database import instrumentation, user_books_table
+from app.database.models import Book, User, Admin, Rating
 from app.schemas.admin import (
     AdminSignupSchema,
     AdminGetSchema,
@@ -15,10 +29,63 @@ from app.schemas.admin import (
     AddBookResponseSchema,
     EditBookResponseSchema,
     DeleteBookResponseSchema,
+    BookImportErrorSchema,
+    BookImportResponseSchema,
+    BookBulkEditSchema,
+    BookBulkDeleteSchema,
+    BulkEditBooksResponseSchema,
+    BulkDeleteBooksResponseSchema,
+    SlowQuerySchema,
+    SQLRouteStatsSchema,
 )
 from app.schemas.book import BookAddSchema, BookSchema, BookEditSchema, BookGetSchema
 
+from app.utils.cache import (
+    BOOK_FACETS_CACHE_NAMESPACE,
+    BOOK_RATINGS_CACHE_NAMESPACE,
+    cache_bump,
+    cache_clear,
+    cache_delete,
+)
+from app.utils.book_import import (
+    ImportFileError,
+    RowError,
+    detect_format,
+    iter_batches,
+    parse_next_batch,
+    read_book_rows,
+)
 from app.utils.jwt_utils import hash_password
+from app.utils.serialization import JSON_ENCODING, BodyEncoding, dump_models
+
+BOOK_IMPORT_BATCH_SIZE = 5_000
+BOOK_IMPORT_MAX_REPORTED_ERRORS = 1_000
+# заданное админом значение счётчика отменяет ещё не перенесённые покупки
+BOOK_COUNTER_FIELDS = {"times_bought", "times_returned"}
+
+
+async def invalidate_book_indexes() -> None:
+    # индексы по тексту книг пересоберутся: сходство при следующем запросе,
+    # подсказки и нечёткий поиск — в фоне и во всех воркерах
+    similarity.invalidate()
+    await suggest.invalidate()
+    await fuzzy.invalidate()
+
+
+async def update_book_indexes(book: Book, changed: set[str]) -> None:
+    # одна книга применяется к индексам на месте, без полной пересборки
+    if changed & set(similarity.SIMILARITY_FIELDS):
+        await similarity.update_book(book)
+    if changed & set(suggest.SUGGEST_FIELDS):
+        await suggest.update_book(book)
+    if changed & set(fuzzy.FUZZY_FIELDS):
+        await fuzzy.invalidate()
+
+
+async def remove_book_from_indexes(book_id: int) -> None:
+    await similarity.remove_book(book_id)
+    await suggest.remove_book(book_id)
+    await fuzzy.invalidate()
 
 
 async def sign_up(
@@ -31,7 +98,6 @@ async def sign_up(
         admin = Admin(**admin_data_dict)
         session.add(admin)
         await session.commit()
-        await session.refresh(admin)
         return AdminGetSchema.model_validate(admin)
     except IntegrityError:
         raise HTTPException(
@@ -42,14 +108,16 @@ async def sign_up(
 async def get_all_users(
     session: AsyncSession,
     admin_verifier: AdminSchema,
-) -> list[AdminGetUserSchema]:
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    """Returns the encoded list; routers send it as is."""
     query = await session.execute(
         select(User)
         .options(selectinload(User.bought_books))
         .options(selectinload(User.user_actions))
     )
     users = query.scalars().all()
-    return [AdminGetUserSchema.model_validate(user) for user in users]
+    return dump_models(AdminGetUserSchema, users, encoding)
 
 
 async def get_user_by_id(
@@ -57,6 +125,13 @@ async def get_user_by_id(
     user_id: str,
     admin_verifier: AdminSchema,
 ) -> AdminGetUserSchema:
+    try:
+        # колонка uuid: Postgres не примет строку другого вида
+        uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
     query = await session.execute(
         select(User)
         .where(User.user_id == user_id)
@@ -84,6 +159,34 @@ async def get_all_admins(
     return [AdminGetSchema.model_validate(admin) for admin in admins]
 
 
+def get_sql_stats(admin_verifier: AdminSchema) -> list[SQLRouteStatsSchema]:
+    # самые нагружающие базу эндпоинты — первыми
+    stats = sorted(
+        instrumentation.route_stats.items(),
+        key=lambda item: item[1].db_time,
+        reverse=True,
+    )
+    return [
+        SQLRouteStatsSchema(
+            route=route,
+            requests=route_stats.requests,
+            statements=route_stats.statements,
+            avg_statements=route_stats.statements / route_stats.requests,
+            max_statements=route_stats.max_statements,
+            rows=route_stats.rows,
+            db_time_ms=route_stats.db_time * 1000,
+            avg_db_time_ms=route_stats.db_time * 1000 / route_stats.requests,
+            n_plus_one=route_stats.n_plus_one,
+        )
+        for route, route_stats in stats
+    ]
+
+
+def get_slow_queries(admin_verifier: AdminSchema, limit: int) -> list[SlowQuerySchema]:
+    entries = list(instrumentation.slow_queries.entries)[-limit:]
+    return [SlowQuerySchema.model_validate(entry) for entry in reversed(entries)]
+
+
 async def add_book(
     session: AsyncSession,
     data: BookAddSchema,
@@ -93,7 +196,8 @@ async def add_book(
     book = Book(**book_data_dict)
     session.add(book)
     await session.commit()
-    await session.refresh(book)
+    await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+    await update_book_indexes(book, set(book_data_dict))
     return AddBookResponseSchema(
         message="Successfully added book",
         book=BookGetSchema.model_validate(book),
@@ -113,10 +217,16 @@ async def edit_book(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Such book doesn't appear to exist",
             )
-        for key, value in data.model_dump(exclude_none=True).items():
+        changes = data.model_dump(exclude_none=True)
+        for key, value in changes.items():
             setattr(book_from_db, key, value)
+        if changes.keys() & BOOK_COUNTER_FIELDS:
+            await discard_book_counter_shards(session, [book_id])
         await session.commit()
-        await session.refresh(book_from_db)
+        await fragments.discard([book_id])
+        await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, [book_id])
+        await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+        await update_book_indexes(book_from_db, set(changes))
 
         return EditBookResponseSchema(
             message="Successfully updated book",
@@ -139,9 +249,161 @@ async def delete_book(
     await session.execute(
         delete(user_books_table).where(user_books_table.c.book_id == book_id)
     )
+    await session.execute(delete(Rating).where(Rating.book_id == book_id))
+    await discard_book_counter_shards(session, [book_id])
     await session.execute(delete(Book).where(Book.id == book_id))
     await session.commit()
+    await fragments.discard([book_id])
+    await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, [book_id])
+    await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+    leaderboard.discard_book(book_id)
+    recommendations.discard_book(book_id)
+    await remove_book_from_indexes(book_id)
     return DeleteBookResponseSchema(
         message="Successfully deleted book",
         book=BookGetSchema.model_validate(deleted_book),
     )
+
+
+async def bulk_edit_books(
+    session: AsyncSession,
+    data: BookBulkEditSchema,
+    admin_verifier: AdminSchema,
+) -> BulkEditBooksResponseSchema:
+    # при повторе id побеждает последнее изменение
+    changes = {book.id: book.model_dump(exclude_none=True) for book in data.books}
+    try:
+        updated_ids = await crud.bulk_update_books(session, list(changes.values()))
+        counted_ids = [
+            book_id
+            for book_id, change in changes.items()
+            if change.keys() & BOOK_COUNTER_FIELDS
+        ]
+        if counted_ids:
+            await discard_book_counter_shards(session, counted_ids)
+        await session.commit()
+        await fragments.discard(updated_ids)
+        await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, updated_ids)
+        if updated_ids:
+            await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+            await invalidate_book_indexes()
+    except SQLAlchemyError as e:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+    return BulkEditBooksResponseSchema(
+        message="Successfully updated books",
+        requested=len(changes),
+        updated=len(updated_ids),
+        missing_ids=sorted(changes.keys() - set(updated_ids)),
+    )
+
+
+async def bulk_delete_books(
+    session: AsyncSession,
+    data: BookBulkDeleteSchema,
+    admin_verifier: AdminSchema,
+) -> BulkDeleteBooksResponseSchema:
+    ids = list(dict.fromkeys(data.ids))
+    try:
+        deleted_ids = await crud.bulk_delete_books(session, ids)
+        await session.commit()
+        await fragments.discard(deleted_ids)
+        await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, deleted_ids)
+        for book_id in deleted_ids:
+            leaderboard.discard_book(book_id)
+            recommendations.discard_book(book_id)
+        if deleted_ids:
+            await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+            await invalidate_book_indexes()
+    except SQLAlchemyError as e:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+    return BulkDeleteBooksResponseSchema(
+        message="Successfully deleted books",
+        requested=len(ids),
+        deleted=len(deleted_ids),
+        missing_ids=sorted(set(ids) - set(deleted_ids)),
+    )
+
+
+async def load_books(
+    session: AsyncSession,
+    rows: Iterator[tuple[int, dict | RowError]],
+    batch_size: int = BOOK_IMPORT_BATCH_SIZE,
+) -> BookImportResponseSchema:
+    started = time.perf_counter()
+    received = 0
+    errors: list[RowError] = []
+    seen: dict[tuple[str, str], int] = {}
+    try:
+        await crud.create_books_import_staging(session)
+        batches = iter_batches(rows, batch_size)
+        # чтение файла и валидация pydantic блокируют — по пачке в потоке
+        while parsed := await asyncio.to_thread(parse_next_batch, batches):
+            batch_received, books, batch_errors = parsed
+            received += batch_received
+            errors += batch_errors
+            unique_books = []
+            for row_num, book in books:
+                key = (book.title, book.author)
+                if key in seen:
+                    errors.append(RowError(row_num, [f"duplicate of row {seen[key]}"]))
+                    continue
+                seen[key] = row_num
+                unique_books.append(book.model_dump())
+            if unique_books:
+                await crud.copy_books_to_staging(session, unique_books)
+        inserted, updated = await crud.upsert_books_from_staging(session)
+        await crud.drop_books_import_staging(session)
+        await session.commit()
+        if updated:
+            await fragments.clear()
+            await cache_clear(BOOK_RATINGS_CACHE_NAMESPACE)
+        if inserted or updated:
+            await cache_bump(BOOK_FACETS_CACHE_NAMESPACE)
+            await invalidate_book_indexes()
+    except ImportFileError as e:
+        # всё, что успели разложить в staging, откатывается вместе с ним
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Row {e.row}: {e.message}",
+        )
+    except SQLAlchemyError as e:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+
+    elapsed = time.perf_counter() - started
+    errors.sort(key=lambda error: error.row)
+    return BookImportResponseSchema(
+        message="Import finished",
+        received=received,
+        inserted=inserted,
+        updated=updated,
+        failed=len(errors),
+        errors=[
+            BookImportErrorSchema(row=error.row, errors=error.errors)
+            for error in errors[:BOOK_IMPORT_MAX_REPORTED_ERRORS]
+        ],
+        elapsed_seconds=round(elapsed, 3),
+        rows_per_second=round(received / elapsed, 1) if elapsed else 0,
+    )
+
+
+async def import_books(
+    session: AsyncSession,
+    file: UploadFile,
+    fmt: str | None,
+    admin_verifier: AdminSchema,
+) -> BookImportResponseSchema:
+    rows = read_book_rows(file.file, fmt or detect_format(file.filename))
+    return await load_books(session, rows)
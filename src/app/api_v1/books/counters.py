@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api_v1.books import fragments
+from app.api_v1.books.crud import flush_book_counters, get_pending_counter_book_ids
+from app.database.db_helper import new_async_session
+
+logger = logging.getLogger(__name__)
+
+# книг за одну транзакцию переноса: пока она не закоммичена, покупки этих книг
+# ждут на своих шардах, поэтому транзакции короткие
+BOOK_COUNTER_FLUSH_BATCH = 100
+
+
+# times_bought/times_returned в books отстают от покупок не больше чем на
+# интервал переноса; точные значения — get_book_counter_totals
+async def flush(session: AsyncSession) -> int:
+    book_ids = await get_pending_counter_book_ids(session)
+    await session.commit()
+    flushed = 0
+    for start in range(0, len(book_ids), BOOK_COUNTER_FLUSH_BATCH):
+        batch = book_ids[start : start + BOOK_COUNTER_FLUSH_BATCH]
+        books = await flush_book_counters(session, batch)
+        await session.commit()
+        await fragments.discard([book.id for book in books])
+        flushed += len(books)
+    return flushed
+
+
+async def run(interval: float) -> None:
+    # переносит каждый воркер: параллельные переносы делят шарды между собой
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with new_async_session() as session:
+                await flush(session)
+        except Exception:
+            logger.exception("Book counter flush failed")
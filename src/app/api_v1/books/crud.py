@@ -1,18 +1,47 @@
+import random
+from collections import defaultdict
+
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import (
+    ColumnElement,
+    String,
+    cast,
+    delete,
+    func,
+    literal,
+    null,
+    or_,
+    select,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import load_only, raiseload
+
+from app.core import settings
+from app.database.db_helper import in_ids, is_postgres
+from app.database.models import Book, BookCounterShard, Rating
+from app.schemas.book import (
+    BookFilterSchema,
+    BOOK_FACET_PRICE_BUCKET,
+    BOOK_FACET_YEAR_BUCKET,
+)
 
-from app.database.models import Book
+BOOK_FACETS = ("genre", "author", "year", "price")
 
 
 async def get_book_from_db(
     session: AsyncSession,
     book_id: int,
+    fields: list[str] | None = None,
 ) -> Book | None:
-    query = await session.execute(
-        select(Book).where(Book.id == book_id).options(selectinload(Book.buyers))
-    )
+    # только колонки книги: покупатели не грузятся, владение проверяется через user_owns_book
+    query = select(Book).where(Book.id == book_id).options(raiseload(Book.buyers))
+    if fields:
+        query = query.options(load_only(*[getattr(Book, field) for field in fields]))
+    query = await session.execute(query)
     book = query.scalar_one_or_none()
     if not book:
         raise HTTPException(
@@ -20,3 +49,253 @@ async def get_book_from_db(
             detail="Book not found",
         )
     return book
+
+
+async def get_book_rows_from_db_by_ids(
+    session: AsyncSession,
+    book_ids: list[int],
+    fields: list[str],
+) -> list[tuple]:
+    query = await session.execute(
+        select(*[getattr(Book, field) for field in fields]).where(
+            in_ids(session, Book.id, book_ids)
+        )
+    )
+    return [tuple(row) for row in query.all()]
+
+
+async def increment_book_counter(
+    session: AsyncSession,
+    book_id: int,
+    counter: str,
+) -> None:
+    # строка книги не блокируется: приращение уходит в случайный шард и
+    # переносится в books позже (flush_book_counters)
+    insert = postgresql.insert if is_postgres(session) else sqlite.insert
+    query = insert(BookCounterShard).values(
+        book_id=book_id,
+        shard=random.randrange(settings.book_counter_shards),
+        **{counter: 1},
+    )
+    await session.execute(
+        query.on_conflict_do_update(
+            index_elements=[BookCounterShard.book_id, BookCounterShard.shard],
+            set_={counter: getattr(BookCounterShard, counter) + 1},
+        )
+    )
+
+
+async def get_pending_counter_book_ids(session: AsyncSession) -> list[int]:
+    query = await session.execute(
+        select(BookCounterShard.book_id).distinct().order_by(BookCounterShard.book_id)
+    )
+    return list(query.scalars().all())
+
+
+async def flush_book_counters(
+    session: AsyncSession,
+    book_ids: list[int],
+) -> list[Book]:
+    """Moves pending shard increments of book_ids into books; returns the updated books."""
+    # DELETE ... RETURNING забирает ровно то, что будет перенесено: покупка,
+    # пришедшая параллельно, создаст шард заново и попадёт в следующий перенос
+    query = await session.execute(
+        delete(BookCounterShard)
+        .where(in_ids(session, BookCounterShard.book_id, book_ids))
+        .returning(
+            BookCounterShard.book_id,
+            BookCounterShard.times_bought,
+            BookCounterShard.times_returned,
+        )
+    )
+    pending = defaultdict(lambda: [0, 0])
+    for book_id, bought, returned in query.all():
+        pending[book_id][0] += bought
+        pending[book_id][1] += returned
+    books = []
+    # книги по порядку id: параллельные переносы не ловят взаимную блокировку
+    for book_id, (bought, returned) in sorted(pending.items()):
+        query = await session.execute(
+            update(Book)
+            .where(Book.id == book_id)
+            .values(
+                {
+                    Book.times_bought: Book.times_bought + bought,
+                    Book.times_returned: Book.times_returned + returned,
+                }
+            )
+            .returning(Book)
+        )
+        books.extend(query.scalars().all())
+    return books
+
+
+async def discard_book_counter_shards(
+    session: AsyncSession,
+    book_ids: list[int],
+) -> None:
+    await session.execute(
+        delete(BookCounterShard).where(in_ids(session, BookCounterShard.book_id, book_ids))
+    )
+
+
+async def get_book_counter_totals(
+    session: AsyncSession,
+    book_id: int,
+) -> tuple[int, int] | None:
+    """Exact (times_bought, times_returned): books plus not yet flushed shards."""
+    pending = [
+        select(func.coalesce(func.sum(column), 0))
+        .where(BookCounterShard.book_id == book_id)
+        .scalar_subquery()
+        for column in (BookCounterShard.times_bought, BookCounterShard.times_returned)
+    ]
+    query = await session.execute(
+        select(
+            Book.times_bought + pending[0],
+            Book.times_returned + pending[1],
+        ).where(Book.id == book_id)
+    )
+    row = query.one_or_none()
+    return tuple(row) if row else None
+
+
+async def get_book_rating_distribution(
+    session: AsyncSession,
+    book_id: int,
+) -> dict[int, int]:
+    query = await session.execute(
+        select(Rating.score, func.count())
+        .where(Rating.book_id == book_id)
+        .group_by(Rating.score)
+    )
+    return dict(query.all())
+
+
+async def get_book_rows_from_db(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+    fields: list[str],
+) -> list[tuple]:
+    # только запрошенные колонки и без ORM-объектов: строки идут прямо в JSON
+    query = await session.execute(
+        select(*[getattr(Book, field) for field in fields]).where(
+            *book_filter_clauses(filters)
+        )
+    )
+    return [tuple(row) for row in query.all()]
+
+
+async def get_book_ids_from_db(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+) -> list[int]:
+    query = await session.execute(select(Book.id).where(*book_filter_clauses(filters)))
+    return list(query.scalars().all())
+
+
+def book_filter_clauses(filters: BookFilterSchema) -> list:
+    clauses = []
+    # частичное совпадение без учёта регистра (ILIKE на Postgres)
+    for column, value in [
+        (Book.title, filters.title),
+        (Book.author, filters.author),
+        (Book.genre, filters.genre),
+        (Book.description, filters.description),
+    ]:
+        if value:
+            clauses.append(column.icontains(value, autoescape=True))
+    for column, min_val, max_val in [
+        (Book.year, filters.year_min, filters.year_max),
+        (Book.price, filters.price_min, filters.price_max),
+        (Book.times_bought, filters.times_bought_min, filters.times_bought_max),
+        (Book.times_returned, filters.times_returned_min, filters.times_returned_max),
+        (Book.rating, filters.rating_min, filters.rating_max),
+    ]:
+        if min_val is not None:
+            clauses.append(column >= min_val)
+        if max_val is not None:
+            clauses.append(column <= max_val)
+    return clauses
+
+
+async def get_book_facet_counts(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+) -> list[tuple[str, str | int | None, int]]:
+    """Returns (facet, value, count) rows; the "total" facet has value None."""
+    filtered = (
+        select(
+            Book.genre.label("genre"),
+            Book.author.label("author"),
+            (Book.year - Book.year % BOOK_FACET_YEAR_BUCKET).label("year"),
+            (Book.price - Book.price % BOOK_FACET_PRICE_BUCKET).label("price"),
+        )
+        .where(*book_filter_clauses(filters))
+        .subquery("filtered")
+    )
+    columns = [filtered.c[facet] for facet in BOOK_FACETS]
+    if is_postgres(session):
+        # один проход по отфильтрованным книгам на все фасеты сразу
+        query = await session.execute(
+            select(*columns, func.count()).group_by(
+                func.grouping_sets(*[tuple_(column) for column in columns], tuple_())
+            )
+        )
+        counts = []
+        for *values, count in query.all():
+            # все колонки NOT NULL, так что непустое значение однозначно задаёт фасет
+            facet, value = next(
+                ((facet, value) for facet, value in zip(BOOK_FACETS, values) if value is not None),
+                ("total", None),
+            )
+            counts.append((facet, value, count))
+        return counts
+    query = await session.execute(
+        union_all(
+            *[
+                select(
+                    literal(facet).label("facet"),
+                    cast(column, String).label("value"),
+                    func.count(),
+                ).group_by(column)
+                for facet, column in zip(BOOK_FACETS, columns)
+            ],
+            select(literal("total"), null(), func.count()).select_from(filtered),
+        )
+    )
+    return [tuple(row) for row in query.all()]
+
+
+def trgm_text(column: ColumnElement[str]) -> ColumnElement[str]:
+    # то же выражение, что в триграммных индексах миграции; константы встраиваются
+    # в SQL, чтобы планировщик сопоставил выражение с индексом и в подготовленных запросах
+    return func.translate(
+        column,
+        literal("Ёё", literal_execute=True),
+        literal("Ее", literal_execute=True),
+    )
+
+
+async def search_books_by_trigram(
+    session: AsyncSession,
+    q: str,
+    threshold: float,
+    k: int,
+) -> list[tuple[int, float]]:
+    q = q.replace("Ё", "Е").replace("ё", "е")
+    # порог для <% действует до конца транзакции
+    await session.execute(
+        select(func.set_config("pg_trgm.word_similarity_threshold", str(threshold), True))
+    )
+    title, author = trgm_text(Book.title), trgm_text(Book.author)
+    score = func.greatest(
+        func.word_similarity(q, title), func.word_similarity(q, author)
+    ).label("score")
+    query = await session.execute(
+        select(Book.id, score)
+        .where(or_(literal(q).op("<%")(title), literal(q).op("<%")(author)))
+        .order_by(score.desc(), Book.id)
+        .limit(k)
+    )
+    return [tuple(row) for row in query.all()]
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api_v1.books.crud import get_book_rows_from_db_by_ids
+from app.database.db_helper import is_replica
+from app.schemas.book import BOOK_FIELDS
+from app.utils.cache import (
+    BOOKS_CACHE_NAMESPACE,
+    BOOK_FRAGMENTS_CACHE_EXPIRE,
+    cache_clear,
+    cache_delete,
+    cache_get_many,
+    cache_set_many,
+    get_backend,
+)
+from app.utils.serialization import BODY_ENCODINGS, JSON_ENCODING, BodyEncoding
+
+# Закодированное тело каждой книги (BookGetSchema, поля в порядке BOOK_FIELDS),
+# отдельно для JSON и msgpack. Хранится в Redis, если кэш поднят, иначе в памяти
+# процесса (тесты, скрипты). Любая запись книги удаляет фрагмент после commit,
+# и он пересобирается при следующем чтении: перезапись из писателя могла бы
+# положить тело старого commit поверх нового и держать его весь TTL.
+# В памяти процесса — LRU на BOOK_FRAGMENTS_LOCAL_SIZE книг.
+BOOK_FRAGMENTS_LOCAL_SIZE = 10_000
+_local: dict[str, OrderedDict[int, bytes]] = {
+    encoding.name: OrderedDict() for encoding in BODY_ENCODINGS
+}
+_ID = BOOK_FIELDS.index("id")
+
+
+def reset() -> None:
+    for fragments in _local.values():
+        fragments.clear()
+
+
+def namespace(encoding: BodyEncoding) -> str:
+    # JSON остаётся в прежнем пространстве "book"
+    if encoding is JSON_ENCODING:
+        return BOOKS_CACHE_NAMESPACE
+    return f"{BOOKS_CACHE_NAMESPACE}_{encoding.name}"
+
+
+def encode_row(row: tuple, encoding: BodyEncoding = JSON_ENCODING) -> bytes:
+    return encoding.dumps(dict(zip(BOOK_FIELDS, row)))
+
+
+def join(fragments: Iterable[bytes], encoding: BodyEncoding = JSON_ENCODING) -> bytes:
+    return encoding.array(list(fragments))
+
+
+async def _put(fragments: dict[int, bytes], encoding: BodyEncoding) -> None:
+    if get_backend():
+        await cache_set_many(
+            namespace(encoding), fragments, expire=BOOK_FRAGMENTS_CACHE_EXPIRE
+        )
+    else:
+        local = _local[encoding.name]
+        local.update(fragments)
+        for book_id in fragments:
+            local.move_to_end(book_id)
+        while len(local) > BOOK_FRAGMENTS_LOCAL_SIZE:
+            local.popitem(last=False)
+
+
+async def get_many(
+    session: AsyncSession,
+    book_ids: list[int],
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> dict[int, bytes]:
+    """Fragments for the existing books among book_ids; misses are rebuilt from the DB."""
+    if get_backend():
+        cached = await cache_get_many(namespace(encoding), book_ids)
+        found = {
+            book_id: raw if isinstance(raw, bytes) else raw.encode()
+            for book_id, raw in zip(book_ids, cached)
+            if raw is not None
+        }
+    else:
+        local = _local[encoding.name]
+        found = {book_id: local[book_id] for book_id in book_ids if book_id in local}
+        for book_id in found:
+            local.move_to_end(book_id)
+    missing = [book_id for book_id in book_ids if book_id not in found]
+    if missing:
+        rows = await get_book_rows_from_db_by_ids(session, missing, BOOK_FIELDS)
+        fresh = {row[_ID]: encode_row(row, encoding) for row in rows}
+        if not is_replica(session):
+            await _put(fresh, encoding)
+        found.update(fresh)
+    return found
+
+
+async def discard(book_ids: list[int]) -> None:
+    for encoding in BODY_ENCODINGS:
+        for book_id in book_ids:
+            _local[encoding.name].pop(book_id, None)
+        await cache_delete(namespace(encoding), book_ids)
+
+
+async def clear() -> None:
+    reset()
+    for encoding in BODY_ENCODINGS:
+        await cache_clear(namespace(encoding))
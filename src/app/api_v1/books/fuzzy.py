@@ -0,0 +1,117 @@
+import asyncio
+import math
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api_v1.books.index_state import IndexState
+from app.database.models import Book
+from app.utils.text import char_ngrams
+
+BOOK_SEARCH_MAX_K = 50
+BOOK_FUZZY_CACHE_NAMESPACE = "book_fuzzy"
+# поля книги, по которым строится индекс
+FUZZY_FIELDS = ("title", "author")
+REBUILD_INTERVAL_SECONDS = 10 * 60
+
+
+class TrigramIndex:
+    """Inverted trigram index over book titles and authors.
+
+    Used where pg_trgm is not available. Posting lists are stored as one
+    CSR-style array of sorted document numbers (2 * book + 0 for the title,
+    + 1 for the author). A document needs ceil(threshold * |query|) shared
+    trigrams to match, so candidates come only from the shortest lists; the
+    long, common ones are probed with binary search.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.vocab: dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.empty(0, dtype=np.int32)
+        self.book_ids = np.empty(0, dtype=np.int64)
+
+    def build(self, books: list[tuple[int, str, str]]) -> None:
+        vocab: dict[str, int] = {}
+        terms, docs = [], []
+        for i, (_, title, author) in enumerate(books):
+            for field, text in enumerate((title, author)):
+                grams = {vocab.setdefault(gram, len(vocab)) for gram in char_ngrams(text)}
+                terms += grams
+                docs += [2 * i + field] * len(grams)
+        terms = np.asarray(terms, dtype=np.int32)
+        docs = np.asarray(docs, dtype=np.int32)
+        # стабильная сортировка сохраняет возрастание номеров документов внутри списка
+        order = np.argsort(terms, kind="stable")
+        self.postings = docs[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=len(vocab)))))
+        self.vocab = vocab
+        self.book_ids = np.asarray([book[0] for book in books], dtype=np.int64)
+
+    def _postings(self, term: int) -> np.ndarray:
+        return self.postings[self.offsets[term] : self.offsets[term + 1]]
+
+    def search(self, query: str, threshold: float, k: int) -> list[tuple[int, float]]:
+        grams = set(char_ngrams(query))
+        if not grams or not len(self.book_ids):
+            return []
+        lists = sorted(
+            (self._postings(self.vocab[gram]) for gram in grams if gram in self.vocab),
+            key=len,
+        )
+        required = max(math.ceil(threshold * len(grams)), 1)
+        if len(lists) < required:
+            return []
+        # документ без триграмм из самых коротких списков уже не наберёт required
+        candidates = np.unique(np.concatenate(lists[: len(lists) - required + 1]))
+        common = np.zeros(len(candidates), dtype=np.int32)
+        for postings in lists:
+            positions = np.searchsorted(postings, candidates).clip(max=len(postings) - 1)
+            common += postings[positions] == candidates
+        matched = common >= required
+        candidates, scores = candidates[matched] // 2, common[matched] / len(grams)
+        # у книги совпасть могли и название, и автор — берём лучшее
+        order = np.lexsort((-scores, candidates))
+        candidates, scores = candidates[order], scores[order]
+        first = np.concatenate(([True], candidates[1:] != candidates[:-1]))
+        candidates, scores = candidates[first], scores[first]
+        top = np.lexsort((self.book_ids[candidates], -scores))[:k]
+        return [
+            (int(self.book_ids[candidates[i]]), float(scores[i])) for i in top
+        ]
+
+
+trigrams = TrigramIndex()
+
+
+async def build(session: AsyncSession) -> None:
+    global trigrams
+    query = await session.execute(select(Book.id, Book.title, Book.author))
+    index = TrigramIndex()
+    await asyncio.to_thread(index.build, [tuple(row) for row in query.all()])
+    trigrams = index
+
+
+state = IndexState(BOOK_FUZZY_CACHE_NAMESPACE, REBUILD_INTERVAL_SECONDS, build)
+
+
+def reset() -> None:
+    trigrams.reset()
+    state.reset()
+
+
+async def invalidate() -> None:
+    # списки триграмм на месте не поправить — индекс пересобирается в фоне
+    await state.invalidate()
+
+
+async def rebuild(session: AsyncSession) -> None:
+    await state.rebuild(session)
+
+
+async def ensure_built(session: AsyncSession) -> None:
+    await state.ensure_built(session)
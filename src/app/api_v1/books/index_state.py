@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db_helper import new_async_session, primary_session
+from app.utils.cache import cache_bump, cache_generation
+
+logger = logging.getLogger(__name__)
+
+# не чаще раза в столько секунд воркер сверяет своё поколение индекса с общим
+INDEX_SYNC_INTERVAL_SECONDS = 1
+
+
+class IndexState:
+    """Freshness of an in-process index, shared by all workers.
+
+    Every worker keeps its own copy of the index. A change bumps a generation
+    in the shared cache, and the other workers notice it within
+    INDEX_SYNC_INTERVAL_SECONDS. A stale index keeps being served while a
+    background task rebuilds it; only the first build runs inside a request.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        interval: float,
+        build: Callable[[AsyncSession], Awaitable[None]],
+    ):
+        self.namespace = namespace
+        self.interval = interval
+        self.build = build
+        self.reset()
+
+    def reset(self) -> None:
+        self.ready = False
+        self.built_at: float | None = None
+        # растёт с каждым изменением в этом воркере: сборка, во время которой
+        # оно случилось, могла его не увидеть и не считается свежей
+        self.generation = 0
+        # общее поколение, с которым согласован индекс этого воркера
+        self.shared: int | None = None
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+        self.task: asyncio.Task | None = None
+
+    async def rebuild(self, session: AsyncSession) -> None:
+        generation = self.generation
+        shared = await cache_generation(self.namespace)
+        await self.build(session)
+        self.ready = True
+        if generation == self.generation:
+            self.built_at = time.time()
+            self.shared = shared
+        else:
+            # подменённый индекс мог не увидеть изменение — собрать ещё раз
+            self.built_at = None
+
+    async def refresh(self) -> None:
+        try:
+            async with self.lock:
+                async with new_async_session() as session:
+                    await self.rebuild(session)
+        except Exception:
+            logger.exception("Rebuilding %s index failed", self.namespace)
+
+    async def is_stale(self) -> bool:
+        now = time.time()
+        if now - self.checked_at >= INDEX_SYNC_INTERVAL_SECONDS:
+            self.checked_at = now
+            if await cache_generation(self.namespace) != self.shared:
+                self.built_at = None
+        return self.built_at is None or now - self.built_at >= self.interval
+
+    async def ensure_built(self, session: AsyncSession) -> None:
+        if not self.ready:
+            # отдавать пока нечего — первая сборка идёт в запросе
+            async with self.lock:
+                if not self.ready:
+                    # по отставшей реплике индекс разошёлся бы с базой до пересборки
+                    async with primary_session(session) as primary:
+                        await self.rebuild(primary)
+            return
+        if await self.is_stale() and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.refresh())
+
+    async def invalidate(self) -> None:
+        self.generation += 1
+        self.built_at = None
+        await cache_bump(self.namespace)
+
+    async def changed(self) -> None:
+        """Records a change already applied to this worker's index."""
+        self.generation += 1
+        shared = await cache_bump(self.namespace)
+        # остальные воркеры пересоберут индекс; этот уже в курсе, если до
+        # изменения был согласован с общим поколением
+        if shared is not None and self.shared == shared - 1:
+            self.shared = shared
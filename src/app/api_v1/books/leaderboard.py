@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import math
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import TIMESTAMP, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db_helper import is_postgres, primary_session
+from app.database.models import Book, UserActions, user_books_table
+
+TRENDING_HALF_LIFE_SECONDS = 24 * 60 * 60
+# тренды пересобираются из действий за столько периодов полураспада:
+# более старая покупка весит меньше 1/16
+TRENDING_REBUILD_HALF_LIVES = 4
+TRENDING_ACTIONS = {"buy_book": 1, "return_book": -1}
+# каждый воркер держит свою копию; периодическая пересборка ограничивает расхождение
+REBUILD_INTERVAL_SECONDS = 10 * 60
+
+
+class Leaderboard:
+    """Max-heap of book scores with lazy deletion.
+
+    Updates push a new heap entry and leave the old one behind; top(k) pops
+    entries until it has k live ones and pushes those back, so a read costs
+    O(k log n) instead of a full sort.
+    """
+
+    def __init__(self):
+        self.scores: dict[int, float] = {}
+        self._heap: list[tuple[float, int]] = []
+
+    def reset(self, scores: dict[int, float] | None = None) -> None:
+        self.scores = {book_id: score for book_id, score in (scores or {}).items() if score > 0}
+        self._heap = [(-score, book_id) for book_id, score in self.scores.items()]
+        heapq.heapify(self._heap)
+
+    def set(self, book_id: int, score: float) -> None:
+        if score <= 0:
+            self.scores.pop(book_id, None)
+        elif self.scores.get(book_id) != score:
+            self.scores[book_id] = score
+            heapq.heappush(self._heap, (-score, book_id))
+        if len(self._heap) > 2 * len(self.scores) + 64:
+            self.reset(self.scores)
+
+    def add(self, book_id: int, delta: float) -> None:
+        self.set(book_id, self.scores.get(book_id, 0) + delta)
+
+    def discard(self, book_id: int) -> None:
+        self.set(book_id, 0)
+
+    def top(self, k: int) -> list[tuple[int, float]]:
+        result = []
+        seen = set()
+        while self._heap and len(result) < k:
+            score, book_id = heapq.heappop(self._heap)
+            if self.scores.get(book_id) != -score or book_id in seen:
+                continue  # устаревшая запись — выбрасываем насовсем
+            seen.add(book_id)
+            result.append((book_id, -score))
+        for book_id, score in result:
+            heapq.heappush(self._heap, (-score, book_id))
+        return result
+
+
+class DecayedLeaderboard(Leaderboard):
+    """Leaderboard whose scores halve every `half_life` seconds.
+
+    Scores are kept in units of exp(rate * (t - anchor)), so every score decays
+    by the same factor and the heap order never goes stale; only the reported
+    values are scaled back to the current time.
+    """
+
+    def __init__(self, half_life: float):
+        super().__init__()
+        self.rate = math.log(2) / half_life
+        self.anchor = time.time()
+
+    def reset(self, scores: dict[int, float] | None = None, anchor: float | None = None) -> None:
+        if anchor is not None:
+            self.anchor = anchor
+        super().reset(scores)
+
+    def add(self, book_id: int, delta: float, at: float | None = None) -> None:
+        at = time.time() if at is None else at
+        if self.rate * (at - self.anchor) > 50:
+            self._rebase(at)
+        super().add(book_id, delta * math.exp(self.rate * (at - self.anchor)))
+
+    def top(self, k: int, now: float | None = None) -> list[tuple[int, float]]:
+        now = time.time() if now is None else now
+        decay = math.exp(-self.rate * (now - self.anchor))
+        return [(book_id, score * decay) for book_id, score in super().top(k)]
+
+    def _rebase(self, anchor: float) -> None:
+        decay = math.exp(-self.rate * (anchor - self.anchor))
+        self.reset({book_id: score * decay for book_id, score in self.scores.items()}, anchor)
+
+
+bestsellers = Leaderboard()
+trending = DecayedLeaderboard(TRENDING_HALF_LIFE_SECONDS)
+
+_built_at: float | None = None
+_lock = asyncio.Lock()
+
+
+def record_purchase(book_id: int) -> None:
+    bestsellers.add(book_id, 1)
+    trending.add(book_id, 1)
+
+
+def record_return(book_id: int) -> None:
+    bestsellers.add(book_id, -1)
+    trending.add(book_id, -1)
+
+
+def discard_book(book_id: int) -> None:
+    bestsellers.discard(book_id)
+    trending.discard(book_id)
+
+
+def reset() -> None:
+    global _built_at
+    bestsellers.reset()
+    trending.reset()
+    _built_at = None
+
+
+async def rebuild(session: AsyncSession) -> None:
+    # лучшие продажи — из владений, тренды — из покупок и возвратов за окно;
+    # все воркеры пересобирают одно и то же, так что расходятся лишь на интервал
+    global _built_at
+    now = time.time()
+    owners = await session.execute(
+        select(user_books_table.c.book_id, func.count()).group_by(
+            user_books_table.c.book_id
+        )
+    )
+    # время действий пишет база (server_default now() в колонку без зоны),
+    # поэтому и возраст считаем по её часам, тоже без зоны
+    clock = func.localtimestamp if is_postgres(session) else func.current_timestamp
+    db_now = await session.scalar(select(clock(type_=TIMESTAMP)))
+    window = timedelta(seconds=TRENDING_REBUILD_HALF_LIVES * TRENDING_HALF_LIFE_SECONDS)
+    actions = await session.execute(
+        select(UserActions.book_id, UserActions.action_type, UserActions.timestamp)
+        .join(Book, Book.id == UserActions.book_id)
+        .where(
+            UserActions.action_type.in_(TRENDING_ACTIONS),
+            UserActions.timestamp >= db_now - window,
+        )
+    )
+    scores = defaultdict(float)
+    for book_id, action_type, timestamp in actions.all():
+        age = max((db_now - timestamp).total_seconds(), 0)
+        scores[book_id] += TRENDING_ACTIONS[action_type] * math.exp(-trending.rate * age)
+    bestsellers.reset(dict(owners.all()))
+    trending.reset(scores, anchor=now)
+    _built_at = now
+
+
+async def ensure_built(session: AsyncSession) -> None:
+    if _built_at is not None and time.time() - _built_at < REBUILD_INTERVAL_SECONDS:
+        return
+    async with _lock:
+        if _built_at is None or time.time() - _built_at >= REBUILD_INTERVAL_SECONDS:
+            # индекс живёт до следующей пересборки: отставшая реплика не годится
+            async with primary_session(session) as primary:
+                await rebuild(primary)
@@ -0,0 +1,103 @@
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import instrumentation
+from app.schemas.book import BOOK_FIELDS, BookFilterSchema
+
+# Самые частые чтения каталога мимо ORM: SQL написан руками и выполняется прямо
+# на asyncpg-соединении сессии (та же реплика, что выбрал get_read_session).
+# Адаптер SQLAlchemy открывает транзакцию лениво, при своём первом запросе,
+# поэтому запрос, идущий в сессии первым, выполняется вне транзакции — для
+# одиночного SELECT это ничего не меняет. asyncpg готовит запрос один раз на
+# соединение и держит его в кэше (DB_STATEMENT_CACHE_SIZE); с DB_PGBOUNCER кэш
+# выключен, и запрос готовится заново каждый раз. Строки уходят в ответ без
+# identity map и объектов. События SQLAlchemy эти запросы не видят, поэтому
+# они сами отчитываются в SQL_STATS и журнал медленных запросов (record_raw).
+
+TEXT_FILTERS = ("title", "author", "genre", "description")
+RANGE_FILTERS = ("year", "price", "times_bought", "times_returned", "rating")
+
+
+async def driver_connection(session: AsyncSession):
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+def escape_like(value: str) -> str:
+    # как icontains(autoescape=True): "/" экранирует себя, "%" и "_"
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def filter_sql(filters: BookFilterSchema) -> tuple[str, list]:
+    """Returns the WHERE clause of book_filter_clauses and its $n arguments."""
+    clauses, args = [], []
+    for field in TEXT_FILTERS:
+        value = getattr(filters, field)
+        if value:
+            args.append(escape_like(value))
+            clauses.append(f"{field} ILIKE '%' || ${len(args)} || '%' ESCAPE '/'")
+    for field in RANGE_FILTERS:
+        for bound, op in (("min", ">="), ("max", "<=")):
+            value = getattr(filters, f"{field}_{bound}")
+            if value is not None:
+                args.append(value)
+                clauses.append(f"{field} {op} ${len(args)}")
+    if not clauses:
+        return "", args
+    return " WHERE " + " AND ".join(clauses), args
+
+
+async def execute(session: AsyncSession, method: str, statement: str, *args):
+    connection = await driver_connection(session)
+    if not instrumentation.raw_stats_enabled():
+        return await getattr(connection, method)(statement, *args)
+    start = time.perf_counter()
+    result = await getattr(connection, method)(statement, *args)
+    duration = time.perf_counter() - start
+    if method == "fetchrow":
+        rows = int(result is not None)
+    else:
+        rows = len(result)
+    instrumentation.record_raw(session.bind.sync_engine, statement, args, duration, rows)
+    return result
+
+
+def select_list(fields: list[str]) -> str:
+    # имена колонок подставляются в SQL, поэтому только из BOOK_FIELDS
+    unknown = set(fields) - set(BOOK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown book fields: {', '.join(sorted(unknown))}")
+    return ", ".join(fields)
+
+
+async def fetch_book_row(
+    session: AsyncSession,
+    book_id: int,
+    fields: list[str],
+) -> tuple | None:
+    statement = f"SELECT {select_list(fields)} FROM books WHERE id = $1"
+    row = await execute(session, "fetchrow", statement, book_id)
+    return tuple(row) if row is not None else None
+
+
+async def fetch_book_rows(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+    fields: list[str],
+) -> list[tuple]:
+    where, args = filter_sql(filters)
+    rows = await execute(
+        session, "fetch", f"SELECT {select_list(fields)} FROM books{where}", *args
+    )
+    return [tuple(row) for row in rows]
+
+
+async def fetch_book_ids(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+) -> list[int]:
+    where, args = filter_sql(filters)
+    rows = await execute(session, "fetch", f"SELECT id FROM books{where}", *args)
+    return [row[0] for row in rows]
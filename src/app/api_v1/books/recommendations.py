@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api_v1.users.crud import get_user_book_ids
+from app.database.db_helper import primary_session
+from app.database.models import user_books_table
+
+ALSO_BOUGHT_TOP_K = 20
+# полная пересборка вливает накопленные дельты в матрицу
+REBUILD_INTERVAL_SECONDS = 30 * 60
+
+
+class CoPurchaseIndex:
+    """Book x book co-purchase counts with precomputed top-k neighbours.
+
+    The base matrix is built in one sparse product (B.T @ B over the user x book
+    incidence matrix). Purchases and returns after the build go into a small
+    delta map, and only the rows they touch get their top-k recomputed.
+    """
+
+    def __init__(self, top_k: int = ALSO_BOUGHT_TOP_K):
+        self.top_k = top_k
+        self.reset()
+
+    def reset(self) -> None:
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.book_ids = np.empty(0, dtype=np.int64)
+        self.index: dict[int, int] = {}
+        self.delta: dict[int, dict[int, int]] = {}
+        self.neighbors: dict[int, list[tuple[int, int]]] = {}
+
+    def build(self, user_ids: list, book_ids: list[int]) -> None:
+        self.reset()
+        if not book_ids:
+            return
+        _, user_idx = np.unique(np.asarray(user_ids, dtype=object), return_inverse=True)
+        self.book_ids, book_idx = np.unique(np.asarray(book_ids, dtype=np.int64), return_inverse=True)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(book_idx), dtype=np.int32), (user_idx, book_idx)),
+            shape=(user_idx.max() + 1, len(self.book_ids)),
+        )
+        matrix = (incidence.T @ incidence).tocsr()
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self.index = {int(book_id): i for i, book_id in enumerate(self.book_ids)}
+        for i, book_id in enumerate(self.book_ids):
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            if start != end:
+                self.neighbors[int(book_id)] = self._top(
+                    self.book_ids[matrix.indices[start:end]], matrix.data[start:end]
+                )
+
+    def _top(self, book_ids: np.ndarray, counts: np.ndarray) -> list[tuple[int, int]]:
+        if len(counts) > self.top_k:
+            part = np.argpartition(-counts, self.top_k)[: self.top_k]
+            book_ids, counts = book_ids[part], counts[part]
+        order = np.lexsort((book_ids, -counts))
+        return [(int(book_ids[i]), int(counts[i])) for i in order]
+
+    def _row(self, book_id: int) -> dict[int, int]:
+        row = {}
+        if (i := self.index.get(book_id)) is not None:
+            start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+            row = dict(
+                zip(
+                    self.book_ids[self.matrix.indices[start:end]].tolist(),
+                    self.matrix.data[start:end].tolist(),
+                )
+            )
+        for other_id, delta in self.delta.get(book_id, {}).items():
+            row[other_id] = row.get(other_id, 0) + delta
+        return {other_id: count for other_id, count in row.items() if count > 0}
+
+    def _refresh(self, book_id: int) -> None:
+        row = self._row(book_id)
+        if not row:
+            self.neighbors.pop(book_id, None)
+            return
+        self.neighbors[book_id] = self._top(
+            np.fromiter(row.keys(), dtype=np.int64, count=len(row)),
+            np.fromiter(row.values(), dtype=np.int64, count=len(row)),
+        )
+
+    def update(self, book_id: int, other_book_ids: list[int], delta: int) -> None:
+        for other_id in other_book_ids:
+            if other_id == book_id:
+                continue
+            for a, b in ((book_id, other_id), (other_id, book_id)):
+                row = self.delta.setdefault(a, {})
+                row[b] = row.get(b, 0) + delta
+            self._refresh(other_id)
+        self._refresh(book_id)
+
+    def discard(self, book_id: int) -> None:
+        for other_id, count in self._row(book_id).items():
+            row = self.delta.setdefault(other_id, {})
+            row[book_id] = row.get(book_id, 0) - count
+            self._refresh(other_id)
+        self.delta.pop(book_id, None)
+        self.neighbors.pop(book_id, None)
+
+    def also_bought(self, book_id: int, k: int) -> list[tuple[int, int]]:
+        return self.neighbors.get(book_id, [])[:k]
+
+
+co_purchases = CoPurchaseIndex()
+
+_built_at: float | None = None
+_lock = asyncio.Lock()
+# изменения, пришедшие во время сборки: новый индекс их уже не прочитает
+_pending: list[tuple[str, tuple]] | None = None
+
+
+def reset() -> None:
+    global _built_at
+    co_purchases.reset()
+    _built_at = None
+
+
+def _apply(method: str, *args) -> None:
+    getattr(co_purchases, method)(*args)
+    if _pending is not None:
+        _pending.append((method, args))
+
+
+async def rebuild(session: AsyncSession) -> None:
+    global co_purchases, _built_at, _pending
+    query = await session.execute(
+        select(user_books_table.c.user_id, user_books_table.c.book_id)
+    )
+    rows = query.all()
+    index = CoPurchaseIndex()
+    _pending = []
+    try:
+        # произведение разреженных матриц — CPU, не держим на нём event loop
+        await asyncio.to_thread(
+            index.build, [row[0] for row in rows], [row[1] for row in rows]
+        )
+        for method, args in _pending:
+            getattr(index, method)(*args)
+    finally:
+        _pending = None
+    # подменяем индекс целиком, чтобы запросы не видели его наполовину собранным
+    co_purchases = index
+    _built_at = time.time()
+
+
+async def ensure_built(session: AsyncSession) -> None:
+    if _built_at is not None and time.time() - _built_at < REBUILD_INTERVAL_SECONDS:
+        return
+    async with _lock:
+        if _built_at is None or time.time() - _built_at >= REBUILD_INTERVAL_SECONDS:
+            # индекс живёт до следующей пересборки: отставшая реплика не годится
+            async with primary_session(session) as primary:
+                await rebuild(primary)
+
+
+# до первой сборки ничего не пишем: сборка и так прочитает покупку из user_books
+async def record_purchase(session: AsyncSession, uid: str, book_id: int) -> None:
+    if _built_at is not None or _pending is not None:
+        _apply("update", book_id, await get_user_book_ids(session, uid), 1)
+
+
+async def record_return(session: AsyncSession, uid: str, book_id: int) -> None:
+    if _built_at is not None or _pending is not None:
+        _apply("update", book_id, await get_user_book_ids(session, uid), -1)
+
+
+def discard_book(book_id: int) -> None:
+    _apply("discard", book_id)
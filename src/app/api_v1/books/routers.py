@@ -1,34 +1,180 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_session
+from app.database import get_read_session, get_session
 from app.api_v1.books import services
+from app.api_v1.books.fuzzy import BOOK_SEARCH_MAX_K
+from app.api_v1.books.recommendations import ALSO_BOUGHT_TOP_K
+from app.api_v1.books.similarity import SIMILAR_TOP_K
+from app.api_v1.books.suggest import BOOK_SUGGEST_MAX_K
 from app.schemas.book import (
+    BookCountersSchema,
+    BookFacetsSchema,
     BookFilterSchema,
-    BookGetSchema,
+    BookBatchSchema,
+    BookBatchResponseSchema,
+    BookPartialSchema,
+    BookRankSchema,
+    BookRatingsSchema,
+    BookSuggestSchema,
+    BOOK_TOP_MAX_K,
+)
+from app.utils.serialization import (
+    BodyEncodingDep,
+    EncodedResponse,
+    NegotiatedResponse,
+    NegotiatedRoute,
 )
 from fastapi_cache.decorator import cache
 
+BookFieldsQuery = Annotated[
+    str | None,
+    Query(pattern=r"^\w+(,\w+)*$", description="id,title,author,price"),
+]
+
 router = APIRouter(
     prefix="/books",
     tags=["Books"],
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse,
 )
 
 
 @cache(expire=60)
-@router.get("/")
+@router.get(
+    "/",
+    response_model=list[BookPartialSchema],
+    response_model_exclude_unset=True,
+)
 async def get_all_books(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
     filters: Annotated[BookFilterSchema, Depends()],
-) -> list[BookGetSchema]:
-    return await services.get_all_books(session, filters)
+    fields: BookFieldsQuery = None,
+) -> EncodedResponse:
+    body = await services.get_all_books(session, filters, fields, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.get("/facets")
+async def get_book_facets(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    filters: Annotated[BookFilterSchema, Depends()],
+) -> BookFacetsSchema:
+    return await services.get_book_facets(session, filters)
+
+
+@router.get("/suggest")
+async def get_book_suggestions(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    k: Annotated[int, Query(ge=1, le=BOOK_SUGGEST_MAX_K)] = 10,
+) -> list[BookSuggestSchema]:
+    return await services.get_book_suggestions(session, q, k)
+
+
+@router.get("/search", response_model=list[BookRankSchema])
+async def search_books(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    q: Annotated[str, Query(min_length=3, max_length=200)],
+    k: Annotated[int, Query(ge=1, le=BOOK_SEARCH_MAX_K)] = 10,
+) -> EncodedResponse:
+    body = await services.search_books(session, q, k, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.get("/top", response_model=list[BookRankSchema])
+async def get_top_books(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    k: Annotated[int, Query(ge=1, le=BOOK_TOP_MAX_K)] = 10,
+) -> EncodedResponse:
+    body = await services.get_top_books(session, k, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.get("/trending", response_model=list[BookRankSchema])
+async def get_trending_books(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    k: Annotated[int, Query(ge=1, le=BOOK_TOP_MAX_K)] = 10,
+) -> EncodedResponse:
+    body = await services.get_trending_books(session, k, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.get("/batch", response_model=BookBatchResponseSchema)
+async def get_books_batch(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    ids: Annotated[str, Query(pattern=r"^\d+(,\d+)*$", description="1,2,3")],
+) -> EncodedResponse:
+    book_ids = [int(i) for i in ids.split(",")]
+    body = await services.get_books_batch(session, book_ids, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.post("/batch", response_model=BookBatchResponseSchema)
+async def post_books_batch(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    data: BookBatchSchema,
+) -> EncodedResponse:
+    body = await services.get_books_batch(session, data.ids, encoding=encoding)
+    return EncodedResponse(body, encoding)
 
 
 @cache(expire=60)
-@router.get("/{book_id}")
+@router.get(
+    "/{book_id}",
+    response_model=BookPartialSchema,
+    response_model_exclude_unset=True,
+)
 async def get_book(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    book_id: int,
+    fields: BookFieldsQuery = None,
+) -> BookPartialSchema:
+    return await services.get_book(session, book_id, fields)
+
+
+@router.get("/{book_id}/ratings")
+async def get_book_ratings(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    book_id: int,
+) -> BookRatingsSchema:
+    return await services.get_book_ratings(session, book_id)
+
+
+@router.get("/{book_id}/counters")
+async def get_book_counters(
+    # с primary: реплика может отставать как раз на шарды последних покупок
     session: Annotated[AsyncSession, Depends(get_session)],
     book_id: int,
-) -> BookGetSchema:
-    return await services.get_book(session, book_id)
+) -> BookCountersSchema:
+    # точные счётчики, включая ещё не перенесённые в books покупки
+    return await services.get_book_counters(session, book_id)
+
+
+@router.get("/{book_id}/also-bought", response_model=list[BookRankSchema])
+async def get_also_bought_books(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    book_id: int,
+    k: Annotated[int, Query(ge=1, le=ALSO_BOUGHT_TOP_K)] = 10,
+) -> EncodedResponse:
+    body = await services.get_also_bought_books(session, book_id, k, encoding=encoding)
+    return EncodedResponse(body, encoding)
+
+
+@router.get("/{book_id}/similar", response_model=list[BookRankSchema])
+async def get_similar_books(
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    encoding: BodyEncodingDep,
+    book_id: int,
+    k: Annotated[int, Query(ge=1, le=SIMILAR_TOP_K)] = 10,
+) -> EncodedResponse:
+    body = await services.get_similar_books(session, book_id, k, encoding=encoding)
+    return EncodedResponse(body, encoding)
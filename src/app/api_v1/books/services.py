@@ -1,57 +1,316 @@
-import re
-
-from sqlalchemy import select
+from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.models import Book
-from app.api_v1.books.crud import get_book_from_db
+from app.api_v1.books import (
+    fragments,
+    fuzzy,
+    leaderboard,
+    raw,
+    recommendations,
+    similarity,
+    suggest,
+)
+from app.api_v1.books.crud import (
+    BOOK_FACETS,
+    get_book_counter_totals,
+    get_book_facet_counts,
+    get_book_from_db,
+    get_book_ids_from_db,
+    get_book_rating_distribution,
+    get_book_rows_from_db,
+    search_books_by_trigram,
+)
+from app.core import settings
+from app.database.db_helper import is_postgres, is_replica, uses_asyncpg
 from app.schemas.book import (
+    BookCountersSchema,
+    BookFacetBucketSchema,
+    BookFacetsSchema,
+    BookFacetValueSchema,
     BookFilterSchema,
-    BookGetSchema,
+    BookPartialSchema,
+    BookRatingsSchema,
+    BookSuggestSchema,
+    BOOK_BATCH_MAX_IDS,
+    BOOK_FACET_PRICE_BUCKET,
+    BOOK_FACET_YEAR_BUCKET,
+    BOOK_FIELDS,
+    BOOK_SCORE_MAX,
+    BOOK_SCORE_MIN,
+)
+from app.utils.cache import (
+    BOOK_FACETS_CACHE_NAMESPACE,
+    BOOK_RATINGS_CACHE_EXPIRE,
+    BOOK_RATINGS_CACHE_NAMESPACE,
+    cache_generation,
+    cache_get_many,
+    cache_set_many,
+    filter_signature,
 )
+from app.utils.serialization import JSON_ENCODING, BodyEncoding, dump_rows
+
+
+def parse_book_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return list(BOOK_FIELDS)
+    requested = list(dict.fromkeys(["id", *fields.split(",")]))
+    unknown = [field for field in requested if field not in BOOK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return requested
+
+
+def raw_reads(session: AsyncSession) -> bool:
+    return settings.db_raw_reads and uses_asyncpg(session)
+
+
+def book_projection(book: Book, fields: list[str]) -> BookPartialSchema:
+    # читаем только загруженные атрибуты: остальные load_only не выбирал
+    return BookPartialSchema(**{field: getattr(book, field) for field in fields})
 
 
 async def get_all_books(
     session: AsyncSession,
     filters: BookFilterSchema,
-) -> list[BookGetSchema]:
-    query = await session.execute(select(Book))
-    books = query.scalars().all()
-    # Фильтрация по строковым полям (title, author, genre, description) с частичным совпадением
-    for field, value in [
-        ("title", filters.title),
-        ("author", filters.author),
-        ("genre", filters.genre),
-        ("description", filters.description),
-    ]:
-        if value:
-            # Игнорируем регистр и используем частичное совпадение
-            pattern = re.compile(re.escape(value.lower()), re.IGNORECASE)
-            books = [
-                book for book in books if pattern.search(getattr(book, field).lower())
-            ]
-
-    # Фильтрация по числовым полям (year, price, times_bought, times_returned, rating)
-    for field, min_val, max_val in [
-        ("year", filters.year_min, filters.year_max),
-        ("price", filters.price_min, filters.price_max),
-        ("times_bought", filters.times_bought_min, filters.times_bought_max),
-        ("times_returned", filters.times_returned_min, filters.times_returned_max),
-        ("rating", filters.rating_min, filters.rating_max),
-    ]:
-        if min_val is not None:
-            books = [book for book in books if getattr(book, field) >= min_val]
-        if max_val is not None:
-            books = [book for book in books if getattr(book, field) <= max_val]
-    return [BookGetSchema.model_validate(book) for book in books]
+    fields: str | None = None,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    """Returns the encoded list; routers send it as is."""
+    if not fields:
+        # полные книги собираем из готовых фрагментов, из базы — только id
+        if raw_reads(session):
+            book_ids = await raw.fetch_book_ids(session, filters)
+        else:
+            book_ids = await get_book_ids_from_db(session, filters)
+        found = await fragments.get_many(session, book_ids, encoding)
+        return fragments.join(
+            (found[book_id] for book_id in book_ids if book_id in found), encoding
+        )
+    book_fields = parse_book_fields(fields)
+    if raw_reads(session):
+        rows = await raw.fetch_book_rows(session, filters, book_fields)
+    else:
+        rows = await get_book_rows_from_db(session, filters, book_fields)
+    return dump_rows(book_fields, rows, encoding)
 
 
 async def get_book(
     session: AsyncSession,
     book_id: int,
-) -> BookGetSchema:
+    fields: str | None = None,
+) -> BookPartialSchema:
+    book_fields = parse_book_fields(fields)
+    if raw_reads(session):
+        row = await raw.fetch_book_row(session, book_id, book_fields)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Book not found",
+            )
+        return BookPartialSchema(**dict(zip(book_fields, row)))
+    book_from_db = await get_book_from_db(session, book_id, book_fields)
+    return book_projection(book_from_db, book_fields)
+
+
+async def get_books_batch(
+    session: AsyncSession,
+    book_ids: list[int],
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    """Returns an encoded BookBatchResponseSchema."""
+    book_ids = list(dict.fromkeys(book_ids))
+    if len(book_ids) > BOOK_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many ids, at most {BOOK_BATCH_MAX_IDS} per request",
+        )
+    found = await fragments.get_many(session, book_ids, encoding)
+    return encoding.object(
+        {
+            "books": fragments.join(
+                (found[book_id] for book_id in book_ids if book_id in found), encoding
+            ),
+            "missing_ids": encoding.dumps(
+                [book_id for book_id in book_ids if book_id not in found]
+            ),
+        }
+    )
+
+
+async def get_ranked_books(
+    session: AsyncSession,
+    ranking: list[tuple[int, float]],
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    """Returns an encoded list of BookRankSchema."""
+    found = await fragments.get_many(
+        session, [book_id for book_id, _ in ranking], encoding
+    )
+    return fragments.join(
+        (
+            encoding.object(
+                {"book": found[book_id], "score": encoding.dumps(round(score, 4))}
+            )
+            for book_id, score in ranking
+            if book_id in found
+        ),
+        encoding,
+    )
+
+
+async def get_top_books(
+    session: AsyncSession,
+    k: int,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    await leaderboard.ensure_built(session)
+    return await get_ranked_books(session, leaderboard.bestsellers.top(k), encoding)
+
+
+async def get_trending_books(
+    session: AsyncSession,
+    k: int,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    await leaderboard.ensure_built(session)
+    return await get_ranked_books(session, leaderboard.trending.top(k), encoding)
+
+
+async def get_also_bought_books(
+    session: AsyncSession,
+    book_id: int,
+    k: int,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    await recommendations.ensure_built(session)
+    return await get_ranked_books(
+        session, recommendations.co_purchases.also_bought(book_id, k), encoding
+    )
+
+
+async def get_similar_books(
+    session: AsyncSession,
+    book_id: int,
+    k: int,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    await similarity.ensure_built(session)
+    return await get_ranked_books(
+        session, similarity.similar_books.similar(book_id, k), encoding
+    )
+
+
+async def get_book_ratings(
+    session: AsyncSession,
+    book_id: int,
+) -> BookRatingsSchema:
+    [cached] = await cache_get_many(BOOK_RATINGS_CACHE_NAMESPACE, [book_id])
+    if cached is not None:
+        return BookRatingsSchema.model_validate_json(cached)
     book_from_db = await get_book_from_db(session, book_id)
-    return BookGetSchema.model_validate(book_from_db)
+    distribution = await get_book_rating_distribution(session, book_id)
+    ratings = BookRatingsSchema(
+        book_id=book_id,
+        rating=book_from_db.rating,
+        ratings_count=book_from_db.ratings_count,
+        distribution={
+            score: distribution.get(score, 0)
+            for score in range(BOOK_SCORE_MIN, BOOK_SCORE_MAX + 1)
+        },
+    )
+    if not is_replica(session):
+        await cache_set_many(
+            BOOK_RATINGS_CACHE_NAMESPACE,
+            {book_id: ratings.model_dump_json()},
+            expire=BOOK_RATINGS_CACHE_EXPIRE,
+        )
+    return ratings
+
+
+async def get_book_counters(
+    session: AsyncSession,
+    book_id: int,
+) -> BookCountersSchema:
+    totals = await get_book_counter_totals(session, book_id)
+    if totals is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Book not found",
+        )
+    times_bought, times_returned = totals
+    return BookCountersSchema(
+        book_id=book_id,
+        times_bought=times_bought,
+        times_returned=times_returned,
+    )
+
+
+async def get_book_facets(
+    session: AsyncSession,
+    filters: BookFilterSchema,
+) -> BookFacetsSchema:
+    # поколение в ключе: админская запись сбрасывает все фасеты одним INCR
+    generation = await cache_generation(BOOK_FACETS_CACHE_NAMESPACE)
+    key = f"{generation}:{filter_signature(filters)}"
+    [cached] = await cache_get_many(BOOK_FACETS_CACHE_NAMESPACE, [key])
+    if cached is not None:
+        return BookFacetsSchema.model_validate_json(cached)
+
+    total = 0
+    counts = {facet: [] for facet in BOOK_FACETS}
+    bucket_sizes = {"year": BOOK_FACET_YEAR_BUCKET, "price": BOOK_FACET_PRICE_BUCKET}
+    for facet, value, count in await get_book_facet_counts(session, filters):
+        if facet == "total":
+            total = count
+        elif facet in bucket_sizes:
+            start = int(value)
+            counts[facet].append(
+                BookFacetBucketSchema(
+                    min=start, max=start + bucket_sizes[facet] - 1, count=count
+                )
+            )
+        else:
+            counts[facet].append(BookFacetValueSchema(value=value, count=count))
+    for facet in ("genre", "author"):
+        counts[facet].sort(key=lambda item: (-item.count, item.value))
+    for facet in bucket_sizes:
+        counts[facet].sort(key=lambda item: item.min)
+
+    facets = BookFacetsSchema(total=total, **counts)
+    if not is_replica(session):
+        await cache_set_many(BOOK_FACETS_CACHE_NAMESPACE, {key: facets.model_dump_json()})
+    return facets
+
+
+async def get_book_suggestions(
+    session: AsyncSession,
+    q: str,
+    k: int,
+) -> list[BookSuggestSchema]:
+    await suggest.ensure_built(session)
+    return [
+        BookSuggestSchema(id=book_id, title=title, author=author)
+        for book_id, title, author in suggest.suggestions.suggest(q, k)
+    ]
+
+
+async def search_books(
+    session: AsyncSession,
+    q: str,
+    k: int,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    threshold = settings.fuzzy_search_threshold
+    if is_postgres(session):
+        ranking = await search_books_by_trigram(session, q, threshold, k)
+    else:
+        await fuzzy.ensure_built(session)
+        ranking = fuzzy.trigrams.search(q, threshold, k)
+    return await get_ranked_books(session, ranking, encoding)
 
 
 class A:
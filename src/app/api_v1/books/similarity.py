@@ -0,0 +1,239 @@
+import asyncio
+import time
+import zlib
+from collections import Counter
+from collections.abc import Iterator
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db_helper import primary_session
+from app.database.models import Book
+from app.utils.text import char_ngrams, normalize
+
+SIMILAR_TOP_K = 20
+# поля книги, из которых строится вектор
+SIMILARITY_FIELDS = ("title", "author", "genre", "description")
+SIMILARITY_FEATURES = 2**18
+# размер блока плотной матрицы сходства (строк x книг), чтобы память не росла как n^2
+SIMILARITY_BLOCK_CELLS = 4_000_000
+# одиночные админские изменения применяются к индексу сразу, массовые сбрасывают
+# его; интервал догоняет другие воркеры и дрейф idf
+REBUILD_INTERVAL_SECONDS = 30 * 60
+
+
+def book_features(title: str, author: str, genre: str, description: str) -> Iterator[str]:
+    for text in (title, author, genre, description):
+        yield from char_ngrams(text)
+    # точное совпадение автора и жанра весит больше, чем общие n-граммы
+    yield f"author:{normalize(author)}"
+    yield f"genre:{normalize(genre)}"
+
+
+class SimilarityIndex:
+    """Content similarity of books over hashed character n-gram TF-IDF vectors.
+
+    Rows are L2-normalised, so cosine similarity is a plain sparse product;
+    it is computed block by block and only the top-k neighbours of every
+    book are kept. A single added, edited or removed book is applied in
+    place: its row is recomputed against all books and only the lists it
+    enters or leaves are touched.
+    """
+
+    def __init__(self, top_k: int = SIMILAR_TOP_K, n_features: int = SIMILARITY_FEATURES):
+        self.top_k = top_k
+        self.n_features = n_features
+        self.reset()
+
+    def reset(self) -> None:
+        self.neighbors: dict[int, list[tuple[int, float]]] = {}
+        self.book_ids = np.empty(0, dtype=np.int64)
+        self.vectors: sparse.csr_matrix | None = None
+        self.idf: np.ndarray | None = None
+
+    def term_frequencies(self, books: list[tuple[int, str, str, str, str]]) -> sparse.csr_matrix:
+        rows, cols, data = [], [], []
+        for i, (_, *fields) in enumerate(books):
+            counts = Counter(
+                zlib.crc32(feature.encode()) % self.n_features
+                for feature in book_features(*fields)
+            )
+            rows += [i] * len(counts)
+            cols += counts.keys()
+            data += counts.values()
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), (rows, cols)),
+            shape=(len(books), self.n_features),
+        )
+        tf.data = 1 + np.log(tf.data)
+        return tf
+
+    @staticmethod
+    def weigh(tf: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        tfidf = tf.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return (sparse.diags(1 / norms) @ tfidf).tocsr()
+
+    def vectorize(
+        self, books: list[tuple[int, str, str, str, str]]
+    ) -> tuple[sparse.csr_matrix, np.ndarray]:
+        tf = self.term_frequencies(books)
+        df = np.bincount(tf.indices, minlength=self.n_features)
+        idf = np.log((1 + len(books)) / (1 + df)).astype(np.float32) + 1
+        return self.weigh(tf, idf), idf
+
+    def neighbor_rows(
+        self,
+        vectors: sparse.csr_matrix,
+        book_ids: np.ndarray,
+        rows: np.ndarray,
+    ) -> Iterator[tuple[int, list[tuple[int, float]]]]:
+        n = len(book_ids)
+        k = min(self.top_k, n - 1)
+        if k <= 0:
+            for row in rows:
+                yield int(book_ids[row]), []
+            return
+        vectors_t = vectors.T.tocsc()
+        block = max(SIMILARITY_BLOCK_CELLS // n, 1)
+        for start in range(0, len(rows), block):
+            chunk = rows[start : start + block]
+            scores = (vectors[chunk] @ vectors_t).toarray()
+            scores[np.arange(len(chunk)), chunk] = 0
+            # argpartition даёт k лучших без сортировки, дальше сортируем только их
+            top = np.sort(np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for i, row in enumerate(chunk):
+                yield int(book_ids[row]), [
+                    (int(book_ids[col]), float(score))
+                    for col, score in zip(top[i], top_scores[i])
+                    if score > 0
+                ]
+
+    def build(self, books: list[tuple[int, str, str, str, str]]) -> None:
+        # собираем в новый словарь и подменяем целиком: сборка идёт в потоке
+        book_ids = np.asarray([book[0] for book in books], dtype=np.int64)
+        vectors, idf = self.vectorize(books)
+        self.neighbors = dict(self.neighbor_rows(vectors, book_ids, np.arange(len(books))))
+        self.book_ids, self.vectors, self.idf = book_ids, vectors, idf
+
+    def update(self, book: tuple[int, str, str, str, str]) -> None:
+        """Adds or re-vectorizes one book with the idf of the last build."""
+        if self.vectors is None:
+            return
+        book_id = book[0]
+        vector = self.weigh(self.term_frequencies([book]), self.idf)
+        rows = np.flatnonzero(self.book_ids == book_id)
+        if len(rows):
+            row = int(rows[0])
+            parts = [self.vectors[:row], vector, self.vectors[row + 1 :]]
+        else:
+            row = len(self.book_ids)
+            parts = [self.vectors, vector]
+            self.book_ids = np.append(self.book_ids, book_id)
+        self.vectors = sparse.vstack(parts, format="csr")
+        self.refresh(book_id, row)
+
+    def remove(self, book_id: int) -> None:
+        if self.vectors is None:
+            return
+        keep = self.book_ids != book_id
+        if keep.all():
+            return
+        self.vectors = self.vectors[keep]
+        self.book_ids = self.book_ids[keep]
+        self.neighbors.pop(book_id, None)
+        self.refresh(book_id, None)
+
+    def refresh(self, book_id: int, row: int | None) -> None:
+        # списки, где книга уже была, считаются заново: её место мог занять другой сосед
+        affected = {
+            other
+            for other, neighbors in self.neighbors.items()
+            if other != book_id and any(neighbor == book_id for neighbor, _ in neighbors)
+        }
+        rows = np.flatnonzero(np.isin(self.book_ids, list(affected)))
+        if row is not None:
+            scores = (self.vectors[row] @ self.vectors.T).toarray().ravel()
+            scores[row] = 0
+            k = min(self.top_k, len(self.book_ids) - 1)
+            # в остальные списки книга попадает, только если вытесняет последнего
+            for col in np.flatnonzero(scores > 0):
+                other = int(self.book_ids[col])
+                if other in affected:
+                    continue
+                score = float(scores[col])
+                neighbors = self.neighbors.get(other, [])
+                if len(neighbors) < k or score > neighbors[-1][1]:
+                    neighbors = sorted([*neighbors, (book_id, score)], key=lambda item: -item[1])
+                    self.neighbors[other] = neighbors[:k]
+            rows = np.append(rows, row)
+        self.neighbors.update(self.neighbor_rows(self.vectors, self.book_ids, rows))
+
+    def similar(self, book_id: int, k: int) -> list[tuple[int, float]]:
+        return self.neighbors.get(book_id, [])[:k]
+
+
+similar_books = SimilarityIndex()
+
+_built_at: float | None = None
+# растёт с каждым сбросом: сборка, во время которой был сброс, не считается свежей
+_generation = 0
+_lock = asyncio.Lock()
+
+
+def reset() -> None:
+    global _built_at
+    similar_books.reset()
+    _built_at = None
+
+
+def invalidate() -> None:
+    global _built_at, _generation
+    _generation += 1
+    _built_at = None
+
+
+def book_row(book: Book) -> tuple[int, str, str, str, str]:
+    return book.id, book.title, book.author, book.genre, book.description
+
+
+async def rebuild(session: AsyncSession) -> None:
+    global _built_at
+    generation = _generation
+    query = await session.execute(
+        select(Book.id, Book.title, Book.author, Book.genre, Book.description)
+    )
+    # векторизация и произведение матриц — CPU, не держим на них event loop
+    await asyncio.to_thread(similar_books.build, [tuple(row) for row in query.all()])
+    if generation == _generation:
+        _built_at = time.time()
+
+
+async def update_book(book: Book) -> None:
+    # под тем же замком, что и сборка: идущая сборка могла прочитать книгу до изменения
+    async with _lock:
+        if _built_at is not None:
+            await asyncio.to_thread(similar_books.update, book_row(book))
+
+
+async def remove_book(book_id: int) -> None:
+    async with _lock:
+        if _built_at is not None:
+            await asyncio.to_thread(similar_books.remove, book_id)
+
+
+async def ensure_built(session: AsyncSession) -> None:
+    if _built_at is not None and time.time() - _built_at < REBUILD_INTERVAL_SECONDS:
+        return
+    async with _lock:
+        if _built_at is None or time.time() - _built_at >= REBUILD_INTERVAL_SECONDS:
+            # индекс живёт до следующей пересборки: отставшая реплика не годится
+            async with primary_session(session) as primary:
+                await rebuild(primary)
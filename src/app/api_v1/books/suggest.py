@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api_v1.books.index_state import IndexState
+from app.database.models import Book
+from app.utils.text import words
+
+BOOK_SUGGEST_MAX_K = 20
+BOOK_SUGGEST_CACHE_NAMESPACE = "book_suggest"
+# поля книги, которые видит индекс
+SUGGEST_FIELDS = ("title", "author", "times_bought")
+# для коротких префиксов диапазон в массиве огромный — их top-k считаем заранее
+SHORT_PREFIX_LEN = 3
+# times_bought меняется покупками; админские записи применяются к индексу сразу
+REBUILD_INTERVAL_SECONDS = 10 * 60
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(words(text))
+
+
+def book_keys(title: str, author: str) -> list[str]:
+    keys = []
+    for text in (title, author):
+        parts = words(text)
+        keys += [" ".join(parts[i:]) for i in range(len(parts))]
+    return keys
+
+
+def short_prefixes(keys: list[str]) -> set[str]:
+    return {key[:n] for key in keys for n in range(1, min(len(key), SHORT_PREFIX_LEN) + 1)}
+
+
+class SuggestIndex:
+    """Sorted array of normalized title and author keys for prefix lookups.
+
+    Every word start of a title or an author is a key ("норвежский лес" and
+    "лес"), so a prefix query is two bisects plus a top-k over the matching
+    range. Prefixes up to SHORT_PREFIX_LEN characters are answered from
+    precomputed lists.
+    """
+
+    def __init__(self, top_k: int = BOOK_SUGGEST_MAX_K):
+        self.top_k = top_k
+        self.reset()
+
+    def reset(self) -> None:
+        self.keys: list[str] = []
+        self.key_book_ids: list[int] = []
+        self.books: dict[int, tuple[str, str, int]] = {}
+        self.short: dict[str, list[int]] = {}
+
+    def _rank(self, book_id: int) -> tuple[int, int]:
+        return self.books[book_id][2], -book_id
+
+    def build(self, books: list[tuple[int, str, str, int]]) -> None:
+        self.reset()
+        entries = []
+        for book_id, title, author, times_bought in books:
+            self.books[book_id] = (title, author, times_bought)
+            entries += [(key, book_id) for key in book_keys(title, author)]
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.key_book_ids = [book_id for _, book_id in entries]
+
+        groups: dict[str, set[int]] = {}
+        for key, book_id in entries:
+            for n in range(1, min(len(key), SHORT_PREFIX_LEN) + 1):
+                groups.setdefault(key[:n], set()).add(book_id)
+        self.short = {
+            prefix: heapq.nlargest(self.top_k, book_ids, key=self._rank)
+            for prefix, book_ids in groups.items()
+        }
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        lo = bisect_left(self.keys, prefix)
+        return lo, bisect_right(self.keys, prefix + "\U0010ffff", lo)
+
+    def _rank_short(self, prefix: str) -> None:
+        lo, hi = self._range(prefix)
+        book_ids = set(self.key_book_ids[lo:hi])
+        if book_ids:
+            self.short[prefix] = heapq.nlargest(self.top_k, book_ids, key=self._rank)
+        else:
+            self.short.pop(prefix, None)
+
+    def remove(self, book_id: int) -> None:
+        if book_id not in self.books:
+            return
+        title, author, _ = self.books[book_id]
+        keys = book_keys(title, author)
+        for key in set(keys):
+            lo = bisect_left(self.keys, key)
+            hi = bisect_right(self.keys, key, lo)
+            for i in reversed(range(lo, hi)):
+                if self.key_book_ids[i] == book_id:
+                    del self.keys[i]
+                    del self.key_book_ids[i]
+        del self.books[book_id]
+        # на освободившееся место в списке короткого префикса встаёт следующая книга
+        for prefix in short_prefixes(keys):
+            if book_id in self.short.get(prefix, ()):
+                self._rank_short(prefix)
+
+    def update(self, book: tuple[int, str, str, int]) -> None:
+        book_id, title, author, times_bought = book
+        self.remove(book_id)
+        self.books[book_id] = (title, author, times_bought)
+        keys = book_keys(title, author)
+        for key in keys:
+            i = bisect_right(self.keys, key)
+            self.keys.insert(i, key)
+            self.key_book_ids.insert(i, book_id)
+        for prefix in short_prefixes(keys):
+            ranked = self.short.get(prefix, [])
+            if book_id in ranked:
+                continue
+            if len(ranked) < self.top_k or self._rank(book_id) > self._rank(ranked[-1]):
+                self.short[prefix] = heapq.nlargest(
+                    self.top_k, [*ranked, book_id], key=self._rank
+                )
+
+    def suggest(self, query: str, k: int) -> list[tuple[int, str, str]]:
+        prefix = normalize_key(query)
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX_LEN:
+            book_ids = self.short.get(prefix, [])[:k]
+        else:
+            lo, hi = self._range(prefix)
+            book_ids = heapq.nlargest(k, set(self.key_book_ids[lo:hi]), key=self._rank)
+        return [(book_id, *self.books[book_id][:2]) for book_id in book_ids]
+
+
+suggestions = SuggestIndex()
+
+
+async def build(session: AsyncSession) -> None:
+    global suggestions
+    query = await session.execute(
+        select(Book.id, Book.title, Book.author, Book.times_bought)
+    )
+    index = SuggestIndex()
+    await asyncio.to_thread(index.build, [tuple(row) for row in query.all()])
+    # подменяем индекс целиком, чтобы запросы не видели его наполовину собранным
+    suggestions = index
+
+
+state = IndexState(BOOK_SUGGEST_CACHE_NAMESPACE, REBUILD_INTERVAL_SECONDS, build)
+
+
+def reset() -> None:
+    suggestions.reset()
+    state.reset()
+
+
+async def invalidate() -> None:
+    await state.invalidate()
+
+
+async def rebuild(session: AsyncSession) -> None:
+    await state.rebuild(session)
+
+
+async def ensure_built(session: AsyncSession) -> None:
+    await state.ensure_built(session)
+
+
+async def update_book(book: Book) -> None:
+    # правка одной книги — вставки в отсортированный массив, без пересборки
+    suggestions.update((book.id, book.title, book.author, book.times_bought))
+    await state.changed()
+
+
+async def remove_book(book_id: int) -> None:
+    suggestions.remove(book_id)
+    await state.changed()
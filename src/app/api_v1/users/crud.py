@@ -1,8 +1,8 @@
-from sqlalchemy import select
+from sqlalchemy import case, delete, exists, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.database.models import User
+from app.database.models import Book, Rating, User, user_books_table
 
 
 async def get_user_from_db_by_username(
@@ -24,3 +24,116 @@ async def get_user_from_db_by_uid(
         .options(selectinload(User.user_actions))
     )
     return user.scalar_one_or_none()
+
+
+async def change_user_money(
+    session: AsyncSession,
+    uid: str,
+    amount: int,
+) -> int | None:
+    """Adds amount (may be negative); None if the balance would go below zero."""
+    query = await session.execute(
+        update(User)
+        .where(User.user_id == uid, User.money + amount >= 0)
+        .values(money=User.money + amount)
+        .returning(User.money)
+    )
+    return query.scalar_one_or_none()
+
+
+async def user_owns_book(
+    session: AsyncSession,
+    uid: str,
+    book_id: int,
+) -> bool:
+    query = await session.execute(
+        select(
+            exists().where(
+                user_books_table.c.user_id == uid,
+                user_books_table.c.book_id == book_id,
+            )
+        )
+    )
+    return query.scalar()
+
+
+async def get_user_book_ids(
+    session: AsyncSession,
+    uid: str,
+) -> list[int]:
+    query = await session.execute(
+        select(user_books_table.c.book_id).where(user_books_table.c.user_id == uid)
+    )
+    return list(query.scalars().all())
+
+
+async def get_user_rating(
+    session: AsyncSession,
+    uid: str,
+    book_id: int,
+) -> int | None:
+    # блокируем строку оценки, чтобы параллельная переоценка не сбила среднее
+    query = await session.execute(
+        select(Rating.score)
+        .where(Rating.user_id == uid, Rating.book_id == book_id)
+        .with_for_update()
+    )
+    return query.scalar_one_or_none()
+
+
+async def upsert_user_rating(
+    session: AsyncSession,
+    uid: str,
+    book_id: int,
+    score: int,
+    old_score: int | None,
+) -> Book:
+    # среднее пересчитывается от текущих значений строки книги, без AVG по всем оценкам
+    if old_score is None:
+        await session.execute(
+            insert(Rating).values(user_id=uid, book_id=book_id, score=score)
+        )
+        values = {
+            Book.rating: (Book.rating * Book.ratings_count + score)
+            / (Book.ratings_count + 1),
+            Book.ratings_count: Book.ratings_count + 1,
+        }
+    else:
+        await session.execute(
+            update(Rating)
+            .where(Rating.user_id == uid, Rating.book_id == book_id)
+            .values(score=score)
+        )
+        values = {Book.rating: Book.rating + (score - old_score) / Book.ratings_count}
+    query = await session.execute(
+        update(Book).where(Book.id == book_id).values(values).returning(Book)
+    )
+    return query.scalar_one()
+
+
+async def delete_user_ratings(
+    session: AsyncSession,
+    uid: str,
+) -> list[int]:
+    query = await session.execute(
+        update(Book)
+        .where(Book.id == Rating.book_id, Rating.user_id == uid)
+        .values(
+            {
+                Book.rating: case(
+                    (
+                        Book.ratings_count > 1,
+                        (Book.rating * Book.ratings_count - Rating.score)
+                        / (Book.ratings_count - 1),
+                    ),
+                    else_=0,
+                ),
+                Book.ratings_count: Book.ratings_count - 1,
+            }
+        )
+        .returning(Book.id)
+        .execution_options(synchronize_session=False)
+    )
+    book_ids = list(query.scalars().all())
+    await session.execute(delete(Rating).where(Rating.user_id == uid))
+    return book_ids
@@ -4,7 +4,7 @@ from fastapi_cache.decorator import cache
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api_v1.users import services
-from app.database import get_session
+from app.database import get_read_session, get_session
 from app.schemas.jwt import TokenInfoSchema
 from app.schemas.user import (
     UserAddFundsResponseSchema,
@@ -12,8 +12,11 @@ from app.schemas.user import (
     DeleteAccountResponse,
     BuyBookResponseSchema,
     ReturnBookResponseSchema,
+    RateBookSchema,
+    RateBookResponseSchema,
 )
 from app.utils.jwt_funcs import get_current_auth_user
+from app.utils.serialization import NegotiatedResponse, NegotiatedRoute
 from app.schemas.user import (
     UserSchema,
     UserSignupSchema,
@@ -28,6 +31,8 @@ from app.schemas.account import AccountSigninSchema
 router = APIRouter(
     prefix="/user",
     tags=["User"],
+    route_class=NegotiatedRoute,
+    default_response_class=NegotiatedResponse,
 )
 
 
@@ -53,7 +58,7 @@ async def sign_in(
 @cache(expire=60)
 @router.get("/me", response_model=UserGetSelfSchema)
 async def get_my_data(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    session: Annotated[AsyncSession, Depends(get_read_session)],
     user_verifier: UserGetVerifiedSchema = Depends(get_current_auth_user),
 ) -> UserGetSelfSchema:
     return await services.get_my_data(session, user_verifier)
@@ -86,6 +91,16 @@ async def return_book(
     return await services.return_book(session, book_id, user_verifier)
 
 
+@router.put("/me/rate-book/{book_id}", response_model=RateBookResponseSchema)
+async def rate_book(
+    session: Annotated[AsyncSession, Depends(get_session)],
+    book_id: int,
+    data: RateBookSchema,
+    user_verifier: UserSchema = Depends(get_current_auth_user),
+) -> RateBookResponseSchema:
+    return await services.rate_book(session, book_id, data, user_verifier)
+
+
 @router.delete("/me", response_model=DeleteAccountResponse)
 async def delete_account(
     data: UserDeleteSchema,
@@ -1,12 +1,12 @@
 import uuid
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete
+from sqlalchemy import delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from app.database import user_books_table
-from app.database.models import User, UserActions
+from app.database.models import Book, User, UserActions
 from app.schemas.admin import AdminCreateJWTSchema
 from app.schemas.jwt import TokenInfoSchema
 from app.schemas.user import (
@@ -16,8 +16,11 @@ from app.schemas.user import (
     DeleteAccountResponse,
     BuyBookResponseSchema,
     ReturnBookResponseSchema,
+    RateBookSchema,
+    RateBookResponseSchema,
 )
 from app.utils import jwt_utils
+from app.utils.cache import BOOK_RATINGS_CACHE_NAMESPACE, cache_delete
 from app.utils.jwt_funcs import get_admin_from_db_by_username
 from app.utils.jwt_utils import (
     create_user_access_token,
@@ -35,8 +38,21 @@ from app.schemas.user import (
 from app.schemas.account import AccountSigninSchema
 from app.schemas.book import BookSchema, BookGetSchema
 
-from app.api_v1.users.crud import get_user_from_db_by_uid, get_user_from_db_by_username
-from app.api_v1.books.crud import get_book_from_db
+from app.api_v1.users.crud import (
+    change_user_money,
+    delete_user_ratings,
+    get_user_from_db_by_uid,
+    get_user_from_db_by_username,
+    get_user_rating,
+    upsert_user_rating,
+    user_owns_book,
+)
+from app.api_v1.books import fragments, leaderboard, recommendations
+from app.api_v1.books.crud import (
+    get_book_counter_totals,
+    get_book_from_db,
+    increment_book_counter,
+)
 
 
 async def sign_up(
@@ -61,7 +77,6 @@ async def sign_up(
         session.add(action)
 
         await session.commit()
-        await session.refresh(user)
         return UserGetSchema.model_validate(user)
     except IntegrityError:
         raise HTTPException(
@@ -110,9 +125,7 @@ async def add_money(
     data: UserAddFundsSchema,
     user_verifier: UserSchema,
 ) -> UserAddFundsResponseSchema:
-    user_from_db = await get_user_from_db_by_uid(session, user_verifier.user_id)
-    user_from_db.money += data.amount
-    balance = user_from_db.money
+    balance = await change_user_money(session, user_verifier.user_id, data.amount)
 
     # update user_actions in db
     new_action = {
@@ -128,12 +141,24 @@ async def add_money(
     return UserAddFundsResponseSchema(message="Funds added", new_balance=balance)
 
 
+async def with_counter_totals(
+    session: AsyncSession,
+    book: Book,
+    counter: str,
+) -> BookGetSchema:
+    # в books счётчики отстают на шарды, ещё не перенесённые flush_book_counters;
+    # читаем их до записи и прибавляем изменение самого запроса
+    times_bought, times_returned = await get_book_counter_totals(session, book.id)
+    totals = {"times_bought": times_bought, "times_returned": times_returned}
+    totals[counter] += 1
+    return BookGetSchema.model_validate(book).model_copy(update=totals)
+
+
 async def buy_book(
     session: AsyncSession,
     book_id: int,
     user_verifier: UserSchema,
 ) -> BuyBookResponseSchema:
-    user_from_db = await get_user_from_db_by_uid(session, user_verifier.user_id)
     book_from_db = await get_book_from_db(session, book_id)
 
     if not book_from_db:
@@ -141,19 +166,41 @@ async def buy_book(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Such book doesn't appear to exist",
         )
-    if book_from_db.price > user_from_db.money:
+    if book_from_db.price > user_verifier.money:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have enough money",
         )
-    if user_from_db in book_from_db.buyers:
+    if await user_owns_book(session, user_verifier.user_id, book_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You already have this book bought",
+        )
+    book = await with_counter_totals(session, book_from_db, "times_bought")
+    try:
+        await session.execute(
+            insert(user_books_table).values(
+                user_id=user_verifier.user_id, book_id=book_id
+            )
+        )
+    except IntegrityError:
+        # параллельный запрос купил ту же книгу между проверкой и вставкой
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You already have this book bought",
         )
-    user_from_db.money -= book_from_db.price
-    book_from_db.times_bought += 1
-    book_from_db.buyers.append(user_from_db)
+    # баланс проверяется ещё раз в самом UPDATE: параллельная покупка могла его изменить
+    balance = await change_user_money(
+        session, user_verifier.user_id, -book_from_db.price
+    )
+    if balance is None:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have enough money",
+        )
+    await increment_book_counter(session, book_id, "times_bought")
 
     # update user_actions in db
     new_action = {
@@ -161,15 +208,17 @@ async def buy_book(
         "action_type": "buy_book",
         "details": f"bought a book with id={book_from_db.id}",
         "total": book_from_db.price,
+        "book_id": book_from_db.id,
     }
     action = UserActions(**new_action)
     session.add(action)
     await session.commit()
-    await session.refresh(book_from_db)
+    leaderboard.record_purchase(book_id)
+    await recommendations.record_purchase(session, user_verifier.user_id, book_id)
 
     return BuyBookResponseSchema(
         message="process complete!",
-        book=BookGetSchema.model_validate(book_from_db),
+        book=book,
     )
 
 
@@ -178,7 +227,6 @@ async def return_book(
     book_id: int,
     user_verifier: UserSchema,
 ) -> ReturnBookResponseSchema:
-    user_from_db = await get_user_from_db_by_uid(session, user_verifier.user_id)
     book_from_db = await get_book_from_db(session, book_id)
 
     if not book_from_db:
@@ -186,15 +234,21 @@ async def return_book(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Such book doesn't appear to exist",
         )
-    if user_from_db not in book_from_db.buyers:
+    if not await user_owns_book(session, user_verifier.user_id, book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Such book doesn't appear in your books list",
         )
+    book = await with_counter_totals(session, book_from_db, "times_returned")
 
-    user_from_db.money += book_from_db.price
-    book_from_db.times_returned += 1
-    book_from_db.buyers.remove(user_from_db)
+    await session.execute(
+        delete(user_books_table).where(
+            user_books_table.c.user_id == user_verifier.user_id,
+            user_books_table.c.book_id == book_id,
+        )
+    )
+    await change_user_money(session, user_verifier.user_id, book_from_db.price)
+    await increment_book_counter(session, book_id, "times_returned")
 
     # update user_actions in db
     new_action = {
@@ -202,15 +256,64 @@ async def return_book(
         "action_type": "return_book",
         "details": f"returned a book with id={book_from_db.id}",
         "total": book_from_db.price,
+        "book_id": book_from_db.id,
     }
     action = UserActions(**new_action)
     session.add(action)
 
     await session.commit()
-    await session.refresh(book_from_db)
+    leaderboard.record_return(book_id)
+    await recommendations.record_return(session, user_verifier.user_id, book_id)
 
     return ReturnBookResponseSchema(
         message="process complete!",
+        book=book,
+    )
+
+
+async def rate_book(
+    session: AsyncSession,
+    book_id: int,
+    data: RateBookSchema,
+    user_verifier: UserSchema,
+) -> RateBookResponseSchema:
+    if not await user_owns_book(session, user_verifier.user_id, book_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only rate books you own",
+        )
+    old_score = await get_user_rating(session, user_verifier.user_id, book_id)
+    try:
+        if old_score != data.score:
+            book_from_db = await upsert_user_rating(
+                session, user_verifier.user_id, book_id, data.score, old_score
+            )
+        else:
+            book_from_db = await get_book_from_db(session, book_id)
+
+        # update user_actions in db
+        new_action = {
+            "user_id": user_verifier.user_id,
+            "action_type": "rate_book",
+            "details": f"rated a book with id={book_id}",
+            "total": data.score,
+        }
+        action = UserActions(**new_action)
+        session.add(action)
+        await session.commit()
+    except IntegrityError:
+        # первая оценка пришла дважды одновременно — вторая вставка упала на PK
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Rating is being updated, try again",
+        )
+    await fragments.discard([book_id])
+    await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, [book_id])
+
+    return RateBookResponseSchema(
+        message="Rating saved",
+        score=data.score,
         book=BookGetSchema.model_validate(book_from_db),
     )
 
@@ -230,6 +333,7 @@ async def delete_account(
             user_books_table.c.user_id == user_verifier.user_id
         )
     )
+    rated_book_ids = await delete_user_ratings(session, user_verifier.user_id)
     await session.execute(
         delete(UserActions)
         .where(UserActions.user_id == user_verifier.user_id)
@@ -241,4 +345,6 @@ async def delete_account(
         .execution_options(is_delete_using=True)
     )
     await session.commit()
+    await fragments.discard(rated_book_ids)
+    await cache_delete(BOOK_RATINGS_CACHE_NAMESPACE, rated_book_ids)
     return DeleteAccountResponse(success=True, message="account deleted!")
@@ -11,9 +11,21 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent.parent.parent
 
 
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class AuthJWT(BaseModel):
-    private_key_path: Path = BASE_DIR / "certs" / "jwt-private.pem"
-    public_key_path: Path = BASE_DIR / "certs" / "jwt-public.pem"
+    # ключи не хранятся в репозитории: src/certs/ или пути из окружения
+    private_key_path: Path = Path(
+        os.getenv("JWT_PRIVATE_KEY_PATH", BASE_DIR / "certs" / "jwt-private.pem")
+    )
+    public_key_path: Path = Path(
+        os.getenv("JWT_PUBLIC_KEY_PATH", BASE_DIR / "certs" / "jwt-public.pem")
+    )
     algorithm: str = "RS256"
     access_token_expire_minutes: int = 999
 
@@ -23,6 +35,65 @@ class Settings(BaseSettings):
     db_url: str = os.getenv("DATABASE_URL")
     db_name: str = os.getenv("POSTGRES_DB")
     redis_url: str = os.getenv("REDIS_URL")
+    # пул соединений; значения по умолчанию — как у SQLAlchemy
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", 5))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    db_pool_timeout: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    # -1 — не пересоздавать соединения по возрасту
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", -1))
+    db_pool_pre_ping: bool = env_flag("DB_POOL_PRE_PING")
+    # сколько соединений открыть при старте приложения
+    db_pool_prewarm: int = int(os.getenv("DB_POOL_PREWARM", 5))
+    # LRU подготовленных запросов на каждое соединение asyncpg
+    db_statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # PgBouncer в режиме transaction pooling: без именованных prepared statements
+    db_pgbouncer: bool = env_flag("DB_PGBOUNCER")
+    # карточка книги и каталог читаются запросами прямо на asyncpg, мимо ORM
+    db_raw_reads: bool = env_flag("DB_RAW_READS", True)
+    # реплики для читающих эндпоинтов, через запятую
+    db_replica_urls: list[str] = [
+        url.strip()
+        for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+        if url.strip()
+    ]
+    # сколько секунд не пробовать реплику, которая не дала соединение
+    db_replica_cooldown: float = float(os.getenv("DB_REPLICA_COOLDOWN", 30))
+    # сколько секунд после своей записи клиент читает с primary
+    db_read_your_writes_seconds: float = float(
+        os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5)
+    )
+    # Server-Timing и метрики запросов к базе по каждому эндпоинту
+    sql_stats: bool = env_flag("SQL_STATS")
+    # режим разработки (включает и SQL_STATS): запрос, повторённый столько раз
+    # за один HTTP-запрос, логируется как подозрение на N+1
+    sql_n_plus_one_threshold: int = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 0))
+    # запросы дольше стольких миллисекунд пишутся в журнал медленных; 0 — выключено
+    sql_slow_query_ms: float = float(os.getenv("SQL_SLOW_QUERY_MS", 0))
+    # сколько последних медленных запросов держать в памяти процесса
+    sql_slow_query_buffer: int = int(os.getenv("SQL_SLOW_QUERY_BUFFER", 100))
+    # снимать план медленных SELECT в фоне (EXPLAIN ANALYZE повторно выполняет запрос)
+    sql_slow_query_explain: bool = env_flag("SQL_SLOW_QUERY_EXPLAIN")
+    # не чаще раза в столько секунд для запросов одной формы
+    sql_slow_query_explain_interval: float = float(
+        os.getenv("SQL_SLOW_QUERY_EXPLAIN_INTERVAL", 60)
+    )
+    # строк-счётчиков покупок на книгу: столько покупок одной книги не ждут друг друга
+    book_counter_shards: int = int(os.getenv("BOOK_COUNTER_SHARDS", 8))
+    # раз в столько секунд счётчики переносятся в books; 0 — не в этом процессе
+    book_counter_flush_interval: float = float(
+        os.getenv("BOOK_COUNTER_FLUSH_INTERVAL", 5)
+    )
+    # минимальная доля триграмм запроса, найденных в названии или авторе
+    fuzzy_search_threshold: float = float(os.getenv("FUZZY_SEARCH_THRESHOLD", 0.5))
+    # ответы меньше этого размера (в байтах) не сжимаются
+    compression_minimum_size: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+    compression_brotli_level: int = int(os.getenv("COMPRESSION_BROTLI_LEVEL", 4))
+    compression_zstd_level: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+    # сколько байт сжатых тел держать в памяти процесса
+    compression_cache_size: int = int(
+        os.getenv("COMPRESSION_CACHE_SIZE", 64 * 1024 * 1024)
+    )
 
 
 settings = Settings()
@@ -1,10 +1,12 @@
 from .base import Base
-from .db_helper import get_session
+from .db_helper import get_read_session, get_session
 
 from app.database.models import (
     Book,
+    BookCounterShard,
     Admin,
     User,
+    Rating,
     UserActions,
     user_books_table,
 )
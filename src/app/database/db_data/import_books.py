@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+
+from app.api_v1.admins.services import BOOK_IMPORT_BATCH_SIZE, load_books
+from app.core import settings
+from app.database import get_session
+from app.utils.book_import import SUPPORTED_FORMATS, detect_format, read_book_rows
+
+
+async def main(path: str, fmt: str | None, batch_size: int):
+    # тот же Redis, что у приложения: импорт сбрасывает кэши книг и фасетов
+    redis = aioredis.from_url(settings.redis_url)
+    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    try:
+        async for session in get_session():
+            with open(path, "rb") as stream:
+                rows = read_book_rows(stream, fmt or detect_format(path))
+                report = await load_books(session, rows, batch_size)
+            print(report.model_dump_json(indent=2))
+    finally:
+        await redis.close()
+
+
+if __name__ == "__main__":
+    # python -m app.database.db_data.import_books books.csv
+    parser = argparse.ArgumentParser(description="Bulk import books from CSV/NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", dest="fmt", choices=SUPPORTED_FORMATS)
+    parser.add_argument("--batch-size", type=int, default=BOOK_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.fmt, args.batch_size))
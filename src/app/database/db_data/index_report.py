@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.database.db_helper import engine
+
+# индексы без сканирований с момента сброса статистики; уникальные и PK держат
+# ограничения, их не предлагаем удалять
+UNUSED_INDEXES = text(
+    """
+    SELECT s.relname AS table, s.indexrelname AS index, s.idx_scan AS scans,
+           pg_size_pretty(pg_relation_size(s.indexrelid)) AS size
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    WHERE s.idx_scan <= :max_scans AND NOT i.indisunique AND NOT i.indisprimary
+    ORDER BY pg_relation_size(s.indexrelid) DESC
+    """
+)
+
+# внешние ключи, с которых не начинается ни один индекс: каждый DELETE родителя
+# и каждая выборка детей по ключу читают таблицу целиком
+UNINDEXED_FOREIGN_KEYS = text(
+    """
+    SELECT c.conrelid::regclass::text AS table, c.conname AS constraint,
+           string_agg(a.attname, ', ' ORDER BY k.n) AS columns
+    FROM pg_constraint c
+    CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+    WHERE c.contype = 'f' AND NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = c.conrelid
+          AND (i.indkey::int2[])[0:array_length(c.conkey, 1) - 1] = c.conkey
+    )
+    GROUP BY c.conrelid, c.conname
+    ORDER BY 1, 2
+    """
+)
+
+# таблицы, которые чаще читаются полным сканированием, чем по индексу
+SEQ_SCANNED_TABLES = text(
+    """
+    SELECT relname AS table, seq_scan, seq_tup_read,
+           seq_tup_read / GREATEST(seq_scan, 1) AS rows_per_scan,
+           COALESCE(idx_scan, 0) AS idx_scan, n_live_tup AS live_rows
+    FROM pg_stat_user_tables
+    WHERE seq_scan > COALESCE(idx_scan, 0) AND n_live_tup >= :min_rows
+    ORDER BY seq_tup_read DESC
+    LIMIT :limit
+    """
+)
+
+# самые дорогие запросы: кандидаты на EXPLAIN и новый индекс
+TOP_STATEMENTS = text(
+    """
+    SELECT calls, round(total_exec_time::numeric, 1) AS total_ms,
+           round(mean_exec_time::numeric, 2) AS mean_ms, rows,
+           shared_blks_read + shared_blks_hit AS blocks, query
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY total_exec_time DESC
+    LIMIT :limit
+    """
+)
+
+
+async def fetch(conn: AsyncConnection, query, **params) -> list[dict]:
+    result = await conn.execute(query, params)
+    return [dict(row) for row in result.mappings()]
+
+
+async def top_statements(conn: AsyncConnection, limit: int) -> list[dict] | None:
+    # расширение pg_stat_statements есть не везде
+    try:
+        async with conn.begin_nested():
+            return await fetch(conn, TOP_STATEMENTS, limit=limit)
+    except DBAPIError:
+        return None
+
+
+def format_table(title: str, rows: list[dict] | None, missing: str = "none") -> str:
+    lines = [f"== {title}"]
+    if rows is None:
+        lines.append(f"  ({missing})")
+    elif not rows:
+        lines.append("  none")
+    else:
+        columns = list(rows[0])
+        widths = {
+            column: max(len(column), *(len(str(row[column])) for row in rows))
+            for column in columns
+        }
+        table = [columns] + [[row[column] for column in columns] for row in rows]
+        for values in table:
+            cells = [str(v).ljust(widths[c]) for c, v in zip(columns, values)]
+            lines.append("  " + "  ".join(cells).rstrip())
+    return "\n".join(lines)
+
+
+async def main(max_scans: int, min_rows: int, limit: int):
+    async with engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            raise SystemExit("index report needs PostgreSQL statistics views")
+        sections = [
+            format_table(
+                f"Unused indexes (scans <= {max_scans})",
+                await fetch(conn, UNUSED_INDEXES, max_scans=max_scans),
+            ),
+            format_table(
+                "Foreign keys without an index",
+                await fetch(conn, UNINDEXED_FOREIGN_KEYS),
+            ),
+            format_table(
+                f"Tables read mostly by seq scan (>= {min_rows} rows)",
+                await fetch(conn, SEQ_SCANNED_TABLES, min_rows=min_rows, limit=limit),
+            ),
+            format_table(
+                "Most expensive statements",
+                await top_statements(conn, limit),
+                missing="pg_stat_statements is not installed",
+            ),
+        ]
+    await engine.dispose()
+    print("\n\n".join(sections))
+
+
+if __name__ == "__main__":
+    # python -m app.database.db_data.index_report
+    parser = argparse.ArgumentParser(
+        description="Unused indexes and missing-index candidates"
+    )
+    parser.add_argument("--max-scans", type=int, default=0)
+    parser.add_argument("--min-rows", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.max_scans, args.min_rows, args.limit))
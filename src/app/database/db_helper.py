@@ -1,13 +1,202 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from fastapi import Request
+from sqlalchemy import ARRAY, ColumnElement, Integer, any_, literal, make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
     create_async_engine,
     async_sessionmaker,
 )
 from app.core.config import settings
+from app.utils.cache import cache_get_many, cache_set_many, get_backend
+
+logger = logging.getLogger(__name__)
+
+RECENT_WRITES_CACHE_NAMESPACE = "recent_write"
+
+
+def asyncpg_connect_args() -> dict:
+    if settings.db_pgbouncer:
+        # PgBouncer отдаёт каждую транзакцию любому серверному соединению, и
+        # подготовленный там запрос может не найтись (или найтись чужой с тем же
+        # именем). Кэши выключаем, имена делаем уникальными.
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+    }
+
+
+def engine_options(db_url: str) -> dict:
+    url = make_url(db_url)
+    if url.get_backend_name() == "sqlite":
+        # у SQLite свой пул, настройки ниже к нему не относятся
+        return {}
+    options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = asyncpg_connect_args()
+    return options
+
+
+async def prewarm_pool(engine: AsyncEngine, size: int) -> None:
+    # держим все соединения сразу, иначе пул отдаст одно и то же
+    size = min(size, settings.db_pool_size)
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(size))
+        )
+
+
+class ReplicaSet:
+    """Read replicas picked round-robin.
+
+    A replica that fails to give a connection is skipped for cooldown seconds;
+    after that the next read tries it again.
+    """
+
+    def __init__(self, urls: list[str], cooldown: float):
+        self.engines = [create_async_engine(url, **engine_options(url)) for url in urls]
+        self.session_makers = [
+            async_sessionmaker(bind=e, expire_on_commit=False) for e in self.engines
+        ]
+        self.cooldown = cooldown
+        self.down_until = [0.0] * len(self.engines)
+        self._next = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def candidates(self) -> list[int]:
+        now = time.monotonic()
+        count = len(self.engines)
+        start, self._next = self._next, (self._next + 1) % count
+        order = [(start + i) % count for i in range(count)]
+        return [i for i in order if self.down_until[i] <= now]
+
+    def mark_down(self, index: int) -> None:
+        self.down_until[index] = time.monotonic() + self.cooldown
+        logger.warning(
+            "Read replica %s is unavailable, skipping it for %ss",
+            self.engines[index].url.render_as_string(hide_password=True),
+            self.cooldown,
+        )
+
+
+engine = create_async_engine(settings.db_url, **engine_options(settings.db_url))
+# после commit объекты не истекают: значения, сгенерированные базой, приходят
+# через INSERT/UPDATE ... RETURNING, и повторный SELECT (refresh) не нужен
+new_async_session = async_sessionmaker(bind=engine, expire_on_commit=False)
+replicas = ReplicaSet(settings.db_replica_urls, settings.db_replica_cooldown)
+
+# отметки о недавней записи, если Redis не поднят: ключ -> время истечения
+_recent_writes: dict[str, float] = {}
+
+
+def writer_key(request: Request | None) -> str | None:
+    # «пользователь» здесь — его токен: читать свои записи нужно тем же клиентом
+    auth = request.headers.get("authorization") if request else None
+    return hashlib.sha1(auth.encode()).hexdigest() if auth else None
 
 
-engine = create_async_engine(settings.db_url)
-new_async_session = async_sessionmaker(bind=engine)
+async def mark_recent_write(key: str) -> None:
+    window = settings.db_read_your_writes_seconds
+    if get_backend():
+        await cache_set_many(
+            RECENT_WRITES_CACHE_NAMESPACE, {key: b"1"}, expire=math.ceil(window)
+        )
+    else:
+        _recent_writes[key] = time.monotonic() + window
 
-async def get_session():
+
+async def wrote_recently(key: str) -> bool:
+    if get_backend():
+        [mark] = await cache_get_many(RECENT_WRITES_CACHE_NAMESPACE, [key])
+        return mark is not None
+    return _recent_writes.get(key, 0.0) > time.monotonic()
+
+
+async def get_session(request: Request = None):
+    async with new_async_session() as session:
+        yield session
+        # после успешного изменяющего запроса его автор какое-то время читает с primary
+        key = writer_key(request)
+        if replicas and key and request.method not in ("GET", "HEAD"):
+            await mark_recent_write(key)
+
+
+async def get_read_session(request: Request = None):
+    """Session for read-only endpoints: a healthy replica, else the primary."""
+    key = writer_key(request)
+    if replicas and not (key and await wrote_recently(key)):
+        for index in replicas.candidates():
+            session = replicas.session_makers[index](info={"replica": True})
+            try:
+                # соединение берём сразу, чтобы упавшая реплика не стоила запроса;
+                # исчерпанный пул реплики — тоже повод читать с primary
+                await session.connection()
+            except (DBAPIError, OSError, PoolTimeoutError):
+                await session.close()
+                replicas.mark_down(index)
+                continue
+            async with session:
+                yield session
+            return
     async with new_async_session() as session:
         yield session
+
+
+async def prewarm_replicas(size: int) -> None:
+    for index, replica in enumerate(replicas.engines):
+        try:
+            await prewarm_pool(replica, size)
+        except (DBAPIError, OSError, PoolTimeoutError):
+            replicas.mark_down(index)
+
+
+def is_replica(session: AsyncSession) -> bool:
+    # общие кэши заполняются только чтениями с primary: реплика может не видеть
+    # записи, которая их только что сбросила, и вернула бы в кэш старое
+    return session.info.get("replica", False)
+
+
+@asynccontextmanager
+async def primary_session(session: AsyncSession):
+    """The session itself if it reads the primary, else a new primary session."""
+    if not is_replica(session):
+        yield session
+        return
+    async with new_async_session() as primary:
+        yield primary
+
+
+def is_postgres(session: AsyncSession) -> bool:
+    return session.bind.dialect.name == "postgresql"
+
+
+def uses_asyncpg(session: AsyncSession) -> bool:
+    return is_postgres(session) and session.bind.dialect.driver == "asyncpg"
+
+
+def in_ids(session: AsyncSession, column: ColumnElement, ids: list[int]) -> ColumnElement[bool]:
+    # один параметр-массив на Postgres: форма запроса не зависит от числа id
+    if is_postgres(session):
+        return column == any_(literal(ids, ARRAY(Integer)))
+    return column.in_(ids)
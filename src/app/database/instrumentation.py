@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# плейсхолдеры всех драйверов: ?, $1, %(name)s, :name
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s|(?<![:\w]):\w+|\?")
+# IN (?, ?, ?) разной длины — один и тот же запрос
+_PARAM_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """SQL with placeholders and IN-lists collapsed, so repeats differ only by parameters."""
+    shape = _PARAM.sub("?", statement)
+    shape = _PARAM_LIST.sub("(?)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class RequestStats:
+    """SQL issued while handling one request."""
+
+    def __init__(self, scope: Scope | None = None):
+        self.scope = scope
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float, rows: int) -> None:
+        self.statements += 1
+        self.db_time += duration
+        self.rows += rows
+        self.shapes[statement] += 1
+
+    @property
+    def route(self) -> str | None:
+        # роутер дописывает найденный маршрут в scope до вызова эндпоинта
+        return route_name(self.scope) if self.scope else None
+
+    def n_plus_one_suspects(self, threshold: int) -> dict[str, int]:
+        # один и тот же запрос с разными параметрами — обычно ленивая загрузка в цикле
+        suspects = Counter()
+        for statement, count in self.shapes.items():
+            suspects[statement_shape(statement)] += count
+        return {shape: count for shape, count in suspects.items() if count >= threshold}
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.3f};'
+            f'desc="{self.statements} statements, {self.rows} rows"'
+        )
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.max_statements = 0
+        self.n_plus_one = 0
+
+    def add(self, stats: RequestStats, suspects: int) -> None:
+        self.requests += 1
+        self.statements += stats.statements
+        self.db_time += stats.db_time
+        self.rows += stats.rows
+        self.max_statements = max(self.max_statements, stats.statements)
+        self.n_plus_one += suspects
+
+
+class SlowQuery:
+    def __init__(
+        self,
+        statement: str,
+        parameters: list[dict] | None,
+        duration: float,
+        rows: int,
+        route: str | None,
+    ):
+        self.timestamp = datetime.now(timezone.utc)
+        self.statement = statement
+        self.parameters = parameters
+        self.duration_ms = duration * 1000
+        self.rows = rows
+        self.route = route
+        # заполняется фоновой задачей, если EXPLAIN включён
+        self.plan: list[str] | None = None
+
+
+def redact(compiled_parameters: list[dict]) -> list[dict]:
+    return [
+        {
+            name: "***" if "password" in name.lower() else value
+            for name, value in parameters.items()
+        }
+        for parameters in compiled_parameters
+    ]
+
+
+class SlowQueryLog:
+    """Statements slower than threshold_ms, newest last, at most size of them.
+
+    With explain on, a plan is captured in the background for the first slow
+    SELECT of each shape every explain_interval seconds: EXPLAIN (ANALYZE,
+    BUFFERS) on Postgres, EXPLAIN QUERY PLAN on SQLite.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 0,
+        size: int = 100,
+        explain: bool = False,
+        explain_interval: float = 60,
+    ):
+        self.configure(threshold_ms, size, explain, explain_interval)
+
+    def configure(
+        self,
+        threshold_ms: float,
+        size: int = 100,
+        explain: bool = False,
+        explain_interval: float = 60,
+    ) -> None:
+        self.threshold = threshold_ms / 1000
+        self.entries: deque[SlowQuery] = deque(maxlen=size)
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.explained_at: dict[str, float] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def record(self, conn, statement, parameters, context, duration, rows) -> None:
+        compiled_parameters = context.compiled_parameters if context.compiled else None
+        self.add(
+            statement,
+            redact(compiled_parameters) if compiled_parameters is not None else None,
+            duration,
+            rows,
+            conn.engine,
+            parameters,
+            explain=not context.executemany,
+        )
+
+    def add(
+        self,
+        statement: str,
+        logged_parameters: list[dict] | None,
+        duration: float,
+        rows: int,
+        sync_engine: Engine,
+        parameters,
+        explain: bool = True,
+    ) -> None:
+        stats = request_stats.get()
+        entry = SlowQuery(
+            statement,
+            logged_parameters,
+            duration,
+            rows,
+            stats.route if stats else None,
+        )
+        self.entries.append(entry)
+        logger.warning(
+            "Slow query (%.1f ms, %s): %s; parameters: %s",
+            entry.duration_ms,
+            entry.route,
+            statement,
+            entry.parameters,
+        )
+        if (
+            self.explain
+            and explain
+            and sync_engine in _async_engines
+            and self.should_explain(statement)
+        ):
+            task = asyncio.get_running_loop().create_task(
+                self.capture_plan(sync_engine, statement, parameters, entry)
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def should_explain(self, statement: str) -> bool:
+        # ANALYZE выполняет запрос: изменяющие запросы не трогаем
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return False
+        shape = statement_shape(statement)
+        now = time.monotonic()
+        last = self.explained_at.get(shape)
+        if last is not None and now - last < self.explain_interval:
+            return False
+        self.explained_at[shape] = now
+        return True
+
+    async def capture_plan(
+        self, sync_engine: Engine, statement: str, parameters, entry: SlowQuery
+    ) -> None:
+        explaining.set(True)
+        engine = _async_engines[sync_engine]
+        try:
+            async with engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    await conn.exec_driver_sql(
+                        f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}"
+                    )
+                    prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+                else:
+                    prefix = "EXPLAIN QUERY PLAN "
+                result = await conn.exec_driver_sql(prefix + statement, parameters)
+                entry.plan = [" ".join(map(str, row)) for row in result.all()]
+                # транзакцию не фиксируем: соединение закроется с ROLLBACK
+        except Exception:
+            logger.exception("EXPLAIN of a slow query failed")
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.explained_at.clear()
+
+
+EXPLAIN_TIMEOUT_MS = 5000
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+# свои EXPLAIN не попадают ни в статистику, ни в журнал медленных запросов
+explaining: ContextVar[bool] = ContextVar("explaining", default=False)
+# накопленные метрики по шаблонам путей, "GET /books/{book_id}" -> RouteStats
+route_stats: dict[str, RouteStats] = {}
+slow_queries = SlowQueryLog()
+_async_engines: dict[Engine, AsyncEngine] = {}
+
+
+def reset() -> None:
+    route_stats.clear()
+    slow_queries.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or explaining.get():
+        return
+    if request_stats.get() is not None or slow_queries.enabled:
+        context.sql_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "sql_stats_start", None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    # asyncpg берёт rowcount из статуса команды, в том числе "SELECT n";
+    # драйверы, которые его не знают (sqlite для SELECT), дают -1
+    rows = max(cursor.rowcount, 0)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.record(statement, duration, rows)
+    if slow_queries.enabled and duration >= slow_queries.threshold:
+        slow_queries.record(conn, statement, parameters, context, duration, rows)
+
+
+def record_raw(
+    sync_engine: Engine,
+    statement: str,
+    args: tuple,
+    duration: float,
+    rows: int,
+) -> None:
+    """Accounts a statement run on the driver connection, past the engine events."""
+    if explaining.get():
+        return
+    stats = request_stats.get()
+    if stats is not None:
+        stats.record(statement, duration, rows)
+    if slow_queries.enabled and duration >= slow_queries.threshold:
+        logged = [{f"${i}": value for i, value in enumerate(args, 1)}]
+        slow_queries.add(statement, logged, duration, rows, sync_engine, args)
+
+
+def raw_stats_enabled() -> bool:
+    return request_stats.get() is not None or slow_queries.enabled
+
+
+def instrument(engine: AsyncEngine) -> None:
+    """Hooks the engine's statements into RequestStats and the slow query log."""
+    sync_engine = engine.sync_engine
+    _async_engines[sync_engine] = engine
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_name(scope: Scope) -> str:
+    # сырой путь не подходит: каждый 404 на случайный URL стал бы новым ключом
+    path = getattr(scope.get("route"), "path", None)
+    if path is None:
+        return UNMATCHED_ROUTE
+    return f"{scope['method']} {path}"
+
+
+class SQLStatsMiddleware:
+    """Adds a Server-Timing header with the request's DB time, statements and rows.
+
+    Totals are accumulated per route in route_stats. With n_plus_one_threshold
+    set, a statement repeated that many times within a request is logged as
+    an N+1 suspect. With server_timing off only the route is tracked (for
+    the slow-query log) and responses are left untouched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        n_plus_one_threshold: int | None = None,
+        server_timing: bool = True,
+    ):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = request_stats.set(stats)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # к этому моменту эндпоинт и его зависимости уже отработали
+                self.finish(stats)
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_stats.reset(token)
+
+    def finish(self, stats: RequestStats) -> None:
+        name = stats.route
+        suspects = {}
+        if self.n_plus_one_threshold:
+            suspects = stats.n_plus_one_suspects(self.n_plus_one_threshold)
+            for shape, count in suspects.items():
+                logger.warning("N+1 suspect in %s: %d x %s", name, count, shape)
+        route_stats.setdefault(name, RouteStats()).add(stats, len(suspects))
@@ -1,7 +1,7 @@
 import uuid
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Table, Column, ForeignKey, String, TIMESTAMP
+from sqlalchemy import Table, Column, ForeignKey, SmallInteger, TIMESTAMP, Uuid
 from sqlalchemy.sql import func
 
 from app.database.base import Base
@@ -9,13 +9,29 @@ from app.schemas.user import BookOwnedSchema
 from app.schemas.user import UserActionsGetSchema
 
 
+# UUID хранится нативно (uuid в Postgres, 16 байт), в Python и API остаётся строкой
+UuidString = Uuid(as_uuid=False)
+
+
+def new_id() -> str:
+    return str(uuid.uuid4())
+
+
 user_books_table = Table(
     "user_books",
     Base.metadata,
     Column(
-        "user_id", ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True
+        "user_id",
+        UuidString,
+        ForeignKey("users.user_id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "book_id",
+        ForeignKey("books.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
     ),
-    Column("book_id", ForeignKey("books.id", ondelete="CASCADE"), primary_key=True),
 )
 
 
@@ -24,13 +40,14 @@ class Book(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(nullable=False, index=True)
     author: Mapped[str] = mapped_column(nullable=False, index=True)
-    genre: Mapped[str]
-    year: Mapped[int] = mapped_column(nullable=False)
+    genre: Mapped[str] = mapped_column(index=True)
+    year: Mapped[int] = mapped_column(nullable=False, index=True)
     description: Mapped[str]
     price: Mapped[int] = mapped_column(nullable=False, index=True)
     times_bought: Mapped[int] = mapped_column(default=0)
     times_returned: Mapped[int] = mapped_column(default=0)
-    rating: Mapped[float] = mapped_column(default=0)
+    rating: Mapped[float] = mapped_column(default=0, index=True)
+    ratings_count: Mapped[int] = mapped_column(default=0)
 
     buyers: Mapped[list["User"]] = relationship(
         secondary=user_books_table, back_populates="bought_books"
@@ -48,14 +65,36 @@ class Book(Base):
             "times_bought": self.times_bought,
             "times_returned": self.times_returned,
             "rating": self.rating,
+            "ratings_count": self.ratings_count,
         }
 
 
+class BookCounterShard(Base):
+    # приращения times_bought/times_returned, ещё не перенесённые в books:
+    # покупки одной книги пишут в разные строки и не ждут блокировку строки книги
+    __tablename__ = "book_counter_shards"
+    book_id: Mapped[int] = mapped_column(
+        ForeignKey("books.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    times_bought: Mapped[int] = mapped_column(default=0)
+    times_returned: Mapped[int] = mapped_column(default=0)
+
+
+class Rating(Base):
+    __tablename__ = "ratings"
+    user_id: Mapped[str] = mapped_column(
+        UuidString, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True
+    )
+    book_id: Mapped[int] = mapped_column(
+        ForeignKey("books.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+    score: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+
 class Admin(Base):
     __tablename__ = "admins"
-    admin_id: Mapped[str] = mapped_column(
-        unique=True, primary_key=True, default=str(uuid.uuid4())
-    )
+    admin_id: Mapped[str] = mapped_column(UuidString, primary_key=True, default=new_id)
     username: Mapped[str] = mapped_column(unique=True, nullable=False)
     password: Mapped[str] = mapped_column(nullable=False)
     role: Mapped[str] = mapped_column(default="admins")
@@ -70,9 +109,7 @@ class Admin(Base):
 
 class User(Base):
     __tablename__ = "users"
-    user_id: Mapped[str] = mapped_column(
-        unique=True, primary_key=True, default=str(uuid.uuid4())
-    )
+    user_id: Mapped[str] = mapped_column(UuidString, primary_key=True, default=new_id)
     username: Mapped[str] = mapped_column(unique=True, nullable=False)
     password: Mapped[str] = mapped_column(nullable=False)
     role: Mapped[str] = mapped_column(default="user")
@@ -126,13 +163,15 @@ class UserActions(Base):
     __tablename__ = "user_actions"
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[str] = mapped_column(
-        String, ForeignKey("users.user_id"), nullable=False
+        UuidString, ForeignKey("users.user_id"), nullable=False, index=True
     )
     action_type: Mapped[str] = mapped_column(nullable=False)
     details: Mapped[str] = mapped_column(nullable=False)
     total: Mapped[int] = mapped_column(nullable=True)
+    # книга покупки или возврата; без внешнего ключа — история переживает книгу
+    book_id: Mapped[int | None] = mapped_column(nullable=True)
     timestamp: Mapped[TIMESTAMP] = mapped_column(
-        TIMESTAMP, server_default=func.now(), nullable=False
+        TIMESTAMP, server_default=func.now(), nullable=False, index=True
     )
 
     user: Mapped["User"] = relationship(back_populates="user_actions")
@@ -1,5 +1,6 @@
+import asyncio
 from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi_cache import FastAPICache
@@ -8,20 +9,79 @@ from fastapi_cache.backends.redis import RedisBackend
 from redis import asyncio as aioredis
 
 from app.api_v1 import routers
+from app.api_v1.books import counters, leaderboard
 from app.core import settings
+from app.database import instrumentation
+from app.database.db_helper import (
+    engine,
+    new_async_session,
+    prewarm_pool,
+    prewarm_replicas,
+    replicas,
+)
+from app.utils.compression import CompressionMiddleware
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
     redis = aioredis.from_url(settings.redis_url)
     FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+    await prewarm_pool(engine, settings.db_pool_prewarm)
+    await prewarm_replicas(settings.db_pool_prewarm)
+    async with new_async_session() as session:
+        await leaderboard.rebuild(session)
+    flusher = None
+    if settings.book_counter_flush_interval > 0:
+        flusher = asyncio.create_task(counters.run(settings.book_counter_flush_interval))
     try:
         yield
     finally:
+        if flusher is not None:
+            flusher.cancel()
+            # прерванный посреди пачки перенос откатывается до финального
+            with suppress(asyncio.CancelledError):
+                await flusher
+            # покупки последних секунд не ждут следующего запуска
+            async with new_async_session() as session:
+                await counters.flush(session)
         await redis.close()
+        await engine.dispose()
+        for replica in replicas.engines:
+            await replica.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    levels={
+        "gzip": settings.compression_gzip_level,
+        "br": settings.compression_brotli_level,
+        "zstd": settings.compression_zstd_level,
+    },
+    cache_size=settings.compression_cache_size,
+)
+
+instrumentation.slow_queries.configure(
+    settings.sql_slow_query_ms,
+    size=settings.sql_slow_query_buffer,
+    explain=settings.sql_slow_query_explain,
+    explain_interval=settings.sql_slow_query_explain_interval,
+)
+if (
+    settings.sql_stats
+    or settings.sql_n_plus_one_threshold
+    or instrumentation.slow_queries.enabled
+):
+    for instrumented in (engine, *replicas.engines):
+        instrumentation.instrument(instrumented)
+    app.add_middleware(
+        instrumentation.SQLStatsMiddleware,
+        n_plus_one_threshold=settings.sql_n_plus_one_threshold,
+        # заголовок виден любому клиенту, поэтому только при явном SQL_STATS
+        # или в режиме разработки; журналу медленных нужен лишь маршрут
+        server_timing=bool(settings.sql_stats or settings.sql_n_plus_one_threshold),
+    )
 
 
 for router in routers:
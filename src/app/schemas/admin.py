@@ -1,6 +1,8 @@
+from datetime import datetime
+
 from pydantic import BaseModel, ConfigDict
 
-from app.schemas.book import BookSchema, BookGetSchema
+from app.schemas.book import BookSchema, BookGetSchema, BookEditSchema
 from app.schemas.account import AccountSchema
 from app.schemas.user import UserActionsGetSchema, BookOwnedSchema
 
@@ -63,3 +65,69 @@ class EditBookResponseSchema(BaseModel):
 class DeleteBookResponseSchema(BaseModel):
     message: str
     book: BookGetSchema
+
+
+class BookImportErrorSchema(BaseModel):
+    row: int
+    errors: list[str]
+
+
+class BookImportResponseSchema(BaseModel):
+    message: str
+    received: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: list[BookImportErrorSchema] = []
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+class BookBulkEditItemSchema(BookEditSchema):
+    id: int
+
+
+class BookBulkEditSchema(BaseModel):
+    books: list[BookBulkEditItemSchema]
+
+
+class BookBulkDeleteSchema(BaseModel):
+    ids: list[int]
+
+
+class BulkEditBooksResponseSchema(BaseModel):
+    message: str
+    requested: int
+    updated: int
+    missing_ids: list[int] = []
+
+
+class BulkDeleteBooksResponseSchema(BaseModel):
+    message: str
+    requested: int
+    deleted: int
+    missing_ids: list[int] = []
+
+
+class SQLRouteStatsSchema(BaseModel):
+    route: str
+    requests: int
+    statements: int
+    avg_statements: float
+    max_statements: int
+    rows: int
+    db_time_ms: float
+    avg_db_time_ms: float
+    n_plus_one: int
+
+
+class SlowQuerySchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    timestamp: datetime
+    route: str | None
+    duration_ms: float
+    rows: int
+    statement: str
+    parameters: list[dict] | None
+    plan: list[str] | None
@@ -1,4 +1,11 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+BOOK_BATCH_MAX_IDS = 1000
+BOOK_TOP_MAX_K = 100
+BOOK_SCORE_MIN = 1
+BOOK_SCORE_MAX = 5
+BOOK_FACET_YEAR_BUCKET = 10
+BOOK_FACET_PRICE_BUCKET = 250
 
 
 class BookSchema(BaseModel):
@@ -21,9 +28,12 @@ class BookAddSchema(BookSchema):
 
 class BookGetSchema(BookSchema):
     id: int
+    ratings_count: int = 0
 
 
-class BookEditSchema(BaseModel):
+# ответ на ?fields=: в JSON попадают только запрошенные поля
+class BookPartialSchema(BaseModel):
+    id: int | None = None
     title: str | None = None
     author: str | None = None
     genre: str | None = None
@@ -33,6 +43,22 @@ class BookEditSchema(BaseModel):
     times_bought: int | None = None
     times_returned: int | None = None
     rating: float | None = None
+    ratings_count: int | None = None
+
+
+BOOK_FIELDS = tuple(BookGetSchema.model_fields)
+
+
+class BookEditSchema(BaseModel):
+    title: str | None = None
+    author: str | None = None
+    genre: str | None = None
+    description: str | None = None
+    year: int | None = None
+    price: int | None = None
+    times_bought: int | None = None
+    times_returned: int | None = None
+    # rating и ratings_count не правятся: их ведёт rate_book по таблице ratings
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -54,3 +80,55 @@ class BookFilterSchema(BaseModel):
     rating_max: float | None = None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class BookBatchSchema(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=BOOK_BATCH_MAX_IDS)
+
+
+class BookBatchResponseSchema(BaseModel):
+    books: list[BookGetSchema]
+    missing_ids: list[int] = []
+
+
+class BookRankSchema(BaseModel):
+    book: BookGetSchema
+    score: float
+
+
+class BookCountersSchema(BaseModel):
+    book_id: int
+    times_bought: int
+    times_returned: int
+
+
+class BookRatingsSchema(BaseModel):
+    book_id: int
+    rating: float
+    ratings_count: int
+    distribution: dict[int, int]
+
+
+class BookFacetValueSchema(BaseModel):
+    value: str
+    count: int
+
+
+class BookFacetBucketSchema(BaseModel):
+    min: int
+    max: int
+    count: int
+
+
+class BookFacetsSchema(BaseModel):
+    total: int
+    genre: list[BookFacetValueSchema] = []
+    author: list[BookFacetValueSchema] = []
+    year: list[BookFacetBucketSchema] = []
+    price: list[BookFacetBucketSchema] = []
+
+
+class BookSuggestSchema(BaseModel):
+    id: int
+    title: str
+    author: str
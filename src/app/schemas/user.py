@@ -3,7 +3,7 @@ from datetime import datetime
 from pydantic import BaseModel, Field, ConfigDict
 
 from app.schemas.account import AccountSchema
-from app.schemas.book import BookGetSchema
+from app.schemas.book import BookGetSchema, BOOK_SCORE_MAX, BOOK_SCORE_MIN
 
 
 class BookOwnedSchema(BaseModel):
@@ -97,3 +97,13 @@ class BuyBookResponseSchema(BaseModel):
 class ReturnBookResponseSchema(BaseModel):
     message: str
     book: BookGetSchema
+
+
+class RateBookSchema(BaseModel):
+    score: int = Field(ge=BOOK_SCORE_MIN, le=BOOK_SCORE_MAX)
+
+
+class RateBookResponseSchema(BaseModel):
+    message: str
+    score: int
+    book: BookGetSchema
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+import re
+from collections.abc import Iterator
+from itertools import islice
+from typing import BinaryIO
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas.book import BookAddSchema
+
+SUPPORTED_FORMATS = ("csv", "ndjson")
+
+books_adapter = TypeAdapter(list[BookAddSchema])
+# байты не из UTF-8 после errors="surrogateescape": ошибка привязывается к своей
+# строке, а не к куску файла, который TextIOWrapper декодировал целиком
+UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+
+class RowError(Exception):
+    def __init__(self, row: int, errors: list[str]):
+        super().__init__(row, errors)
+        self.row = row
+        self.errors = errors
+
+
+class ImportFileError(Exception):
+    """The file cannot be read past this row: bad encoding or broken CSV."""
+
+    def __init__(self, row: int, message: str):
+        super().__init__(row, message)
+        self.row = row
+        self.message = message
+
+
+def detect_format(filename: str | None) -> str:
+    if filename and filename.lower().endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return "csv"
+
+
+def read_book_rows(
+    stream: BinaryIO,
+    fmt: str,
+) -> Iterator[tuple[int, dict | RowError]]:
+    """Yields (row number, raw row) pairs, or a RowError for unparsable lines.
+
+    Raises ImportFileError where the file itself stops being readable.
+    """
+    text = io.TextIOWrapper(
+        stream, encoding="utf-8-sig", errors="surrogateescape", newline=""
+    )
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        try:
+            if any(map(UNDECODABLE.search, reader.fieldnames or ())):
+                raise ImportFileError(reader.line_num, "invalid UTF-8")
+            for raw in reader:
+                # пустые ячейки не передаём, чтобы сработали значения по умолчанию
+                row = {
+                    key: value
+                    for key, value in raw.items()
+                    if key is not None and value not in (None, "")
+                }
+                if any(map(UNDECODABLE.search, row.values())):
+                    raise ImportFileError(reader.line_num, "invalid UTF-8")
+                yield reader.line_num, row
+        except csv.Error as e:
+            # reader.line_num у DictReader обновляется только после удачной строки
+            raise ImportFileError(reader.reader.line_num, f"invalid CSV: {e}") from e
+    elif fmt == "ndjson":
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if UNDECODABLE.search(line):
+                raise ImportFileError(line_num, "invalid UTF-8")
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_num, RowError(line_num, [f"invalid JSON: {e.msg}"])
+                continue
+            if not isinstance(row, dict):
+                yield line_num, RowError(line_num, ["expected a JSON object"])
+                continue
+            yield line_num, row
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {SUPPORTED_FORMATS}")
+
+
+def validate_batch(
+    batch: list[tuple[int, dict | RowError]],
+) -> tuple[list[tuple[int, BookAddSchema]], list[RowError]]:
+    errors = [raw for _, raw in batch if isinstance(raw, RowError)]
+    rows = [(row_num, raw) for row_num, raw in batch if not isinstance(raw, RowError)]
+    try:
+        books = books_adapter.validate_python([raw for _, raw in rows])
+        return list(zip((row_num for row_num, _ in rows), books)), errors
+    except ValidationError as e:
+        failed: dict[int, list[str]] = {}
+        for error in e.errors():
+            index, *field = error["loc"]
+            location = ".".join(str(part) for part in field) or "row"
+            failed.setdefault(index, []).append(f"{location}: {error['msg']}")
+        errors += [RowError(rows[index][0], messages) for index, messages in failed.items()]
+        valid = [row for index, row in enumerate(rows) if index not in failed]
+        books = books_adapter.validate_python([raw for _, raw in valid])
+        return list(zip((row_num for row_num, _ in valid), books)), errors
+
+
+def iter_batches(
+    rows: Iterator[tuple[int, dict | RowError]],
+    batch_size: int,
+) -> Iterator[list[tuple[int, dict | RowError]]]:
+    while batch := list(islice(rows, batch_size)):
+        yield batch
+
+
+def parse_next_batch(
+    batches: Iterator[list[tuple[int, dict | RowError]]],
+) -> tuple[int, list[tuple[int, BookAddSchema]], list[RowError]] | None:
+    """Reads and validates the next batch: (rows read, valid books, errors)."""
+    batch = next(batches, None)
+    if batch is None:
+        return None
+    books, errors = validate_batch(batch)
+    return len(batch), books, errors
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.types import Backend
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+BOOKS_CACHE_NAMESPACE = "book"
+BOOKS_CACHE_EXPIRE = 60
+# фрагменты удаляются при записи книги; TTL лишь ограничивает расхождение
+# после правок в обход сервисов
+BOOK_FRAGMENTS_CACHE_EXPIRE = 60 * 60
+BOOK_RATINGS_CACHE_NAMESPACE = "book_ratings"
+# распределение сбрасывается при каждой новой оценке, поэтому можно держать дольше
+BOOK_RATINGS_CACHE_EXPIRE = 10 * 60
+BOOK_FACETS_CACHE_NAMESPACE = "book_facets"
+# поколение пространства имён живёт дольше любых его ключей
+CACHE_GENERATION_EXPIRE = 30 * 24 * 60 * 60
+# ключей за один SCAN и один UNLINK при очистке пространства имён
+CACHE_SCAN_COUNT = 1_000
+
+
+def get_backend() -> Backend | None:
+    try:
+        return FastAPICache.get_backend()
+    except AssertionError:
+        # кэш не инициализирован (тесты, скрипты) — работаем без него
+        return None
+
+
+def filter_signature(filters: BaseModel) -> str:
+    # одинаковые фильтры дают одинаковый ключ независимо от порядка параметров в запросе
+    return hashlib.sha1(filters.model_dump_json(exclude_none=True).encode()).hexdigest()
+
+
+def make_key(namespace: str, key: str | int) -> str:
+    return f"{FastAPICache.get_prefix()}:{namespace}:{key}"
+
+
+async def cache_get_many(namespace: str, keys: list) -> list[bytes | None]:
+    backend = get_backend()
+    if not backend or not keys:
+        return [None] * len(keys)
+    full_keys = [make_key(namespace, key) for key in keys]
+    try:
+        if isinstance(backend, RedisBackend):
+            return await backend.redis.mget(full_keys)
+        return [await backend.get(key) for key in full_keys]
+    except Exception:
+        logger.warning("Error retrieving cache keys from backend", exc_info=True)
+        return [None] * len(keys)
+
+
+async def cache_set_many(
+    namespace: str,
+    items: dict,
+    expire: int = BOOKS_CACHE_EXPIRE,
+) -> None:
+    backend = get_backend()
+    if not backend or not items:
+        return
+    try:
+        if isinstance(backend, RedisBackend):
+            async with backend.redis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(make_key(namespace, key), value, ex=expire)
+                await pipe.execute()
+        else:
+            for key, value in items.items():
+                await backend.set(make_key(namespace, key), value, expire)
+    except Exception:
+        logger.warning("Error setting cache keys in backend", exc_info=True)
+
+
+async def cache_delete(namespace: str, keys: list) -> None:
+    backend = get_backend()
+    if not backend or not keys:
+        return
+    full_keys = [make_key(namespace, key) for key in keys]
+    try:
+        if isinstance(backend, RedisBackend):
+            await backend.redis.delete(*full_keys)
+        else:
+            for key in full_keys:
+                if await backend.get(key) is not None:
+                    await backend.clear(key=key)
+    except Exception:
+        logger.warning("Error deleting cache keys from backend", exc_info=True)
+
+
+async def cache_generation(namespace: str) -> int:
+    backend = get_backend()
+    if not backend:
+        return 0
+    try:
+        return int(await backend.get(make_key(namespace, "generation")) or 0)
+    except Exception:
+        logger.warning("Error reading cache generation of %s", namespace, exc_info=True)
+        return 0
+
+
+async def cache_bump(namespace: str) -> int | None:
+    """Invalidates a namespace whose keys include cache_generation(), in O(1).
+
+    Readers switch to keys of the next generation; the old ones expire by TTL.
+    Returns the new generation, or None without a cache backend.
+    """
+    backend = get_backend()
+    if not backend:
+        return None
+    key = make_key(namespace, "generation")
+    try:
+        if isinstance(backend, RedisBackend):
+            return await backend.redis.incr(key)
+        generation = int(await backend.get(key) or 0) + 1
+        await backend.set(key, str(generation).encode(), CACHE_GENERATION_EXPIRE)
+        return generation
+    except Exception:
+        logger.warning("Error bumping cache generation of %s", namespace, exc_info=True)
+        return None
+
+
+async def cache_clear(namespace: str) -> None:
+    backend = get_backend()
+    if not backend:
+        return
+    try:
+        if isinstance(backend, RedisBackend):
+            # FastAPICache.clear делает KEYS по всему Redis одним блокирующим вызовом;
+            # SCAN проходит его частями, между которыми Redis обслуживает остальных
+            redis = backend.redis
+            keys = []
+            async for key in redis.scan_iter(
+                match=make_key(namespace, "*"), count=CACHE_SCAN_COUNT
+            ):
+                keys.append(key)
+                if len(keys) >= CACHE_SCAN_COUNT:
+                    await redis.unlink(*keys)
+                    keys = []
+            if keys:
+                await redis.unlink(*keys)
+        else:
+            await FastAPICache.clear(namespace=namespace)
+    except Exception:
+        logger.warning("Error clearing cache namespace %s", namespace, exc_info=True)
@@ -0,0 +1,187 @@
+import asyncio
+import gzip
+import hashlib
+from collections import OrderedDict
+from collections.abc import Callable
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli и zstandard необязательны: без них остаётся gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/msgpack", "text/")
+# тела меньше этого размера сжимаются быстрее, чем считается и ищется ключ кэша
+COMPRESSION_CACHE_MIN_SIZE = 16 * 1024
+# сжатие больших тел уводим из event loop
+COMPRESSION_OFFLOAD_SIZE = 256 * 1024
+
+Encoder = Callable[[bytes, int], bytes]
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    # mtime=0: одинаковое тело даёт одинаковые байты
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body: bytes, level: int) -> bytes:
+    # компрессор не потокобезопасен, а сжатие может уйти в поток — создаём на вызов
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+def available_encoders() -> dict[str, Encoder]:
+    """Supported content codings in server preference order."""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = _zstd
+    if brotli is not None:
+        encoders["br"] = _brotli
+    encoders["gzip"] = _gzip
+    return encoders
+
+
+def negotiate(accept_encoding: str, codings: list[str]) -> str | None:
+    """Picks the coding with the highest q-value; ties go to the earlier one in codings."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip()] = q
+    best, best_q = None, 0.0
+    for coding in codings:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by coding and a digest of the plain body."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items: OrderedDict[tuple[str, bytes], bytes] = OrderedDict()
+
+    def get(self, key: tuple[str, bytes]) -> bytes | None:
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key: tuple[str, bytes], value: bytes) -> None:
+        if len(value) > self.max_bytes or key in self.items:
+            return
+        self.items[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self) -> None:
+        self.items.clear()
+        self.size = 0
+
+
+class CompressionMiddleware:
+    """Compresses complete JSON and text responses with gzip, br or zstd.
+
+    Streaming responses, bodies below minimum_size and responses that already
+    have a Content-Encoding are passed through. Compressed bodies of at least
+    COMPRESSION_CACHE_MIN_SIZE bytes are kept in a CompressedBodyCache, so a
+    hot list that serializes to the same bytes is compressed once.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        levels: dict[str, int] | None = None,
+        cache_size: int = 64 * 1024 * 1024,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = available_encoders()
+        self.codings = list(self.encoders)
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.cache = CompressedBodyCache(cache_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codings)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                compressible = headers.get("content-type", "").startswith(
+                    COMPRESSIBLE_MEDIA_TYPES
+                )
+                passthrough = "content-encoding" in headers or not compressible
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # потоковые ответы не буферизуем
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            compressed = await self.compress(coding, body)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    async def compress(self, coding: str, body: bytes) -> bytes:
+        key = None
+        if len(body) >= COMPRESSION_CACHE_MIN_SIZE:
+            key = (coding, hashlib.blake2b(body, digest_size=16).digest())
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        encoder, level = self.encoders[coding], self.levels[coding]
+        if len(body) >= COMPRESSION_OFFLOAD_SIZE:
+            compressed = await asyncio.to_thread(encoder, body, level)
+        else:
+            compressed = encoder(body, level)
+        if key is not None:
+            self.cache.put(key, compressed)
+        return compressed
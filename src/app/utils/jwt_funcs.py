@@ -8,10 +8,7 @@ from app.api_v1.admins.crud import get_admin_from_db_by_username
 from app.database import get_session
 from app.database.models import User, Admin
 from app.utils import jwt_utils
-from app.api_v1.users.crud import (
-    get_user_from_db_by_uid,
-    get_user_from_db_by_username,
-)
+from app.api_v1.users.crud import get_user_from_db_by_username
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/user/sign-in")
@@ -51,7 +48,12 @@ async def get_current_auth_user(
 ) -> User:
     user_id_from_token: str = payload.get("sub")
 
-    user_from_db = await get_user_from_db_by_uid(session, user_id_from_token)
+    # только строка пользователя: купленные книги и история действий
+    # нужны лишь /user/me, который грузит их сам
+    user_from_db = await session.execute(
+        select(User).where(User.user_id == user_id_from_token)
+    )
+    user_from_db = user_from_db.scalar_one_or_none()
     if not user_from_db or not user_from_db.active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
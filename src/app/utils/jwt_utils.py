@@ -1,4 +1,7 @@
 from datetime import datetime, timezone, timedelta
+from functools import cache
+from pathlib import Path
+
 import bcrypt
 import jwt
 from app.core.config import settings
@@ -11,12 +14,19 @@ ACCESS_TOKEN_TYPE = "access"
 EXPIRE_MINUTES_PATH = settings.auth_jwt.access_token_expire_minutes
 
 
+@cache
+def read_key(path: Path) -> str:
+    # ключи читаются при первом токене, а не при импорте: их путь задаёт окружение
+    return path.read_text()
+
+
 def encode_jwt(
     payload: dict,
-    private_key: str = settings.auth_jwt.private_key_path.read_text(),
+    private_key: str | None = None,
     algorithm: str = settings.auth_jwt.algorithm,
     expire_minutes: int = EXPIRE_MINUTES_PATH,
 ):
+    private_key = private_key or read_key(settings.auth_jwt.private_key_path)
     to_encode = payload.copy()
     now = datetime.now(timezone.utc)
     expire = now + timedelta(minutes=expire_minutes)
@@ -32,9 +42,10 @@ def encode_jwt(
 
 def decode_jwt(
     token: str | bytes,
-    public_key: str = settings.auth_jwt.public_key_path.read_text(),
+    public_key: str | None = None,
     algorithm: str = settings.auth_jwt.algorithm,
 ):
+    public_key = public_key or read_key(settings.auth_jwt.public_key_path)
     decoded = jwt.decode(
         token,
         public_key,
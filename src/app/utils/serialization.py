@@ -0,0 +1,183 @@
+import struct
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Sequence
+from contextvars import ContextVar
+from functools import cache
+from typing import Annotated
+
+import msgpack
+import orjson
+from fastapi import Depends, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class BodyEncoding(ABC):
+    """Encodes response bodies and joins already encoded parts into containers."""
+
+    name: str
+    media_type: str
+
+    @abstractmethod
+    def dumps(self, obj) -> bytes: ...
+
+    @abstractmethod
+    def array(self, items: Sequence[bytes]) -> bytes: ...
+
+    @abstractmethod
+    def object(self, fields: dict[str, bytes]) -> bytes: ...
+
+
+class JSONEncoding(BodyEncoding):
+    name = "json"
+    media_type = "application/json"
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def array(self, items: Sequence[bytes]) -> bytes:
+        return b"[" + b",".join(items) + b"]"
+
+    def object(self, fields: dict[str, bytes]) -> bytes:
+        pairs = [orjson.dumps(key) + b":" + value for key, value in fields.items()]
+        return b"{" + b",".join(pairs) + b"}"
+
+
+class MsgpackEncoding(BodyEncoding):
+    name = "msgpack"
+    media_type = "application/msgpack"
+
+    def dumps(self, obj) -> bytes:
+        return msgpack.packb(obj)
+
+    @staticmethod
+    def _header(size: int, fix: int, code16: int, code32: int) -> bytes:
+        # заголовки array/map из спецификации msgpack: fix, 16 и 32 бита
+        if size < 16:
+            return bytes([fix | size])
+        if size < 2**16:
+            return struct.pack(">BH", code16, size)
+        return struct.pack(">BI", code32, size)
+
+    def array(self, items: Sequence[bytes]) -> bytes:
+        return self._header(len(items), 0x90, 0xDC, 0xDD) + b"".join(items)
+
+    def object(self, fields: dict[str, bytes]) -> bytes:
+        return self._header(len(fields), 0x80, 0xDE, 0xDF) + b"".join(
+            msgpack.packb(key) + value for key, value in fields.items()
+        )
+
+
+JSON_ENCODING = JSONEncoding()
+MSGPACK_ENCODING = MsgpackEncoding()
+BODY_ENCODINGS = (JSON_ENCODING, MSGPACK_ENCODING)
+
+body_encoding: ContextVar[BodyEncoding] = ContextVar("body_encoding", default=JSON_ENCODING)
+
+
+def negotiate_body_encoding(accept: str) -> BodyEncoding:
+    """msgpack only when the client names it explicitly and weighs it at least as JSON."""
+    if not accept:
+        return JSON_ENCODING
+    weights = {}
+    for part in accept.lower().split(","):
+        media_type, _, params = part.partition(";")
+        q = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[media_type.strip()] = q
+    msgpack_q = max(weights.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_q = max(
+        weights.get(media_type, 0.0)
+        for media_type in ("application/json", "application/*", "*/*")
+    )
+    if msgpack_q > 0 and msgpack_q >= json_q:
+        return MSGPACK_ENCODING
+    return JSON_ENCODING
+
+
+def get_body_encoding() -> BodyEncoding:
+    # выставляется NegotiatedRoute до вызова зависимостей
+    return body_encoding.get()
+
+
+BodyEncodingDep = Annotated[BodyEncoding, Depends(get_body_encoding)]
+
+
+class EncodedResponse(Response):
+    """Response for bodies that are already encoded.
+
+    Returning it from a route skips FastAPI's response_model validation and
+    jsonable_encoder; the route's response_model is then only documentation.
+    """
+
+    media_type = JSON_ENCODING.media_type
+
+    def __init__(self, content: bytes, encoding: BodyEncoding = JSON_ENCODING, **kwargs):
+        self.media_type = encoding.media_type
+        super().__init__(content, **kwargs)
+
+
+class NegotiatedResponse(JSONResponse):
+    """Default response class of the API routers: JSON or msgpack per the Accept header."""
+
+    def __init__(self, content, *args, **kwargs):
+        self.encoding = body_encoding.get()
+        self.media_type = self.encoding.media_type
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content) -> bytes:
+        if self.encoding is JSON_ENCODING:
+            return super().render(content)
+        return self.encoding.dumps(content)
+
+
+class NegotiatedRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            encoding = negotiate_body_encoding(request.headers.get("accept", ""))
+            token = body_encoding.set(encoding)
+            try:
+                response = await handler(request)
+            finally:
+                body_encoding.reset(token)
+            response.headers.add_vary_header("Accept")
+            return response
+
+        return negotiated_handler
+
+
+@cache
+def list_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    # TypeAdapter строит валидатор и сериализатор один раз на схему
+    return TypeAdapter(list[schema])
+
+
+def dump_models(
+    schema: type[BaseModel],
+    objects: Iterable,
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    adapter = list_adapter(schema)
+    models = adapter.validate_python(objects, from_attributes=True)
+    if encoding is JSON_ENCODING:
+        return adapter.dump_json(models)
+    return encoding.dumps(adapter.dump_python(models, mode="json"))
+
+
+def dump_rows(
+    fields: Sequence[str],
+    rows: Iterable[Sequence],
+    encoding: BodyEncoding = JSON_ENCODING,
+) -> bytes:
+    # строки результата уже типизированы базой — сразу в JSON, без моделей
+    return encoding.dumps([dict(zip(fields, row)) for row in rows])
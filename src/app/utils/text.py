@@ -0,0 +1,28 @@
+import re
+import unicodedata
+from collections.abc import Iterator
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text: str | None) -> str:
+    # «Ёж» и «ежи» должны совпадать: регистр сворачиваем, ё приводим к е
+    if not text:
+        return ""
+    return unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+
+
+def words(text: str | None) -> list[str]:
+    return WORD_RE.findall(normalize(text))
+
+
+def char_ngrams(text: str | None, n: int = 3) -> Iterator[str]:
+    """Character n-grams of every word, padded so word starts and ends count.
+
+    Russian is heavily inflected ("история", "истории", "историю"), so shared
+    n-grams match word forms without a stemmer.
+    """
+    for word in words(text):
+        padded = f" {word} "
+        for i in range(max(len(padded) - n + 1, 1)):
+            yield padded[i : i + n]
@@ -1,10 +1,22 @@
 import pytest
 import pytest_asyncio
 import asyncio
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from starlette.testclient import TestClient
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-from app.database import get_session
+from app.api_v1.books import (
+    fragments,
+    fuzzy,
+    leaderboard,
+    recommendations,
+    similarity,
+    suggest,
+)
+from app.core import settings
+from app.database import db_helper, get_read_session, get_session, instrumentation
+from app.utils import jwt_utils
 from tests.test_models import Base
 from app.main import app
 
@@ -14,6 +26,35 @@ DB_URL = "sqlite+aiosqlite:///./tests/test.db"
 pytestmark = pytest.mark.asyncio
 
 
+# Fixture: JWT keypair, generated per test session instead of stored in the repo
+@pytest.fixture(scope="session", autouse=True)
+def jwt_keys(tmp_path_factory):
+    certs = tmp_path_factory.mktemp("certs")
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_path = certs / "jwt-private.pem"
+    public_path = certs / "jwt-public.pem"
+    private_path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    public_path.write_bytes(
+        key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    auth_jwt = settings.auth_jwt
+    paths = auth_jwt.private_key_path, auth_jwt.public_key_path
+    auth_jwt.private_key_path, auth_jwt.public_key_path = private_path, public_path
+    jwt_utils.read_key.cache_clear()
+    yield
+    auth_jwt.private_key_path, auth_jwt.public_key_path = paths
+    jwt_utils.read_key.cache_clear()
+
+
 # Fixture: event loop
 @pytest.fixture()
 def event_loop():
@@ -31,6 +72,8 @@ async def async_engine():
         await conn.run_sync(Base.metadata.create_all)
     yield engine
     await engine.dispose()
+    # фоновые пересборки индексов ходят через общий engine приложения
+    await db_helper.engine.dispose()
 
 
 # Fixture: async session with database reset
@@ -39,6 +82,7 @@ async def async_session(async_engine):
     async_session_maker = async_sessionmaker(bind=async_engine, expire_on_commit=False)
     async with async_session_maker() as session:
         app.dependency_overrides[get_session] = lambda: session
+        app.dependency_overrides[get_read_session] = lambda: session
         yield session
         app.dependency_overrides.clear()
 
@@ -47,11 +91,25 @@ async def async_session(async_engine):
 def mock_get_session(mocker, async_session):
     # Override the dependency in your FastAPI app
     app.dependency_overrides[get_session] = lambda: async_session
+    app.dependency_overrides[get_read_session] = lambda: async_session
     yield
     # Clear the override after the test
     app.dependency_overrides.clear()
 
 
+# Fixture: in-process indexes start empty in every test
+@pytest.fixture(autouse=True)
+def reset_indexes():
+    leaderboard.reset()
+    recommendations.reset()
+    similarity.reset()
+    suggest.reset()
+    fuzzy.reset()
+    fragments.reset()
+    instrumentation.reset()
+    yield
+
+
 # Fixture: mock hash_password
 @pytest.fixture()
 def mock_hash_password(mocker):
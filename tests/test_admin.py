@@ -1,7 +1,11 @@
+import uuid
+
 import pytest
 from httpx import AsyncClient, ASGITransport
 from sqlalchemy import select
 
+from app.database import instrumentation
+from app.database.instrumentation import RequestStats, RouteStats, SlowQuery
 from app.main import app
 from app.schemas.admin import AdminCreateJWTSchema
 from app.schemas.book import BookSchema, BookEditSchema
@@ -11,8 +15,10 @@ from tests.tools import (
     add_admin_to_db,
     add_users_to_db,
     book_return_value,
+    TEST_ADMIN_ID,
+    TEST_USER_ID,
 )
-from tests.test_models import Admin
+from tests.test_models import Admin, Book
 
 
 @pytest.mark.asyncio
@@ -48,6 +54,25 @@ async def test_sign_up(async_session, mock_hash_password):
     assert saved_admin.username == "test_username"
     assert saved_admin.password == "hashed_password"
     mock_hash_password.assert_called_once_with("test_password")
+    assert str(uuid.UUID(response_data["admin_id"])) == response_data["admin_id"]
+
+
+@pytest.mark.asyncio
+async def test_sign_up_generates_distinct_ids(async_session):
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        responses = [
+            await ac.post(
+                "/admin/sign-up", json={"username": f"admin_{i}", "password": "pw"}
+            )
+            for i in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    first, second = (response.json()["admin_id"] for response in responses)
+    assert first != second
 
 
 @pytest.mark.asyncio
@@ -97,7 +122,7 @@ async def test_get_all_users(async_session):
         response.status_code == 200
     ), f"Expected 200, got {response.status_code}: {response.json()}"
     response_data = response.json()
-    assert response_data[0]["user_id"] == "test_uid"
+    assert response_data[0]["user_id"] == TEST_USER_ID
     assert response_data[0]["username"] == "test_user1"
     assert response_data[0]["money"] == 777
     assert "user_id" in response_data[1]
@@ -113,7 +138,7 @@ async def test_get_user_by_id(async_session):
     headers = {"Authorization": f"Bearer {token}"}
 
     await add_users_to_db(async_session)
-    uid = "test_uid"
+    uid = TEST_USER_ID
     async with AsyncClient(
         transport=ASGITransport(app=app),
         base_url="http://test",
@@ -122,15 +147,18 @@ async def test_get_user_by_id(async_session):
             url=f"/admin/users/{uid}",
             headers=headers,
         )
+        # id хранится как uuid: другая строка — просто не найденный пользователь
+        malformed = await ac.get(url="/admin/users/test_uid", headers=headers)
 
     assert (
         response.status_code == 200
     ), f"Expected 200, got {response.status_code}: {response.json()}"
     response_data = response.json()
-    assert response_data["user_id"] == "test_uid"
+    assert response_data["user_id"] == TEST_USER_ID
     assert response_data["username"] == "test_user1"
     assert response_data["role"] == "user"
     assert response_data["money"] == 777
+    assert malformed.status_code == 404
 
 
 @pytest.mark.asyncio
@@ -154,7 +182,7 @@ async def test_get_all_admins(async_session):
     ), f"Expected 200, got {response.status_code}: {response.json()}"
     response_data = response.json()
     resp = response_data[0]
-    assert resp["admin_id"] == "test_aid"
+    assert resp["admin_id"] == TEST_ADMIN_ID
     assert resp["username"] == "test_username"
     assert resp["role"] == "admin"
 
@@ -221,7 +249,8 @@ async def test_edit_book(async_session):
     ) as ac:
         response = await ac.put(
             url=f"/admin/books/{book_id}",
-            json=book_edit_schema.model_dump(),
+            # средняя оценка выводится из таблицы ratings, правка её не трогает
+            json=book_edit_schema.model_dump() | {"rating": 5, "ratings_count": 7},
             headers=headers,
         )
 
@@ -241,6 +270,7 @@ async def test_edit_book(async_session):
         "times_bought": 99,
         "times_returned": 99,
         "rating": 0,
+        "ratings_count": 0,
     }
 
 
@@ -268,3 +298,245 @@ async def test_delete_book(async_session):
     response_data = response.json()
     assert response_data["message"] == "Successfully deleted book"
     assert response_data["book"] == book_return_value
+
+
+@pytest.mark.asyncio
+async def test_import_books(async_session):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await add_books_to_db(async_session)
+    feed = (
+        "title,author,genre,year,description,price\n"
+        "test_title,test_author,test_genre,2025,new_description,120\n"
+        "import_title,import_author,import_genre,2001,,300\n"
+        "bad_title,bad_author,bad_genre,not_a_year,,100\n"
+        "import_title,import_author,import_genre,2001,,300\n"
+        "import_title2,import_author2,import_genre2,2002,desc,400\n"
+    )
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.post(
+            url="/admin/books/import",
+            files={"file": ("feed.csv", feed.encode(), "text/csv")},
+            headers=headers,
+        )
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert response_data["received"] == 5
+    assert response_data["inserted"] == 2
+    assert response_data["updated"] == 1
+    assert response_data["failed"] == 2
+    assert [error["row"] for error in response_data["errors"]] == [4, 5]
+    assert response_data["errors"][0]["errors"][0].startswith("year:")
+
+    result = await async_session.execute(select(Book).order_by(Book.id))
+    books = result.scalars().all()
+    assert len(books) == 5
+    assert books[0].price == 120
+    assert books[0].times_bought == 50
+    assert books[3].title == "import_title"
+
+
+@pytest.mark.parametrize(
+    "filename,feed,detail",
+    [
+        (
+            "feed.csv",
+            b"title,author,genre,year,description,price\n"
+            b"import_title,import_author,import_genre,2001,,300\n"
+            b"bad_title,bad_author,bad_genre,2001,\xff\xfe,100\n",
+            "Row 3: invalid UTF-8",
+        ),
+        (
+            "feed.csv",
+            b"title,author,genre,year,description,price\n"
+            b"import_title,import_author,import_genre,2001,,300\n"
+            b"bad_title,bad_author,bad_genre,2001," + b"x" * 200_000 + b",100\n",
+            "Row 3: invalid CSV",
+        ),
+        (
+            "feed.ndjson",
+            b'{"title": "import_title", "author": "a", "genre": "g", "year": 2001, "price": 1}\n'
+            b'{"title": "\xc3("}\n',
+            "Row 2: invalid UTF-8",
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_import_books_unreadable_file(async_session, filename, feed, detail):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await add_books_to_db(async_session)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.post(
+            url="/admin/books/import",
+            files={"file": (filename, feed, "text/plain")},
+            headers=headers,
+        )
+
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith(detail)
+    # прочитанное до ошибки тоже откатилось
+    result = await async_session.execute(select(Book.id))
+    assert len(result.scalars().all()) == 3
+
+
+@pytest.mark.asyncio
+async def test_bulk_edit_books(async_session):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await add_books_to_db(async_session)
+    data = {
+        "books": [
+            {"id": 1, "price": 111},
+            {"id": 2, "price": 222, "genre": "bulk_genre"},
+            {"id": 3, "price": 333},
+            {"id": 42, "price": 1},
+        ]
+    }
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.patch(url="/admin/books/bulk", json=data, headers=headers)
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert response_data["message"] == "Successfully updated books"
+    assert response_data["requested"] == 4
+    assert response_data["updated"] == 3
+    assert response_data["missing_ids"] == [42]
+
+    result = await async_session.execute(
+        select(Book.price, Book.genre).order_by(Book.id)
+    )
+    assert result.all() == [
+        (111, "test_genre"),
+        (222, "bulk_genre"),
+        (333, "test_genre3"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_books(async_session):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await add_books_to_db(async_session)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.request(
+            method="DELETE",
+            url="/admin/books/bulk",
+            json={"ids": [1, 3, 42]},
+            headers=headers,
+        )
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert response_data["message"] == "Successfully deleted books"
+    assert response_data["requested"] == 3
+    assert response_data["deleted"] == 2
+    assert response_data["missing_ids"] == [42]
+
+    result = await async_session.execute(select(Book.id))
+    assert result.scalars().all() == [2]
+
+
+@pytest.mark.asyncio
+async def test_get_sql_stats(async_session):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    fast, slow = RequestStats(), RequestStats()
+    fast.record("SELECT 1", 0.001, 1)
+    for _ in range(3):
+        slow.record("SELECT 2", 0.01, 10)
+    instrumentation.route_stats["GET /fast"] = RouteStats()
+    instrumentation.route_stats["GET /fast"].add(fast, 0)
+    instrumentation.route_stats["GET /slow"] = RouteStats()
+    instrumentation.route_stats["GET /slow"].add(slow, 1)
+    instrumentation.route_stats["GET /slow"].add(fast, 0)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/admin/sql-stats", headers=headers)
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    slow_stats, fast_stats = response.json()
+    assert slow_stats["route"] == "GET /slow"
+    assert slow_stats["requests"] == 2
+    assert slow_stats["statements"] == 4
+    assert slow_stats["avg_statements"] == 2
+    assert slow_stats["max_statements"] == 3
+    assert slow_stats["rows"] == 31
+    assert slow_stats["db_time_ms"] == pytest.approx(31)
+    assert slow_stats["n_plus_one"] == 1
+    assert fast_stats["route"] == "GET /fast"
+
+
+@pytest.mark.asyncio
+async def test_get_slow_queries(async_session):
+    adm = await add_admin_to_db(async_session)
+    test_admin = AdminCreateJWTSchema.model_validate(adm)
+    token = create_admin_access_token(test_admin)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for i in range(3):
+        entry = SlowQuery(f"SELECT {i}", [{"id_1": i}], 0.5, 1, "GET /books/")
+        instrumentation.slow_queries.entries.append(entry)
+    entry.plan = ["SCAN books"]
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get(
+            "/admin/slow-queries", params={"limit": 2}, headers=headers
+        )
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    newest, older = response.json()
+    assert newest["statement"] == "SELECT 2"
+    assert newest["duration_ms"] == 500
+    assert newest["route"] == "GET /books/"
+    assert newest["plan"] == ["SCAN books"]
+    assert older["statement"] == "SELECT 1"
+    assert older["plan"] is None
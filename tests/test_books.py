@@ -1,11 +1,51 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from fnmatch import fnmatch
+
+import msgpack
+import numpy as np
 import pytest
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql
 
+from app.api_v1.books import (
+    counters,
+    fuzzy,
+    leaderboard,
+    raw,
+    recommendations,
+    services,
+    similarity,
+    suggest,
+)
+from app.api_v1.books.crud import book_filter_clauses, increment_book_counter
+from app.core import settings
+from app.database import instrumentation
 from app.main import app
+from app.schemas.admin import AdminCreateJWTSchema
 from app.schemas.book import BookFilterSchema
+from tests.test_models import Book, BookCounterShard, UserActions, user_books_table
+from app.schemas.user import UserCreateJWTSchema
+from app.utils import cache
+from app.utils.cache import cache_bump
+from app.utils.jwt_utils import create_admin_access_token, create_user_access_token
+from app.utils.serialization import (
+    JSON_ENCODING,
+    MSGPACK_ENCODING,
+    negotiate_body_encoding,
+)
 from tests.tools import (
+    add_admin_to_db,
     add_books_to_db,
+    add_buyers_to_db,
+    add_user_to_db,
     book_return_value,
+    buyer_id,
 )
 
 
@@ -59,6 +99,32 @@ async def test_get_all_books_filtered(async_session):
     assert len(response_data) == 2
 
 
+@pytest.mark.asyncio
+async def test_get_all_books_fields(async_session):
+    await add_books_to_db(async_session)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get(
+            "/books/", params={"fields": "title,price", "price_min": 150}
+        )
+        book_response = await ac.get("/books/1", params={"fields": "author"})
+        bad_response = await ac.get("/books/", params={"fields": "title,password"})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    # id отдаётся всегда
+    assert response.json() == [
+        {"id": 2, "title": "test_title2", "price": 150},
+        {"id": 3, "title": "test_title3", "price": 200},
+    ]
+    assert book_response.json() == {"id": 1, "author": "test_author"}
+    assert bad_response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_get_book(async_session):
     await add_books_to_db(async_session)
@@ -73,3 +139,866 @@ async def test_get_book(async_session):
     ), f"Expected 200, got {response.status_code}: {response.json()}"
     response_data = response.json()
     assert response_data == book_return_value
+
+
+@pytest.mark.asyncio
+async def test_get_book_counters(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    for _ in range(20):
+        await increment_book_counter(async_session, 1, "times_bought")
+    await increment_book_counter(async_session, 1, "times_returned")
+    await increment_book_counter(async_session, 2, "times_bought")
+    await async_session.commit()
+
+    shards = await async_session.scalar(
+        select(func.count())
+        .select_from(BookCounterShard)
+        .where(BookCounterShard.book_id == 1)
+    )
+    assert 1 <= shards <= settings.book_counter_shards
+    # строка книги не менялась
+    book = await async_session.scalar(select(Book.times_bought).where(Book.id == 1))
+    assert book == 50
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/1/counters")
+        missing = await ac.get("/books/999/counters")
+    assert response.json() == {"book_id": 1, "times_bought": 70, "times_returned": 6}
+    assert missing.status_code == 404
+
+    # по книге на транзакцию
+    monkeypatch.setattr(counters, "BOOK_COUNTER_FLUSH_BATCH", 1)
+    commits = []
+    commit = async_session.commit
+
+    async def counting_commit():
+        commits.append(1)
+        await commit()
+
+    monkeypatch.setattr(async_session, "commit", counting_commit)
+    assert await counters.flush(async_session) == 2
+    assert len(commits) == 3
+    row = (
+        await async_session.execute(
+            select(Book.times_bought, Book.times_returned).where(Book.id == 1)
+        )
+    ).one()
+    assert tuple(row) == (70, 6)
+    assert not await async_session.scalar(select(func.count()).select_from(BookCounterShard))
+    assert await counters.flush(async_session) == 0
+
+
+def test_raw_filter_sql():
+    assert raw.filter_sql(BookFilterSchema()) == ("", [])
+    filters = BookFilterSchema(genre="50%_off/", year_min=1990, rating_max=4.5)
+    where, args = raw.filter_sql(filters)
+    assert where == (
+        " WHERE genre ILIKE '%' || $1 || '%' ESCAPE '/'"
+        " AND year >= $2 AND rating <= $3"
+    )
+    # те же условия и параметры, что у ORM-пути на asyncpg
+    compiled = (
+        select(Book.id)
+        .where(*book_filter_clauses(filters))
+        .compile(dialect=postgresql.asyncpg.dialect())
+    )
+    assert args == list(compiled.params.values())
+    assert "ILIKE '%' || $1::VARCHAR || '%' ESCAPE '/'" in str(compiled)
+
+
+class FakeDriverConnection:
+    """asyncpg connection stand-in: records calls, answers with canned rows."""
+
+    def __init__(self, rows: list[tuple]):
+        self.rows = rows
+        self.calls = []
+
+    async def fetch(self, statement, *args):
+        self.calls.append((statement, args))
+        return self.rows
+
+    async def fetchrow(self, statement, *args):
+        self.calls.append((statement, args))
+        return self.rows[0] if self.rows else None
+
+
+@pytest.mark.asyncio
+async def test_raw_book_queries(async_session, monkeypatch):
+    connection = FakeDriverConnection([(1, "test_title")])
+
+    async def driver_connection(session):
+        return connection
+
+    monkeypatch.setattr(raw, "driver_connection", driver_connection)
+    assert await raw.fetch_book_row(async_session, 1, ["id", "title"]) == (1, "test_title")
+    filters = BookFilterSchema(author="a_b", price_max=500)
+    assert await raw.fetch_book_rows(async_session, filters, ["id", "title"]) == [
+        (1, "test_title")
+    ]
+    assert await raw.fetch_book_ids(async_session, filters) == [1]
+    where = " WHERE author ILIKE '%' || $1 || '%' ESCAPE '/' AND price <= $2"
+    assert connection.calls == [
+        ("SELECT id, title FROM books WHERE id = $1", (1,)),
+        (f"SELECT id, title FROM books{where}", ("a/_b", 500)),
+        (f"SELECT id FROM books{where}", ("a/_b", 500)),
+    ]
+    with pytest.raises(ValueError):
+        await raw.fetch_book_row(async_session, 1, ["id; DROP TABLE books"])
+
+    # статистика запроса и журнал медленных видят и эти запросы
+    stats = instrumentation.RequestStats()
+    token = instrumentation.request_stats.set(stats)
+    instrumentation.slow_queries.configure(0.000001)
+    try:
+        await raw.fetch_book_ids(async_session, filters)
+        [entry] = instrumentation.slow_queries.entries
+    finally:
+        instrumentation.request_stats.reset(token)
+        instrumentation.slow_queries.configure(0)
+    assert (stats.statements, stats.rows) == (1, 1)
+    assert entry.parameters == [{"$1": "a/_b", "$2": 500}]
+
+    # на asyncpg сервисы идут через raw и отдают строки как есть
+    connection.calls.clear()
+    connection.rows = [(2, "raw_title")]
+    monkeypatch.setattr(services, "uses_asyncpg", lambda session: True)
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        book = await ac.get("/books/2", params={"fields": "title"})
+        books = await ac.get("/books/", params={"fields": "title"})
+    assert book.json() == {"id": 2, "title": "raw_title"}
+    assert books.json() == [{"id": 2, "title": "raw_title"}]
+    assert connection.calls == [
+        ("SELECT id, title FROM books WHERE id = $1", (2,)),
+        ("SELECT id, title FROM books", ()),
+    ]
+    connection.rows = []
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        missing = await ac.get("/books/3")
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_books_batch(async_session):
+    await add_books_to_db(async_session)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/batch", params={"ids": "3,1,42,3"})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert [book["id"] for book in response_data["books"]] == [3, 1]
+    assert response_data["books"][1] == book_return_value
+    assert response_data["missing_ids"] == [42]
+
+
+@pytest.mark.asyncio
+async def test_get_books_msgpack(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=3)
+    msgpack_headers = {"Accept": "application/msgpack"}
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        responses = {}
+        for url, params in [
+            ("/books/", {}),
+            ("/books/", {"fields": "title,price"}),
+            ("/books/batch", {"ids": "3,1,42"}),
+            ("/books/top", {}),
+            ("/books/1", {"fields": "author"}),
+        ]:
+            json_response = await ac.get(url, params=params)
+            msgpack_response = await ac.get(url, params=params, headers=msgpack_headers)
+            responses[url, tuple(params)] = json_response, msgpack_response
+
+    for json_response, msgpack_response in responses.values():
+        assert msgpack_response.status_code == 200
+        assert msgpack_response.headers["content-type"] == "application/msgpack"
+        assert "Accept" in msgpack_response.headers["vary"]
+        # те же схемы, что и в JSON
+        assert msgpack.unpackb(msgpack_response.content) == json_response.json()
+    assert json_response.headers["content-type"] == "application/json"
+
+
+def test_negotiate_body_encoding():
+    assert negotiate_body_encoding("") is JSON_ENCODING
+    assert negotiate_body_encoding("*/*") is JSON_ENCODING
+    assert negotiate_body_encoding("application/msgpack") is MSGPACK_ENCODING
+    assert negotiate_body_encoding("application/x-msgpack, */*") is MSGPACK_ENCODING
+    assert (
+        negotiate_body_encoding("application/json, application/msgpack;q=0.5")
+        is JSON_ENCODING
+    )
+
+
+@pytest.mark.asyncio
+async def test_post_books_batch(async_session):
+    await add_books_to_db(async_session)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.post("/books/batch", json={"ids": [2, 7, 1]})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert [book["id"] for book in response_data["books"]] == [2, 1]
+    assert response_data["missing_ids"] == [7]
+
+
+@pytest.mark.asyncio
+async def test_get_books_batch_cached(async_session):
+    await add_books_to_db(async_session)
+    FastAPICache.init(InMemoryBackend(), prefix="test-cache")
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test",
+        ) as ac:
+            await ac.get("/books/batch", params={"ids": "1"})
+            await async_session.execute(
+                update(Book).where(Book.id.in_([1, 2])).values(price=1)
+            )
+            await async_session.commit()
+            response = await ac.get("/books/batch", params={"ids": "1,2"})
+    finally:
+        await FastAPICache.clear()
+        FastAPICache.reset()
+
+    response_data = response.json()
+    # книга 1 отдана из кэша, книга 2 — из базы
+    assert [book["price"] for book in response_data["books"]] == [100, 1]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def incr(self, key):
+        self.commands.append("INCR")
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+    async def scan_iter(self, match, count):
+        self.commands.append("SCAN")
+        for key in [key for key in self.data if fnmatch(key, match)]:
+            yield key
+
+    async def unlink(self, *keys):
+        self.commands.append("UNLINK")
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_without_keys(monkeypatch):
+    redis = FakeRedis()
+    redis.data = {
+        "test-cache:book_ratings:1": b"1",
+        "test-cache:book_ratings:2": b"2",
+        "test-cache:book_json:1": b"{}",
+    }
+    monkeypatch.setattr(cache, "CACHE_SCAN_COUNT", 1)
+    FastAPICache.init(RedisBackend(redis), prefix="test-cache")
+    try:
+        assert await cache.cache_generation("book_facets") == 0
+        await cache.cache_bump("book_facets")
+        assert await cache.cache_generation("book_facets") == 1
+        await cache.cache_clear("book_ratings")
+    finally:
+        FastAPICache.reset()
+
+    # ни KEYS, ни DEL по шаблону: поколение — INCR, очистка — SCAN частями
+    assert redis.commands == ["INCR", "SCAN", "UNLINK", "UNLINK"]
+    assert set(redis.data) == {"test-cache:book_json:1", "test-cache:book_facets:generation"}
+
+
+@pytest.mark.asyncio
+async def test_get_book_facets(async_session):
+    await add_books_to_db(async_session)
+    adm = await add_admin_to_db(async_session)
+    headers = {
+        "Authorization": f"Bearer {create_admin_access_token(AdminCreateJWTSchema.model_validate(adm))}"
+    }
+    FastAPICache.init(InMemoryBackend(), prefix="test-cache")
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://test",
+        ) as ac:
+            response = await ac.get("/books/facets")
+            filtered_response = await ac.get("/books/facets", params={"price_min": 150})
+            # без админской записи счётчики отдаются из кэша
+            await async_session.execute(update(Book).where(Book.id == 1).values(year=1990))
+            await async_session.commit()
+            cached_response = await ac.get("/books/facets", params={"price_min": 150})
+            await ac.post(
+                "/admin/books",
+                json={
+                    "title": "test_title4",
+                    "author": "test_author",
+                    "genre": "test_genre",
+                    "year": 2031,
+                    "price": 300,
+                },
+                headers=headers,
+            )
+            updated_response = await ac.get("/books/facets", params={"price_min": 150})
+    finally:
+        await FastAPICache.clear()
+        FastAPICache.reset()
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert response_data["total"] == 3
+    assert [item["value"] for item in response_data["genre"]] == [
+        "test_genre",
+        "test_genre2",
+        "test_genre3",
+    ]
+    assert response_data["year"] == [
+        {"min": 2020, "max": 2029, "count": 1},
+        {"min": 2030, "max": 2039, "count": 2},
+    ]
+    assert response_data["price"] == [{"min": 0, "max": 249, "count": 3}]
+
+    assert filtered_response.json()["total"] == 2
+    assert cached_response.json() == filtered_response.json()
+    updated_data = updated_response.json()
+    assert updated_data["total"] == 3
+    assert updated_data["author"][0] == {"value": "test_author", "count": 1}
+    assert updated_data["price"] == [
+        {"min": 0, "max": 249, "count": 2},
+        {"min": 250, "max": 499, "count": 1},
+    ]
+
+@pytest.mark.asyncio
+async def test_get_top_and_trending_books(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=3)
+    usr = await add_user_to_db(async_session)
+    token = create_user_access_token(UserCreateJWTSchema.model_validate(usr))
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        await ac.post(
+            "/user/me/purchase-book/2", headers={"Authorization": f"Bearer {token}"}
+        )
+        top_response = await ac.get("/books/top", params={"k": 5})
+        trending_response = await ac.get("/books/trending")
+
+    assert (
+        top_response.status_code == 200
+    ), f"Expected 200, got {top_response.status_code}: {top_response.json()}"
+    top = top_response.json()
+    assert [(item["book"]["id"], item["score"]) for item in top] == [(1, 3), (2, 1)]
+
+    trending = trending_response.json()
+    assert [item["book"]["id"] for item in trending] == [2]
+    assert 0.99 < trending[0]["score"] <= 1
+
+    # после рестарта оба рейтинга пересобираются из базы: тренды — по действиям
+    # за окно, покупка старше окна не учитывается, купленная и возвращённая книга
+    # выпадает
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async_session.add_all(
+        [
+            UserActions(
+                user_id=buyer_id(0),
+                action_type="buy_book",
+                details="",
+                book_id=book_id,
+                timestamp=now - age,
+            )
+            for book_id, age in [(1, timedelta(days=30)), (3, timedelta(hours=1))]
+        ]
+        + [
+            UserActions(
+                user_id=buyer_id(0),
+                action_type="return_book",
+                details="",
+                book_id=3,
+                timestamp=now - timedelta(minutes=30),
+            )
+        ]
+    )
+    await async_session.commit()
+    leaderboard.reset()
+    await leaderboard.rebuild(async_session)
+    assert leaderboard.bestsellers.top(5) == [(1, 3), (2, 1)]
+    [(book_id, score)] = leaderboard.trending.top(5)
+    assert book_id == 2 and 0.99 < score <= 1
+
+
+@pytest.mark.asyncio
+async def test_get_also_bought_books(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=3)
+    await async_session.execute(
+        insert(user_books_table),
+        [
+            {"user_id": buyer_id(0), "book_id": 2},
+            {"user_id": buyer_id(1), "book_id": 2},
+            {"user_id": buyer_id(0), "book_id": 3},
+        ],
+    )
+    await async_session.commit()
+    usr = await add_user_to_db(async_session)
+    headers = {
+        "Authorization": f"Bearer {create_user_access_token(UserCreateJWTSchema.model_validate(usr))}"
+    }
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/1/also-bought")
+        await ac.post("/user/me/purchase-book/1", headers=headers)
+        await ac.post("/user/me/purchase-book/3", headers=headers)
+        updated_response = await ac.get("/books/1/also-bought")
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert [(item["book"]["id"], item["score"]) for item in response_data] == [
+        (2, 2),
+        (3, 1),
+    ]
+    # покупка после сборки матрицы учтена инкрементально
+    updated_data = updated_response.json()
+    assert [(item["book"]["id"], item["score"]) for item in updated_data] == [
+        (2, 2),
+        (3, 2),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_co_purchase_changes_during_rebuild_are_kept(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=2)
+    await async_session.execute(
+        insert(user_books_table), [{"user_id": buyer_id(0), "book_id": 2}]
+    )
+    await async_session.commit()
+    await recommendations.rebuild(async_session)
+    index = recommendations.co_purchases
+    to_thread = asyncio.to_thread
+
+    async def build_then_buy(func, *args):
+        await to_thread(func, *args)
+        # покупка, записанная после чтения user_books, но до подмены индекса
+        await recommendations.record_purchase(async_session, buyer_id(1), 3)
+
+    monkeypatch.setattr(asyncio, "to_thread", build_then_buy)
+    await recommendations.rebuild(async_session)
+    assert recommendations.co_purchases is not index
+    assert recommendations.co_purchases.also_bought(1, 5) == [(2, 1), (3, 1)]
+
+
+@pytest.mark.asyncio
+async def test_get_similar_books(async_session):
+    async_session.add_all(
+        [
+            Book(
+                id=1,
+                title="Ёжик в тумане",
+                author="Сергей Козлов",
+                genre="Сказка",
+                description="Ёжик идёт в гости к медвежонку считать звёзды.",
+                year=1975,
+                price=300,
+            ),
+            Book(
+                id=2,
+                title="Война и мир",
+                author="Лев Толстой",
+                genre="Роман",
+                description="Эпопея о войне 1812 года и судьбах дворянских семей.",
+                year=1869,
+                price=900,
+            ),
+            Book(
+                id=3,
+                title="Трое из Простоквашино",
+                author="Эдуард Успенский",
+                genre="Сказка",
+                description="Мальчик, кот и пёс живут в деревне.",
+                year=1974,
+                price=350,
+            ),
+        ]
+    )
+    await async_session.commit()
+    adm = await add_admin_to_db(async_session)
+    headers = {
+        "Authorization": f"Bearer {create_admin_access_token(AdminCreateJWTSchema.model_validate(adm))}"
+    }
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/1/similar")
+        # ё и е в разных формах слова должны совпадать
+        await ac.post(
+            "/admin/books",
+            json={
+                "title": "Ежик и медвежонок",
+                "author": "Сергей Козлов",
+                "genre": "Сказка",
+                "description": "Ежик и медвежонок встречают весну.",
+                "year": 1969,
+                "price": 250,
+            },
+            headers=headers,
+        )
+        updated_response = await ac.get("/books/1/similar", params={"k": 1})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert response_data[0]["book"]["id"] == 3
+    assert all(item["score"] > 0 for item in response_data)
+    # добавленная админом книга сразу попадает в индекс, без полной сборки
+    updated_data = updated_response.json()
+    assert [item["book"]["title"] for item in updated_data] == ["Ежик и медвежонок"]
+
+
+def test_similarity_index_incremental_updates():
+    rng = random.Random(7)
+    vocabulary = ["лес", "море", "война", "сказка", "кот", "звезда", "город", "зима"]
+
+    def make_book(book_id):
+        return (
+            book_id,
+            " ".join(rng.sample(vocabulary, 2)),
+            rng.choice(["Козлов", "Толстой", "Успенский"]),
+            rng.choice(["Сказка", "Роман"]),
+            " ".join(rng.choices(vocabulary, k=6)),
+        )
+
+    books = {book_id: make_book(book_id) for book_id in range(1, 31)}
+    index = similarity.SimilarityIndex(top_k=3)
+    index.build(list(books.values()))
+
+    def assert_matches_full_recompute():
+        # пересчёт всех строк с тем же idf, что у точечных обновлений
+        rows = [books[book_id] for book_id in index.book_ids.tolist()]
+        vectors = index.weigh(index.term_frequencies(rows), index.idf)
+        expected = index.neighbor_rows(vectors, index.book_ids, np.arange(len(rows)))
+        assert index.neighbors.keys() == books.keys()
+        for book_id, neighbors in expected:
+            actual = index.neighbors[book_id]
+            assert [n for n, _ in actual] == [n for n, _ in neighbors], book_id
+            assert [s for _, s in actual] == pytest.approx([s for _, s in neighbors])
+
+    books[31] = make_book(31)
+    index.update(books[31])
+    assert_matches_full_recompute()
+    for book_id in (5, 12):
+        books[book_id] = make_book(book_id)
+        index.update(books[book_id])
+        assert_matches_full_recompute()
+    for book_id in (31, 1):
+        del books[book_id]
+        index.remove(book_id)
+        assert_matches_full_recompute()
+
+
+@pytest.mark.parametrize("module", [similarity])
+@pytest.mark.asyncio
+async def test_invalidate_during_rebuild_keeps_index_stale(async_session, monkeypatch, module):
+    await add_books_to_db(async_session)
+    to_thread = asyncio.to_thread
+
+    async def build_then_invalidate(func, *args):
+        await to_thread(func, *args)
+        # админ изменил книгу, пока шла сборка по уже прочитанным строкам
+        module.invalidate()
+
+    monkeypatch.setattr(asyncio, "to_thread", build_then_invalidate)
+    await module.rebuild(async_session)
+    assert module._built_at is None
+    monkeypatch.setattr(asyncio, "to_thread", to_thread)
+    await module.rebuild(async_session)
+    assert module._built_at is not None
+
+
+@pytest.mark.asyncio
+async def test_fuzzy_index_state(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    state = fuzzy.state
+    FastAPICache.init(InMemoryBackend(), prefix="test-cache")
+    try:
+        to_thread = asyncio.to_thread
+
+        async def build_then_invalidate(func, *args):
+            await to_thread(func, *args)
+            # админ изменил книгу, пока шла сборка по уже прочитанным строкам
+            await fuzzy.invalidate()
+
+        monkeypatch.setattr(asyncio, "to_thread", build_then_invalidate)
+        await fuzzy.rebuild(async_session)
+        monkeypatch.setattr(asyncio, "to_thread", to_thread)
+        assert state.built_at is None
+
+        await fuzzy.rebuild(async_session)
+        assert not await state.is_stale()
+        # сброс в другом воркере виден через общее поколение
+        await cache_bump(fuzzy.BOOK_FUZZY_CACHE_NAMESPACE)
+        state.checked_at = 0
+        assert await state.is_stale()
+
+        # запрос отдаёт прежний индекс, новый собирается в фоне
+        index = fuzzy.trigrams
+        await fuzzy.ensure_built(async_session)
+        assert fuzzy.trigrams is index
+        await state.task
+        assert fuzzy.trigrams is not index
+        assert not await state.is_stale()
+    finally:
+        await FastAPICache.clear()
+        FastAPICache.reset()
+
+
+def test_suggest_index_incremental_updates():
+    rng = random.Random(11)
+    vocabulary = ["ёжик", "ежевика", "лес", "лето", "кот", "котёл", "зима", "зимовье"]
+
+    def make_book(book_id):
+        return (
+            book_id,
+            " ".join(rng.sample(vocabulary, 2)),
+            rng.choice(["Козлов", "Коваль", "Зощенко"]),
+            rng.randrange(100),
+        )
+
+    books = {book_id: make_book(book_id) for book_id in range(1, 41)}
+    index = suggest.SuggestIndex(top_k=3)
+    index.build(list(books.values()))
+
+    def assert_matches_full_build():
+        expected = suggest.SuggestIndex(top_k=3)
+        expected.build(list(books.values()))
+        assert sorted(zip(index.keys, index.key_book_ids)) == list(
+            zip(expected.keys, expected.key_book_ids)
+        )
+        assert index.keys == expected.keys
+        assert index.books == expected.books
+        assert index.short == expected.short
+
+    books[41] = (41, "Ёжик зимой", "Козлов", 1_000)
+    index.update(books[41])
+    assert_matches_full_build()
+    for book_id in (3, 17):
+        books[book_id] = make_book(book_id)
+        index.update(books[book_id])
+        assert_matches_full_build()
+    for book_id in (41, 5):
+        del books[book_id]
+        index.remove(book_id)
+        assert_matches_full_build()
+
+
+@pytest.mark.asyncio
+async def test_suggest_index_state(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    state = suggest.state
+    FastAPICache.init(InMemoryBackend(), prefix="test-cache")
+    try:
+        await suggest.ensure_built(async_session)
+        assert sorted(suggest.suggestions.books) == [1, 2, 3]
+
+        # изменение посреди сборки: индекс отдаётся, но свежим не считается
+        to_thread = asyncio.to_thread
+
+        async def build_then_change(func, *args):
+            await to_thread(func, *args)
+            await suggest.remove_book(1)
+
+        monkeypatch.setattr(asyncio, "to_thread", build_then_change)
+        await suggest.rebuild(async_session)
+        monkeypatch.setattr(asyncio, "to_thread", to_thread)
+        assert state.built_at is None
+
+        await suggest.rebuild(async_session)
+        assert state.built_at is not None
+        shared = state.shared
+        # своё изменение не требует пересборки, чужое (общее поколение) — требует
+        await suggest.remove_book(2)
+        assert state.shared == shared + 1
+        assert not await state.is_stale()
+        await cache_bump(suggest.BOOK_SUGGEST_CACHE_NAMESPACE)
+        state.checked_at = 0
+        assert await state.is_stale()
+
+        # устаревший индекс пересобирается в фоне, запрос его не ждёт
+        await suggest.ensure_built(async_session)
+        assert 2 not in suggest.suggestions.books
+        await state.task
+        assert sorted(suggest.suggestions.books) == [1, 2, 3]
+        assert not await state.is_stale()
+    finally:
+        await FastAPICache.clear()
+        FastAPICache.reset()
+
+
+@pytest.mark.asyncio
+async def test_get_book_suggestions(async_session):
+    async_session.add_all(
+        [
+            Book(
+                id=1,
+                title="Ёжик в тумане",
+                author="Сергей Козлов",
+                genre="Сказка",
+                description="",
+                year=1975,
+                price=300,
+                times_bought=5,
+            ),
+            Book(
+                id=2,
+                title="Снеговик",
+                author="Ю Несбё",
+                genre="Детектив",
+                description="",
+                year=2007,
+                price=500,
+                times_bought=9,
+            ),
+            Book(
+                id=3,
+                title="Ежевичная зима",
+                author="Сара Джио",
+                genre="Роман",
+                description="",
+                year=2012,
+                price=400,
+                times_bought=7,
+            ),
+        ]
+    )
+    await async_session.commit()
+    adm = await add_admin_to_db(async_session)
+    headers = {
+        "Authorization": f"Bearer {create_admin_access_token(AdminCreateJWTSchema.model_validate(adm))}"
+    }
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/suggest", params={"q": "ЕЖ"})
+        author_response = await ac.get("/books/suggest", params={"q": "несбе"})
+        word_response = await ac.get("/books/suggest", params={"q": "в тум"})
+        await ac.post(
+            "/admin/books",
+            json={
+                "title": "Ёж и медвежонок",
+                "author": "Сергей Козлов",
+                "genre": "Сказка",
+                "year": 1969,
+                "price": 250,
+                "times_bought": 100,
+            },
+            headers=headers,
+        )
+        updated_response = await ac.get("/books/suggest", params={"q": "ёж", "k": 2})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    # ё и е совпадают, порядок — по times_bought
+    assert [item["id"] for item in response.json()] == [3, 1]
+    assert [item["id"] for item in author_response.json()] == [2]
+    assert [item["title"] for item in word_response.json()] == ["Ёжик в тумане"]
+    assert [item["title"] for item in updated_response.json()] == [
+        "Ёж и медвежонок",
+        "Ежевичная зима",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_search_books(async_session):
+    async_session.add_all(
+        [
+            Book(
+                id=1,
+                title="Норвежский лес",
+                author="Харуки Мураками",
+                genre="Роман",
+                description="",
+                year=1987,
+                price=730,
+            ),
+            Book(
+                id=2,
+                title="Глаза дракона",
+                author="Стивен Кинг",
+                genre="Фэнтези",
+                description="",
+                year=1987,
+                price=690,
+            ),
+            Book(
+                id=3,
+                title="Снеговик",
+                author="Ю Несбё",
+                genre="Детектив",
+                description="",
+                year=2007,
+                price=500,
+            ),
+        ]
+    )
+    await async_session.commit()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/search", params={"q": "Мурками"})
+        title_response = await ac.get("/books/search", params={"q": "норвеский лес"})
+        yo_response = await ac.get("/books/search", params={"q": "несбе"})
+        miss_response = await ac.get("/books/search", params={"q": "Толстой"})
+
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    response_data = response.json()
+    assert [item["book"]["id"] for item in response_data] == [1]
+    assert 0.5 <= response_data[0]["score"] < 1
+    assert [item["book"]["id"] for item in title_response.json()] == [1]
+    assert [item["book"]["id"] for item in yo_response.json()] == [3]
+    assert yo_response.json()[0]["score"] == 1
+    assert miss_response.json() == []
@@ -0,0 +1,84 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import update
+
+from app.main import app
+from app.utils.compression import (
+    COMPRESSION_CACHE_MIN_SIZE,
+    CompressionMiddleware,
+    negotiate,
+)
+from tests.test_models import Book
+from tests.tools import add_books_to_db
+
+
+def test_negotiate():
+    codings = ["zstd", "br", "gzip"]
+    assert negotiate("gzip, deflate, br, zstd", codings) == "zstd"
+    assert negotiate("gzip;q=1.0, br;q=0.5", codings) == "gzip"
+    assert negotiate("br;q=0, *", codings) == "zstd"
+    assert negotiate("*;q=0.1, gzip", codings) == "gzip"
+    assert negotiate("identity", codings) is None
+    assert negotiate("", codings) is None
+
+
+@pytest.mark.asyncio
+async def test_compress_books_list(async_session):
+    await add_books_to_db(async_session)
+    await async_session.execute(
+        update(Book).values(description="Лирическая история любви и потерь. " * 20)
+    )
+    await async_session.commit()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        plain = await ac.get("/books/", headers={"Accept-Encoding": "identity"})
+        compressed = await ac.get("/books/", headers={"Accept-Encoding": "gzip"})
+        small = await ac.get(
+            "/books/", params={"fields": "id"}, headers={"Accept-Encoding": "gzip"}
+        )
+
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    # httpx распаковывает тело сам
+    assert compressed.json() == plain.json()
+    # меньше порога — отдаётся как есть
+    assert "content-encoding" not in small.headers
+
+
+@pytest.mark.asyncio
+async def test_compressed_body_cache():
+    body = "книга " * COMPRESSION_CACHE_MIN_SIZE
+    test_app = FastAPI()
+
+    @test_app.get("/text")
+    async def text():
+        return PlainTextResponse(body)
+
+    middleware = CompressionMiddleware(test_app)
+    calls = []
+    encoder = middleware.encoders["gzip"]
+    middleware.encoders["gzip"] = lambda data, level: calls.append(level) or encoder(
+        data, level
+    )
+
+    async with AsyncClient(
+        transport=ASGITransport(app=middleware),
+        base_url="http://test",
+    ) as ac:
+        responses = [
+            await ac.get("/text", headers={"Accept-Encoding": "gzip"}) for _ in range(3)
+        ]
+
+    # одинаковое тело сжимается один раз, дальше берётся из кэша
+    assert calls == [6]
+    assert all(response.text == body for response in responses)
+    assert len(middleware.cache.items) == 1
+    assert gzip.decompress(next(iter(middleware.cache.items.values()))) == body.encode()
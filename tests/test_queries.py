@@ -0,0 +1,203 @@
+import pytest
+from sqlalchemy import insert
+from httpx import AsyncClient, ASGITransport
+
+from app.api_v1.books import counters, fragments
+from app.main import app
+from app.schemas.admin import AdminCreateJWTSchema
+from app.schemas.book import BOOK_FIELDS
+from app.schemas.user import UserCreateJWTSchema
+from app.utils.jwt_utils import create_admin_access_token, create_user_access_token
+from tests.test_models import Book, user_books_table
+from tests.tools import (
+    QueryCounter,
+    add_admin_to_db,
+    add_books_to_db,
+    add_buyers_to_db,
+    add_user_to_db,
+    TEST_USER_ID,
+)
+
+BUYERS = 25
+
+
+async def admin_headers(async_session):
+    adm = await add_admin_to_db(async_session)
+    token = create_admin_access_token(AdminCreateJWTSchema.model_validate(adm))
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def user_headers(async_session):
+    usr = await add_user_to_db(async_session)
+    token = create_user_access_token(UserCreateJWTSchema.model_validate(usr))
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def request(async_session, method, url, **kwargs):
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        with QueryCounter(async_session) as counter:
+            response = await ac.request(method, url, **kwargs)
+    assert (
+        response.status_code == 200
+    ), f"Expected 200, got {response.status_code}: {response.json()}"
+    return counter
+
+
+@pytest.mark.asyncio
+async def test_get_book_does_not_load_buyers(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=BUYERS)
+
+    counter = await request(async_session, "GET", "/books/1")
+    assert len(counter.statements) == 1
+    assert counter.loaded == {"Book": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_books_fields_select_only_requested_columns(async_session):
+    await add_books_to_db(async_session)
+
+    counter = await request(async_session, "GET", "/books/", params={"fields": "title"})
+    assert len(counter.statements) == 1
+    assert "books.title" in counter.statements[0]
+    assert "books.description" not in counter.statements[0]
+
+    counter = await request(async_session, "GET", "/books/1", params={"fields": "price"})
+    assert len(counter.statements) == 1
+    assert "books.description" not in counter.statements[0]
+
+
+@pytest.mark.asyncio
+async def test_edit_and_delete_book_do_not_load_buyers(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=BUYERS)
+    headers = await admin_headers(async_session)
+
+    counter = await request(
+        async_session, "PUT", "/admin/books/1", json={"price": 1}, headers=headers
+    )
+    assert len(counter.statements) == 3
+    assert counter.loaded == {"Admin": 1, "Book": 1}
+
+    counter = await request(async_session, "DELETE", "/admin/books/1", headers=headers)
+    assert len(counter.statements) == 6
+    assert "User" not in counter.loaded
+
+
+@pytest.mark.asyncio
+async def test_buy_and_return_book_do_not_load_buyers(async_session):
+    await add_books_to_db(async_session)
+    await add_buyers_to_db(async_session, book_id=1, count=BUYERS)
+    headers = await user_headers(async_session)
+
+    counter = await request(
+        async_session, "POST", "/user/me/purchase-book/1", headers=headers
+    )
+    assert len(counter.statements) == 8
+    # только сам покупатель, без остальных владельцев книги
+    assert counter.loaded["User"] == 1
+    assert counter.loaded["Book"] == 1
+
+    counter = await request(
+        async_session, "POST", "/user/me/return-book/1", headers=headers
+    )
+    assert len(counter.statements) == 8
+    assert counter.loaded["User"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_books_served_from_fragments(async_session):
+    await add_books_to_db(async_session)
+    headers = await user_headers(async_session)
+    times_bought = (await async_session.get(Book, 1)).times_bought
+
+    # первый запрос собирает фрагменты, дальше из базы читаются только id
+    counter = await request(async_session, "GET", "/books/")
+    assert len(counter.statements) == 2
+    counter = await request(async_session, "GET", "/books/")
+    assert len(counter.statements) == 1
+    assert "books.title" not in counter.statements[0]
+
+    await request(async_session, "POST", "/user/me/purchase-book/1", headers=headers)
+    await counters.flush(async_session)
+    # перенос удалил фрагмент книги: он пересобирается одним запросом, дальше из кэша
+    counter = await request(async_session, "GET", "/books/batch", params={"ids": "1"})
+    assert len(counter.statements) == 1
+    counter = await request(async_session, "GET", "/books/batch", params={"ids": "1"})
+    assert len(counter.statements) == 0
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.get("/books/")
+        full_response = await ac.get("/books/", params={"fields": ",".join(BOOK_FIELDS)})
+    # пересобранный фрагмент совпадает с ответом без кэша
+    assert response.json()[0]["times_bought"] == times_bought + 1
+    assert response.json() == full_response.json()
+
+
+@pytest.mark.asyncio
+async def test_local_fragments_are_bounded(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    monkeypatch.setattr(fragments, "BOOK_FRAGMENTS_LOCAL_SIZE", 2)
+    await fragments.get_many(async_session, [1, 2])
+    await fragments.get_many(async_session, [1])
+    await fragments.get_many(async_session, [3])
+    # вытесняется давно не читанная книга 2
+    assert list(fragments._local["json"]) == [1, 3]
+
+
+WRITE_ENDPOINTS = [
+    # (метод, url, тело, авторизация, число запросов к базе)
+    ("POST", "/user/sign-up", {"username": "new_user", "password": "pw"}, None, 2),
+    ("POST", "/user/me/add-funds", {"amount": 100}, "user", 3),
+    ("POST", "/user/me/purchase-book/2", None, "user", 8),
+    ("POST", "/user/me/return-book/1", None, "user", 8),
+    ("PUT", "/user/me/rate-book/1", {"score": 4}, "user", 6),
+    ("POST", "/admin/sign-up", {"username": "new_admin", "password": "pw"}, None, 1),
+    (
+        "POST",
+        "/admin/books",
+        {
+            "title": "t",
+            "author": "a",
+            "genre": "g",
+            "year": 2000,
+            "description": "d",
+            "price": 10,
+        },
+        "admin",
+        2,
+    ),
+    ("PUT", "/admin/books/1", {"price": 1}, "admin", 3),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method,url,body,auth,expected", WRITE_ENDPOINTS)
+async def test_write_endpoints_statement_count(
+    async_session, method, url, body, auth, expected
+):
+    await add_books_to_db(async_session)
+    headers = {}
+    if auth == "user":
+        headers = await user_headers(async_session)
+        await async_session.execute(
+            insert(user_books_table).values(user_id=TEST_USER_ID, book_id=1)
+        )
+        await async_session.commit()
+    elif auth == "admin":
+        headers = await admin_headers(async_session)
+
+    counter = await request(async_session, method, url, json=body, headers=headers)
+    assert len(counter.statements) == expected
+    # значения, сгенерированные базой, приходят через RETURNING:
+    # после первой записи SELECT больше не выполняется
+    first_write = next(
+        i for i, sql in enumerate(counter.statements) if not sql.startswith("SELECT")
+    )
+    assert not any(sql.startswith("SELECT") for sql in counter.statements[first_write:])
@@ -1,17 +1,21 @@
 import bcrypt
 import pytest
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy import select
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import selectinload
 
+from app.api_v1.users import services
+from app.api_v1.users.crud import change_user_money
 from app.main import app
 from app.schemas.user import UserCreateJWTSchema, UserAddFundsSchema, UserDeleteSchema
 from app.utils.jwt_utils import create_user_access_token
 from tests.tools import (
     add_books_to_db,
+    add_buyers_to_db,
     add_user_to_db,
+    TEST_USER_ID,
 )
-from tests.test_models import User, Book
+from tests.test_models import User, Book, BookCounterShard, user_books_table
 
 
 # tool
@@ -102,7 +106,7 @@ async def test_get_my_data(async_session):
     ), f"Expected 200, got {response.status_code}: {response.json()}"
     response_data = response.json()
 
-    assert response_data["user_id"] == "test_uid"
+    assert response_data["user_id"] == TEST_USER_ID
     assert response_data["username"] == "test_user1"
     assert response_data["money"] == 777
     assert response_data["bought_books"] == []
@@ -165,6 +169,8 @@ async def test_buy_book(async_session):
     assert response_data["book"]["title"] == title
     assert response_data["book"]["author"] == author
     assert response_data["book"]["year"] == year
+    # покупка ещё в шарде счётчика, но в ответе уже учтена
+    assert response_data["book"]["times_bought"] == 51
 
     result = await async_session.execute(select(Book).where(Book.id == book_id))
     saved_book = result.scalar_one_or_none()
@@ -174,13 +180,79 @@ async def test_buy_book(async_session):
 
     result = await async_session.execute(
         select(User)
-        .where(User.user_id == "test_uid")
+        .where(User.user_id == TEST_USER_ID)
         .options(selectinload(User.bought_books))
     )
     saved_user = result.scalar_one_or_none()
     assert len(saved_user.bought_books) == 1
 
 
+@pytest.mark.asyncio
+async def test_buy_book_concurrent_duplicate(async_session, monkeypatch):
+    await add_books_to_db(async_session)
+    headers = await user_auth(async_session)
+    await async_session.execute(
+        insert(user_books_table).values(user_id=TEST_USER_ID, book_id=1)
+    )
+    await async_session.commit()
+
+    async def not_owned_yet(session, user_id, book_id):
+        # параллельная покупка закоммитилась уже после этой проверки
+        return False
+
+    monkeypatch.setattr(services, "user_owns_book", not_owned_yet)
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.post(url="/user/me/purchase-book/1", headers=headers)
+
+    assert response.status_code == 403
+    assert response.json()["detail"] == "You already have this book bought"
+    async_session.expunge_all()
+    money = await async_session.scalar(
+        select(User.money).where(User.user_id == TEST_USER_ID)
+    )
+    assert money == 777
+
+
+@pytest.mark.asyncio
+async def test_buy_book_not_enough_money(async_session):
+    await add_books_to_db(async_session)
+    headers = await user_auth(async_session)
+    await async_session.execute(update(Book).where(Book.id == 1).values(price=1000))
+    await async_session.commit()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        response = await ac.post(url="/user/me/purchase-book/1", headers=headers)
+
+    assert response.status_code == 403
+    assert response.json()["detail"] == "You don't have enough money"
+    # из базы, а не из объектов в памяти сессии
+    async_session.expunge_all()
+    times_bought = await async_session.scalar(
+        select(Book.times_bought).where(Book.id == 1)
+    )
+    money = await async_session.scalar(
+        select(User.money).where(User.user_id == TEST_USER_ID)
+    )
+    assert (times_bought, money) == (50, 777)
+    # покупка откатилась целиком: ни строки владения, ни шарда счётчика
+    assert not await async_session.scalar(
+        select(func.count()).select_from(user_books_table)
+    )
+    assert not await async_session.scalar(
+        select(func.count()).select_from(BookCounterShard)
+    )
+
+    # UPDATE сам не даёт уйти в минус, даже если проверка выше прошла
+    assert await change_user_money(async_session, TEST_USER_ID, -1000) is None
+    assert await change_user_money(async_session, TEST_USER_ID, -777) == 0
+
+
 @pytest.mark.asyncio
 async def test_return_book(async_session):
     await add_books_to_db(async_session)
@@ -221,12 +293,63 @@ async def test_return_book(async_session):
     assert saved_book.year == 2025
 
 
+@pytest.mark.asyncio
+async def test_rate_book(async_session):
+    await add_books_to_db(async_session)
+    headers = await user_auth(async_session)
+    [buyer] = await add_buyers_to_db(async_session, book_id=1, count=1)
+    buyer_headers = {
+        "Authorization": f"Bearer {create_user_access_token(UserCreateJWTSchema.model_validate(buyer))}"
+    }
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as ac:
+        not_owned = await ac.put(
+            "/user/me/rate-book/1", json={"score": 5}, headers=headers
+        )
+        await ac.post("/user/me/purchase-book/1", headers=headers)
+        first = await ac.put("/user/me/rate-book/1", json={"score": 5}, headers=headers)
+        second = await ac.put(
+            "/user/me/rate-book/1", json={"score": 2}, headers=buyer_headers
+        )
+        changed = await ac.put(
+            "/user/me/rate-book/1", json={"score": 3}, headers=headers
+        )
+        invalid = await ac.put(
+            "/user/me/rate-book/1", json={"score": 6}, headers=headers
+        )
+        ratings = await ac.get("/books/1/ratings")
+
+    assert not_owned.status_code == 403
+    assert invalid.status_code == 422
+    assert (
+        first.status_code == 200
+    ), f"Expected 200, got {first.status_code}: {first.json()}"
+    assert first.json()["book"]["rating"] == 5
+    assert first.json()["book"]["ratings_count"] == 1
+    assert second.json()["book"]["rating"] == 3.5
+    assert second.json()["book"]["ratings_count"] == 2
+    # переоценка меняет среднее, но не число оценок
+    assert changed.json()["book"]["rating"] == 2.5
+    assert changed.json()["book"]["ratings_count"] == 2
+
+    assert ratings.status_code == 200
+    assert ratings.json() == {
+        "book_id": 1,
+        "rating": 2.5,
+        "ratings_count": 2,
+        "distribution": {"1": 0, "2": 1, "3": 1, "4": 0, "5": 0},
+    }
+
+
 @pytest.mark.asyncio
 async def test_delete_account(async_session):
     headers = await user_auth(async_session)
     pswd = UserDeleteSchema(password="test_password")
 
-    result = await async_session.execute(select(User).where(User.user_id == "test_uid"))
+    result = await async_session.execute(select(User).where(User.user_id == TEST_USER_ID))
     saved_user = result.scalar_one_or_none()
     assert saved_user is not None
 
@@ -252,6 +375,6 @@ async def test_delete_account(async_session):
     assert response_data["success"] == True
     assert response_data["message"] == "account deleted!"
 
-    result = await async_session.execute(select(User).where(User.user_id == "test_uid"))
+    result = await async_session.execute(select(User).where(User.user_id == TEST_USER_ID))
     saved_user = result.scalar_one_or_none()
     assert saved_user is None
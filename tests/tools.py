@@ -1,5 +1,16 @@
 import uuid
-from tests.test_models import Admin, User, Book
+from collections import Counter
+
+from sqlalchemy import event, insert
+
+from tests.test_models import Admin, User, Book, user_books_table
+
+TEST_USER_ID = "3f2c9a4e-8b1d-4c6e-9f0a-2d7b5e1c8a94"
+TEST_ADMIN_ID = "a7e1d5c2-4f3b-4e8a-b6d9-0c2f1e7a5b38"
+
+
+def buyer_id(i: int) -> str:
+    return str(uuid.UUID(int=i + 1))
 
 
 book_return_value = {
@@ -13,6 +24,7 @@ book_return_value = {
     "times_bought": 50,
     "times_returned": 5,
     "rating": 0.0,
+    "ratings_count": 0,
 }
 
 
@@ -61,7 +73,7 @@ async def add_books_to_db(async_session):
 
 async def add_admin_to_db(async_session):
     adm = Admin(
-        admin_id="test_aid",
+        admin_id=TEST_ADMIN_ID,
         username="test_username",
         password="test_password",
         role="admin",
@@ -74,7 +86,7 @@ async def add_admin_to_db(async_session):
 
 async def add_user_to_db(async_session):
     user = User(
-        user_id="test_uid",
+        user_id=TEST_USER_ID,
         username="test_user1",
         password="test_password",
         role="user",
@@ -90,7 +102,7 @@ async def add_user_to_db(async_session):
 async def add_users_to_db(async_session):
     users = [
         User(
-            user_id="test_uid",
+            user_id=TEST_USER_ID,
             username="test_user1",
             password="test_password",
             role="user",
@@ -115,3 +127,48 @@ async def add_users_to_db(async_session):
     for user in users:
         await async_session.refresh(user)
     return users
+
+
+async def add_buyers_to_db(async_session, book_id, count):
+    users = [
+        User(
+            user_id=buyer_id(i),
+            username=f"buyer_{i}",
+            password="test_password",
+            role="user",
+        )
+        for i in range(count)
+    ]
+    async_session.add_all(users)
+    await async_session.flush()
+    await async_session.execute(
+        insert(user_books_table),
+        [{"user_id": user.user_id, "book_id": book_id} for user in users],
+    )
+    await async_session.commit()
+    return users
+
+
+class QueryCounter:
+    """Counts SQL statements and ORM rows loaded while the block runs."""
+
+    def __init__(self, async_session):
+        self.engine = async_session.bind.sync_engine
+        self.session = async_session.sync_session
+        self.statements = []
+        self.loaded = Counter()
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _on_load(self, session, instance):
+        self.loaded[type(instance).__name__] += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.session, "loaded_as_persistent", self._on_load)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.session, "loaded_as_persistent", self._on_load)